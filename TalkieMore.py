@@ -1,8 +1,11 @@
 import sounddevice as sd
 import numpy as np
 import time
-import requests
-from funasr import AutoModel
+
+import audio_capture
+import llm_policy
+import talkie_render
+import talkie_daemon
 
 # =========================
 # 基本配置
@@ -14,13 +17,16 @@ DECODER_LOOK_BACK = 1
 CHUNK_STRIDE = CHUNK_SIZE[1] * 960  # 600ms
 SILENCE_TIMEOUT = 0.5             # 句子结束阈值（秒）
 
-OLLAMA_MODEL = "qwen2.5:1.5b"
+# 模型分级（便宜 → 贵），每句话由 llm_policy 按长度/路由模式/实测速度选档
+OLLAMA_MODEL_TIERS = ["qwen3:0.6b", "qwen3:1.7b"]
+# 多个 Ollama 实例时写成列表，按在途请求数负载均衡（见 ollama_client.BackendPool）
 OLLAMA_URL = "http://localhost:11434/api/generate"
 
 # =========================
 # 初始化 ASR 模型
 # =========================
-model = AutoModel(
+# talkie_daemon 在跑就直接连上去（毫秒级），否则本地加载
+model = talkie_daemon.load_asr_model(
     model="paraformer-zh-streaming",
     device="mps"  # Intel Mac 改成 "cpu"
 )
@@ -34,18 +40,18 @@ last_text_change_time = time.time()
 # =========================
 # Ollama 调用
 # =========================
-def call_ollama(prompt: str) -> str:
-    resp = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": "qwen3:0.6b",
-            "prompt": prompt,
-            "stream": False
-        },
-        timeout=60
-    )
+# options 固定：num_ctx 等参数每次一致，避免 runner 重载
+OLLAMA_OPTIONS = {}
 
-    data = resp.json()
+MODEL_POLICY = llm_policy.ModelPolicy(OLLAMA_MODEL_TIERS)
+
+def call_ollama(system: str, prompt: str, mode: str = "plain", deadline=None) -> str:
+    # daemon 在就由 daemon 代发（多个前端共享模型速度统计）
+    # 所有模式都只要一个 JSON：format="json" 让生成在 JSON 闭合处结束
+    data = talkie_daemon.generate_tiered(
+        MODEL_POLICY, system, prompt, mode, deadline=deadline,
+        timeout=60, options=OLLAMA_OPTIONS, url=OLLAMA_URL, format="json",
+    )
 
     # 情况 1：经典 generate API
     if "response" in data:
@@ -63,144 +69,37 @@ def call_ollama(prompt: str) -> str:
     raise RuntimeError(f"Unknown Ollama response: {data}")
 
 # =========================
-# Router（规则优先，Demo 稳定）
+# Router / Prompt 模板 / 渲染器 -> talkie_render.py
 # =========================
-def route(text: str) -> str:
-    if any(k in text for k in ["公式", "平方", "分之", "根号", "求和", "积分", "上标", "下标", "latex"]):
-        return "latex"
-    if any(k in text for k in ["流程图", "画个流程", "流程是", "如果", "否则", "mermaid"]):
-        return "mermaid"
-    if any(k in text for k in ["总结", "列一下", "要点", "几点", "步骤", "清单"]):
-        return "markdown"
-    return "plain"
-
-# =========================
-# Prompt 模板
-# =========================
-def build_prompt(text: str, mode: str) -> str:
-    if mode == "markdown":
-        return f"""
-你是一个文本编辑器，而不是聊天助手。
-
-请将下面的口述内容：
-- 删除口语废话（如“我觉得”“然后”“其实”）
-- 修正语法
-- 如果是清单、步骤或要点，请结构化成 Markdown
-
-【只输出 JSON，不要解释】
-格式：
-{{
-  "type": "markdown",
-  "title": "...",
-  "blocks": [
-    {{ "type": "paragraph", "text": "..." }},
-    {{ "type": "bullets", "items": ["...", "..."] }},
-    {{ "type": "steps", "items": ["...", "..."] }}
-  ]
-}}
-
-【口述内容】
-{text}
-"""
-    if mode == "latex":
-        return f"""
-你是一个公式转写器。
-
-请将下面的口述数学表达转写为 LaTeX 公式。
-
-【要求】
-- 不做数学推导
-- 只做表达映射
-- 只输出 JSON
-
-格式：
-{{
-  "type": "latex",
-  "latex": "..."
-}}
-
-【口述内容】
-{text}
-"""
-    if mode == "mermaid":
-        return f"""
-你是一个流程图生成器。
-
-请根据下面的口述内容生成 Mermaid flowchart TD。
-
-【要求】
-- 只输出 JSON
-- diagram 中必须是合法 Mermaid
-
-格式：
-{{
-  "type": "mermaid",
-  "diagram": "flowchart TD\\nA[开始] --> B[处理]"
-}}
-
-【口述内容】
-{text}
-"""
-    return f"""
-请将下面口述内容整理成简洁、通顺的书面语。
-
-【只输出 JSON】
-格式：
-{{
-  "type": "plain",
-  "text": "..."
-}}
-
-【口述内容】
-{text}
-"""
-
-# =========================
-# 渲染器
-# =========================
-def render(result: dict) -> str:
-    t = result.get("type")
-    if t == "plain":
-        return result["text"]
-
-    if t == "markdown":
-        lines = []
-        if result.get("title"):
-            lines.append(f"## {result['title']}\n")
-        for b in result["blocks"]:
-            if b["type"] == "paragraph":
-                lines.append(b["text"] + "\n")
-            elif b["type"] == "bullets":
-                for i in b["items"]:
-                    lines.append(f"- {i}")
-                lines.append("")
-            elif b["type"] == "steps":
-                for idx, i in enumerate(b["items"], 1):
-                    lines.append(f"{idx}. {i}")
-                lines.append("")
-        return "\n".join(lines)
-
-    if t == "latex":
-        return f"```latex\n{result['latex']}\n```"
-
-    if t == "mermaid":
-        return f"```mermaid\n{result['diagram']}\n```"
-
-    return str(result)
 
 # =========================
 # 句子结束 → LLM 处理
 # =========================
 def process_final_sentence(text: str):
-    mode = route(text)
+    mode = talkie_render.route(text)
     print(f"\n\n🧠 Router → {mode}")
 
-    prompt = build_prompt(text, mode)
-    response = call_ollama(prompt)
+    system, prompt = talkie_render.build_prompt(text, mode)
+    try:
+        response = call_ollama(system, prompt, mode=mode, deadline=llm_policy.deadline_for(text))
+    except llm_policy.DeadlineExceeded as e:
+        # 超过 deadline 不再等，直接给原文
+        print(f"⏱ {e} -> 原文输出：")
+        print(text)
+        return
+    except llm_policy.RunawayGeneration as e:
+        # 输出写满 num_predict 还没结束（复读 / 跑题）：同样给原文
+        print(f"🌀 {e} -> 原文输出：")
+        print(text)
+        return
+    except llm_policy.GuardAbort as e:
+        print(f"🧯 {e} -> 原文输出：")
+        print(text)
+        return
 
     try:
         data = eval(response)  # Demo 阶段可接受，后续换 json.loads
-        output = render(data)
+        output = talkie_render.render(data)
         print("\n📄 结构化输出：\n")
         print(output)
         print("\n" + "=" * 50)
@@ -208,13 +107,36 @@ def process_final_sentence(text: str):
         print("⚠️ 解析失败，原始输出：")
         print(response)
 
+# =========================
+# 句子端点：flush 尾字 + 重置 cache
+# =========================
+def flush_endpoint() -> str:
+    """is_final=True 把 lookahead 里卡住的尾字吐出来，然后清 cache（cache 只活一句话）"""
+    global audio_buffer
+
+    res = model.generate(
+        input=audio_buffer,
+        cache=cache,
+        is_final=True,
+        chunk_size=CHUNK_SIZE,
+        encoder_chunk_look_back=ENCODER_LOOK_BACK,
+        decoder_chunk_look_back=DECODER_LOOK_BACK,
+    )
+    audio_buffer = np.zeros((0,), dtype=np.float32)
+    cache.clear()
+
+    if res and res[0].get("text"):
+        return res[0]["text"]
+    return ""
+
 # =========================
 # 音频回调
 # =========================
-def record_callback(indata, frames, time_info, status):
+def record_callback(block):
     global audio_buffer, last_partial_text, last_text_change_time
 
-    audio = indata[:, 0].astype(np.float32)
+    # 原生采样率/声道 → 16k 单声道
+    audio = capture.convert(block)
     audio_buffer = np.concatenate([audio_buffer, audio])
 
     while len(audio_buffer) >= CHUNK_STRIDE:
@@ -239,6 +161,10 @@ def record_callback(indata, frames, time_info, status):
 
     # 判断一句话结束
     if last_partial_text and (time.time() - last_text_change_time) > SILENCE_TIMEOUT:
+        tail = flush_endpoint()
+        if tail and tail != last_partial_text:
+            print(tail, end="", flush=True)
+            last_partial_text += tail
         final_text = last_partial_text.strip()
         last_partial_text = ""
         process_final_sentence(final_text)
@@ -250,12 +176,10 @@ print("🎙 Typeless-like 本地语音输入 Demo")
 print("👉 开始说话，停顿 0.5s 自动结构化")
 print("👉 Ctrl+C 退出\n")
 
-with sd.InputStream(
-    samplerate=SAMPLE_RATE,
-    channels=1,
-    dtype="float32",
-    callback=record_callback,
-):
+# 按麦克风原生采样率/声道打开（很多 Linux 声卡不支持直接开 16k）
+capture = audio_capture.AudioCapture(record_callback)
+
+with capture.open():
     try:
         while True:
             sd.sleep(1000)
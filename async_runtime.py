@@ -0,0 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# =========================
+# 事件驱动运行时（替代 sd.sleep(20) 轮询主循环）
+# =========================
+# - 音频回调线程只做 feed_audio（拷贝 + 投递），不跑推理
+# - 模型推理放 ASR executor（单线程：保证 chunk 顺序、cache 不会被并发改）
+# - 按键注入（粘贴 / 回删）放 IO executor（单线程：保证上屏顺序）
+# - 静音检测用 loop.call_later 定时器，有声音就重置，不再比较时间差
+# - 其它线程（commit worker 等）用 post 把事件投回 loop
+# 所有时间都用单调时钟，系统改时间/NTP 跳变不会误触发 commit。
+
+clock = time.monotonic
+
+
+class Runtime:
+    def __init__(self, asr_initializer=None):
+        self.loop = None
+        self.audio_queue = None
+        # asr_initializer 在 ASR 线程里、第一次推理前执行（cpu_budget 用它绑核）
+        self.asr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr",
+                                               initializer=asr_initializer)
+        self.io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="io")
+        self._timers = {}
+
+    def start(self):
+        """必须在事件循环里调用（打开麦克风之前）"""
+        self.loop = asyncio.get_running_loop()
+        self.audio_queue = asyncio.Queue()
+
+    # ---------- 线程安全入口 ----------
+    def feed_audio(self, block):
+        """音频回调线程调用：block 必须是调用方自己的拷贝"""
+        self.loop.call_soon_threadsafe(self.audio_queue.put_nowait, block)
+
+    def post(self, fn, *args):
+        """任意线程把一个回调投递到 loop 上执行"""
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    # ---------- 阻塞工作 ----------
+    def run_asr(self, fn, *args):
+        return self.loop.run_in_executor(self.asr_executor, fn, *args)
+
+    def run_io(self, fn, *args):
+        fut = self.loop.run_in_executor(self.io_executor, fn, *args)
+        fut.add_done_callback(_report_failure)
+        return fut
+
+    # ---------- 定时器 ----------
+    def set_timer(self, name: str, delay: float, fn, *args):
+        """同名定时器会被重置（用来做“静音 N 秒后触发”）"""
+        old = self._timers.pop(name, None)
+        if old is not None:
+            old.cancel()
+        self._timers[name] = self.loop.call_later(delay, fn, *args)
+
+    def cancel_timer(self, name: str):
+        old = self._timers.pop(name, None)
+        if old is not None:
+            old.cancel()
+
+
+def _report_failure(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        print("⚠️ io task failed:", repr(fut.exception()))
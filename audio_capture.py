@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+# =========================
+# 按设备原生采样率/声道采集 + 多相重采样到 16k 单声道
+# =========================
+# 很多 Linux 声卡只跑 44.1k / 48k，直接开 16k 的 InputStream 要么失败，
+# 要么走 PortAudio/ALSA 自带的重采样（又慢又多一截延迟）。
+# 这里按设备原生格式打开，回调只拷贝一份原始 block 投递出去；
+# 降混 + 重采样在消费端（事件循环）做，每个 block 开销固定。
+
+TARGET_RATE = 16000
+BLOCK_SECONDS = 0.064          # 和原来 16k 下 blocksize=1024 一样长
+MAX_CHANNELS = 2               # 多声道声卡只取前两路
+TAPS_PER_PHASE = 32            # 每个相位的 FIR 长度（越大越陡，越贵；32 ≈ 0.2ms/block）
+KAISER_BETA = 6.0
+
+
+def _design_filter(up: int, down: int, taps_per_phase: int):
+    """上采样网格上的低通（窗函数 sinc），截止在新旧采样率里较低的那个奈奎斯特"""
+    n = up * taps_per_phase
+    cutoff = 0.5 / max(up, down) * 0.95                     # 相对上采样后的采样率
+    t = np.arange(n) - (n - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, KAISER_BETA)
+    h *= up / h.sum()                                       # 补回插零损失的增益
+    return h.astype(np.float32)
+
+
+class PolyphaseResampler:
+    """
+    有状态的流式有理数重采样（src * up / down），NumPy 向量化
+
+    每次 process 输入一个 block，输出对应长度的 16k 音频；
+    跨 block 保留 taps-1 个历史样本，拼起来和整段一次性重采样结果一致。
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int = TARGET_RATE, taps_per_phase: int = TAPS_PER_PHASE):
+        g = math.gcd(int(src_rate), int(dst_rate))
+        self.up = int(dst_rate) // g
+        self.down = int(src_rate) // g
+        self.taps = taps_per_phase
+
+        h = _design_filter(self.up, self.down, taps_per_phase)
+        # poly[p, t] = h[p + t*up]：输出落在相位 p 时，和最近 taps 个输入样本做点积
+        self.poly = h.reshape(taps_per_phase, self.up).T.copy()
+        self._offsets = np.arange(taps_per_phase)
+
+        self._hist = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self._next = (taps_per_phase - 1) * self.up    # 下一个输出在 buf 上采样网格里的位置
+
+    def process(self, x):
+        buf = np.concatenate([self._hist, x])
+        limit = len(buf) * self.up
+        count = max(0, (limit - 1 - self._next) // self.down + 1)
+
+        ns = self._next + self.down * np.arange(count)
+        idx = (ns // self.up)[:, None] - self._offsets[None, :]
+        y = np.einsum("ij,ij->i", buf[idx], self.poly[ns % self.up])
+
+        self._next += count * self.down - len(x) * self.up
+        self._hist = buf[len(buf) - (self.taps - 1):]
+        return y.astype(np.float32, copy=False)
+
+
+class AudioCapture:
+    """
+    打开麦克风（原生格式）并把原始 block 交给 on_block；convert 负责变成 16k 单声道
+
+        capture = AudioCapture(runtime.feed_audio)
+        with capture.open():
+            ...
+        audio_mono = capture.convert(block)     # 在消费端调用
+    """
+
+    def __init__(self, on_block, device=None, target_rate: int = TARGET_RATE):
+        import sounddevice as sd
+
+        info = sd.query_devices(device, "input")
+        self.device = device
+        self.rate = int(info["default_samplerate"])
+        self.channels = max(1, min(int(info["max_input_channels"]), MAX_CHANNELS))
+        self.target_rate = target_rate
+        self.on_block = on_block
+        self.resampler = None if self.rate == target_rate else PolyphaseResampler(self.rate, target_rate)
+        print(f"🎚 capture: {info['name']} @ {self.rate} Hz x{self.channels} -> {target_rate} Hz mono")
+
+    def open(self):
+        import sounddevice as sd
+
+        return sd.InputStream(
+            device=self.device,
+            samplerate=self.rate,
+            channels=self.channels,
+            dtype="float32",
+            blocksize=int(round(self.rate * BLOCK_SECONDS)),
+            latency="low",
+            callback=self._callback,
+        )
+
+    def _callback(self, indata, frames, time_info, status):
+        # 回调线程只拷贝（indata 之后会被复用），不做任何计算
+        if status:
+            print("⚠️ audio:", status)
+        self.on_block(indata.copy())
+
+    def convert(self, block):
+        """(frames, channels) 原生格式 -> 16k 单声道 float32"""
+        mono = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+        if self.resampler is None:
+            return mono.astype(np.float32, copy=False)
+        return self.resampler.process(mono)
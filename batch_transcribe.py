@@ -0,0 +1,313 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+import wave
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import audio_capture
+import llm_policy
+import ollama_client
+import talkie_daemon
+import talkie_render
+import textproc
+
+# =========================
+# 批量转写：目录里的录音 -> VAD 切段 -> 离线 paraformer -> 结构化 -> JSONL / Markdown
+# =========================
+# - ASR 在进程池里跑，每个 worker 进程只加载一次模型（fsmn-vad + paraformer-zh），
+#   默认每个 worker 只用 1 个线程、worker 数 = CPU 核数，纯 CPU 机器上接近线性扩展
+# - LLM 结构化在主进程的线程池里做（瓶颈在 Ollama，不占 ASR worker）
+# - 断点续跑：transcripts.jsonl 每完成一个文件追加一行，重跑时
+#   路径 + 大小 + mtime 都没变的文件直接跳过
+#
+#   python batch_transcribe.py ~/recordings --out ~/recordings/transcripts
+#   python batch_transcribe.py ~/memos --struct talkie --workers 4
+#   python batch_transcribe.py ~/memos --ollama http://gpu1:11434/api/generate --ollama http://gpu2:11434/api/generate
+
+AUDIO_EXTS = {".wav", ".flac", ".mp3", ".m4a", ".ogg", ".opus", ".aac"}
+SAMPLE_RATE = 16000
+
+VAD_MODEL = "fsmn-vad"
+ASR_MODEL = "paraformer-zh"
+ASR_BATCH_SIZE = 8             # 每次送进 paraformer 的段数
+STRUCT_CHUNK_CHARS = 600       # 长录音按段边界切成这么长的块分别结构化
+LLM_CONCURRENCY = 2            # 每个 Ollama 后端的并发请求数
+
+OLLAMA_URL = "http://localhost:11434/api/generate"       # --ollama 可以给多个，按在途请求数负载均衡
+OLLAMA_MODEL_TIERS = ["qwen3:0.6b", "qwen3:1.7b"]
+OLLAMA_OPTIONS = {
+    "temperature": 0.0,
+    "top_p": 0.75,
+    "repeat_penalty": 1.15
+}
+
+RESULTS_NAME = "transcripts.jsonl"
+
+
+# =========================
+# 读音频（任意格式 -> 16k 单声道 float32）
+# =========================
+def _read_wav(path: str):
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError("only 16-bit PCM wav is supported without soundfile")
+        rate, channels = f.getframerate(), f.getnchannels()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32767.0
+    return data.reshape(-1, channels), rate
+
+
+def _read_any(path: str):
+    try:
+        import soundfile as sf
+        data, rate = sf.read(path, dtype="float32", always_2d=True)
+        return data, rate
+    except ImportError:
+        pass
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError(f"{path}: install soundfile or ffmpeg to read this format")
+    raw = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        check=True, capture_output=True,
+    ).stdout
+    return (np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32767.0).reshape(-1, 1), SAMPLE_RATE
+
+
+def load_audio(path: str):
+    try:
+        data, rate = _read_wav(path)
+    except (wave.Error, ValueError, EOFError):
+        data, rate = _read_any(path)
+    mono = data[:, 0] if data.shape[1] == 1 else data.mean(axis=1)
+    if rate != SAMPLE_RATE:
+        mono = audio_capture.PolyphaseResampler(rate, SAMPLE_RATE).process(mono.astype(np.float32))
+    return mono.astype(np.float32, copy=False)
+
+
+# =========================
+# worker 进程：模型只加载一次
+# =========================
+_vad = None
+_asr = None
+
+
+def _init_worker(device: str, threads: int):
+    global _vad, _asr
+    # 必须在 import torch 之前设置，否则每个进程都会开满所有核的线程池
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    import torch
+    from funasr import AutoModel
+
+    torch.set_num_threads(threads)
+    _vad = AutoModel(model=VAD_MODEL, device=device, disable_update=True, disable_pbar=True)
+    _asr = AutoModel(model=ASR_MODEL, device=device, disable_update=True, disable_pbar=True)
+
+
+def transcribe_file(path: str) -> dict:
+    """在 worker 进程里执行：读音频 -> VAD -> 分批 ASR"""
+    t0 = time.perf_counter()
+    audio = load_audio(path)
+
+    vad = _vad.generate(input=audio)
+    spans = vad[0].get("value", []) if vad else []
+    pieces = [audio[int(s * SAMPLE_RATE / 1000):int(e * SAMPLE_RATE / 1000)] for s, e in spans]
+
+    segments = []
+    for i in range(0, len(pieces), ASR_BATCH_SIZE):
+        batch = pieces[i:i + ASR_BATCH_SIZE]
+        res = _asr.generate(input=batch, batch_size=len(batch))
+        for (start, end), r in zip(spans[i:i + ASR_BATCH_SIZE], res):
+            text = (r.get("text") or "").strip()
+            if text:
+                segments.append({"start": start / 1000, "end": end / 1000, "text": text})
+
+    return {
+        "duration": len(audio) / SAMPLE_RATE,
+        "segments": segments,
+        "text": "".join(s["text"] for s in segments),
+        "asr_seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+# =========================
+# 结构化（主进程线程池）
+# =========================
+MODEL_POLICY = llm_policy.ModelPolicy(OLLAMA_MODEL_TIERS)
+
+
+def call_ollama(system: str, prompt: str, timeout: int = 40, mode: str = "clean", deadline=None,
+                stop=None, format: str = None, guard: dict = None) -> str:
+    data = talkie_daemon.generate_tiered(
+        MODEL_POLICY, system, prompt, mode, deadline=deadline,
+        timeout=timeout, options=OLLAMA_OPTIONS, url=OLLAMA_URL, stop=stop, format=format, guard=guard,
+    )
+    return (data.get("response") or "").strip()
+
+
+def _chunks(segments, limit: int = STRUCT_CHUNK_CHARS):
+    """按 VAD 段边界把整段转写切成不超过 limit 字的块"""
+    buf = ""
+    for seg in segments:
+        if buf and len(buf) + len(seg["text"]) > limit:
+            yield buf
+            buf = ""
+        buf += seg["text"]
+    if buf:
+        yield buf
+
+
+def _render_talkie(text: str) -> str:
+    mode = talkie_render.route(text)
+    system, prompt = talkie_render.build_prompt(text, mode)
+    data = json.loads(textproc.extract_first_json(call_ollama(system, prompt, timeout=60, mode=mode, format="json")))
+    return talkie_render.render(data)
+
+
+def structure(result: dict, how: str) -> dict:
+    parts = []
+    for chunk in _chunks(result["segments"]):
+        try:
+            if how == "talkie":
+                out = _render_talkie(chunk)
+            else:
+                out = textproc.smart_struct_then_render(chunk, call_ollama)
+        except Exception as e:
+            print(f"⚠️ structuring failed, keeping raw text: {e!r}")
+            out = ""
+        parts.append(out.strip() or chunk)
+    result["structured"] = "\n\n".join(parts)
+    return result
+
+
+# =========================
+# 断点续跑 + 输出
+# =========================
+def _fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def load_done(out_dir: str) -> dict:
+    done = {}
+    try:
+        with open(os.path.join(out_dir, RESULTS_NAME), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue        # 上次中断时写了半行
+                done[rec["file"]] = (rec["size"], rec["mtime"])
+    except OSError:
+        pass
+    return done
+
+
+def _clock(sec: float) -> str:
+    sec = int(sec)
+    return f"{sec // 3600:02d}:{sec % 3600 // 60:02d}:{sec % 60:02d}"
+
+
+def write_outputs(out_dir: str, rel: str, record: dict):
+    """先写 Markdown，再追加 JSONL（JSONL 那一行就是“这个文件做完了”的标记）"""
+    md_path = os.path.join(out_dir, os.path.splitext(rel)[0] + ".md")
+    os.makedirs(os.path.dirname(md_path), exist_ok=True)
+    lines = [f"# {os.path.basename(rel)}", ""]
+    if record.get("structured"):
+        lines += [record["structured"], "", "## 转写", ""]
+    lines += [f"`{_clock(s['start'])}` {s['text']}  " for s in record["segments"]]
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    with open(os.path.join(out_dir, RESULTS_NAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"file": rel, **record}, ensure_ascii=False) + "\n")
+
+
+def find_audio(root: str):
+    for dirpath, _, names in os.walk(root):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTS:
+                yield os.path.join(dirpath, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量转写 + 结构化（断点续跑）")
+    parser.add_argument("input", help="录音目录（递归）")
+    parser.add_argument("--out", help="输出目录（默认 <input>/transcripts）")
+    parser.add_argument("--workers", type=int, default=0, help="ASR 进程数（默认 = CPU 核数 / threads）")
+    parser.add_argument("--threads", type=int, default=1, help="每个 ASR 进程的线程数")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--struct", choices=["markdown", "talkie", "none"], default="markdown",
+                        help="markdown = smart_struct_then_render，talkie = TalkieMore 的路由 + render")
+    parser.add_argument("--ollama", action="append", metavar="URL",
+                        help="Ollama /api/generate 地址，可重复给多个（默认 localhost:11434）")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有结果，全部重跑")
+    args = parser.parse_args()
+
+    global OLLAMA_URL
+    if args.ollama:
+        OLLAMA_URL = args.ollama
+    n_backends = len(ollama_client.get_pool(OLLAMA_URL).backends)
+
+    out_dir = args.out or os.path.join(args.input, "transcripts")
+    os.makedirs(out_dir, exist_ok=True)
+    if args.no_resume and os.path.exists(os.path.join(out_dir, RESULTS_NAME)):
+        os.unlink(os.path.join(out_dir, RESULTS_NAME))
+
+    done = load_done(out_dir)
+    todo = []
+    for path in find_audio(args.input):
+        if os.path.abspath(path).startswith(os.path.abspath(out_dir) + os.sep):
+            continue
+        rel = os.path.relpath(path, args.input)
+        fp = _fingerprint(path)
+        if done.get(rel) == (fp["size"], fp["mtime"]):
+            continue
+        todo.append((path, rel, fp))
+
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+    print(f"📂 {len(todo)} files to do ({len(done)} already done), {workers} ASR workers x {args.threads} thread")
+    if not todo:
+        return
+
+    t0 = time.perf_counter()
+    audio_sec = 0.0
+    n_done = 0
+    # spawn：torch/funasr 在 fork 出来的子进程里不安全
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(args.device, args.threads)) as asr_pool, \
+            ThreadPoolExecutor(max_workers=LLM_CONCURRENCY * n_backends, thread_name_prefix="llm") as llm_pool:
+        pending = {asr_pool.submit(transcribe_file, path): ("asr", rel, fp) for path, rel, fp in todo}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, rel, fp = pending.pop(fut)
+                try:
+                    record = fut.result()
+                except Exception as e:
+                    print(f"❌ {rel}: {e!r}")
+                    continue
+
+                if stage == "asr" and args.struct != "none":
+                    pending[llm_pool.submit(structure, record, args.struct)] = ("llm", rel, fp)
+                    continue
+
+                write_outputs(out_dir, rel, {**fp, **record})
+                n_done += 1
+                audio_sec += record["duration"]
+                speed = audio_sec / max(1e-6, time.perf_counter() - t0)
+                print(f"✅ [{n_done}/{len(todo)}] {rel}  {record['duration']:.0f}s audio, "
+                      f"{len(record['segments'])} segments  (overall {speed:.1f}x realtime)")
+
+    print(f"\n🏁 {n_done} files, {audio_sec / 60:.1f} min audio in {time.perf_counter() - t0:.0f}s -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
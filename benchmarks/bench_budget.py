@@ -0,0 +1,125 @@
+import argparse
+import time
+
+import llm_policy
+import metrics
+import ollama_client
+
+from benchmarks import corpus
+from benchmarks.bench_textpath import _quiet
+from benchmarks.mock_ollama import MockOllama, echo_prompt
+
+# =========================
+# 生成预算：num_predict 收紧过程 + 失控生成被提前截断
+# =========================
+#   python -m benchmarks.bench_budget
+#
+# mock 正常请求输出去掉语气词的原文（输出/输入 < 1），每 --runaway-every 个请求
+# 进入“复读”（输出原文 30 遍）。同一批请求分别：
+#   unbounded  直接调 ollama_client.generate（不带 num_predict，等同改动前）
+#   budget     走 llm_policy.generate_tiered（自动 num_predict）
+# 报失控请求的平均耗时和 num_predict 的变化；失控没被截断、或正常输出被截断，退出码 1。
+#
+# 降档：两档 fast / slow，slow 的速度统计看着很快（选档会选它），实际卡住 SLOW_TIER_SECONDS。
+# 带 FALLBACK_DEADLINE 秒的 deadline 调 generate_tiered（非流式和带 guard 的流式各一次），
+# 必须在 deadline 内拿到 fast 的结果，而不是等 slow 用光 deadline 再抛 DeadlineExceeded。
+
+CHAR_LATENCY = 0.0005          # mock 每生成一个字 0.5ms
+RUNAWAY_REPEAT = 30
+SLOW_TIER_SECONDS = 10.0
+FALLBACK_DEADLINE = 2.0
+
+
+def make_script(runaway_every: int):
+    seen = {"n": 0}
+
+    def script(req):
+        seen["n"] += 1
+        text = "".join(corpus._items(echo_prompt(req)))
+        if seen["n"] % runaway_every == 0:
+            return text * RUNAWAY_REPEAT
+        return text
+
+    return script
+
+
+def tier_fallback(stream: bool):
+    """返回 (最终用的档位或异常名, 耗时秒)"""
+    policy = llm_policy.ModelPolicy(["fast", "slow"])
+    policy.tok_per_sec["slow"] = 1000.0          # 上次还很快，这次卡住了
+    latency = lambda req: SLOW_TIER_SECONDS if req.get("model") == "slow" else 0.05
+    prompt = "原始文本：\n" + corpus.transcripts(1, lengths=(120,))[0]
+    with MockOllama(latency=latency) as mock, _quiet():
+        t0 = time.perf_counter()
+        try:
+            data = llm_policy.generate_tiered(policy, "system", prompt, "clean", url=mock.url,
+                                              deadline=time.monotonic() + FALLBACK_DEADLINE,
+                                              guard={"max_chars": 10000} if stream else None)
+            used = data["model"]
+        except llm_policy.DeadlineExceeded:
+            used = "DeadlineExceeded"
+        return used, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="num_predict 预算基准")
+    parser.add_argument("--per-length", type=int, default=8)
+    parser.add_argument("--runaway-every", type=int, default=7)
+    args = parser.parse_args()
+
+    texts = corpus.transcripts(args.per_length, lengths=(40, 120, 400))
+    prompts = ["原始文本：\n" + t for t in texts]
+    failures = []
+
+    with MockOllama(script=make_script(args.runaway_every), char_latency=CHAR_LATENCY) as mock:
+        slow = []
+        with _quiet():
+            for i, prompt in enumerate(prompts, 1):
+                t0 = time.perf_counter()
+                ollama_client.generate("mock", "system", prompt, url=mock.url, timeout=60)
+                if i % args.runaway_every == 0:
+                    slow.append(time.perf_counter() - t0)
+
+    policy = llm_policy.ModelPolicy(["mock"])
+    probe = len(prompts[0])
+    cold = policy.num_predict(probe, "clean")
+    with MockOllama(script=make_script(args.runaway_every), char_latency=CHAR_LATENCY) as mock:
+        cut, wrong = [], 0
+        runaway0 = metrics.LLM_RUNAWAY.labels("mock", "clean").value
+        with _quiet():
+            for i, prompt in enumerate(prompts, 1):
+                t0 = time.perf_counter()
+                try:
+                    llm_policy.generate_tiered(policy, "system", prompt, "clean", timeout=60, url=mock.url)
+                    if i % args.runaway_every == 0:
+                        wrong += 1          # 失控请求没被截断
+                except llm_policy.RunawayGeneration:
+                    if i % args.runaway_every == 0:
+                        cut.append(time.perf_counter() - t0)
+                    else:
+                        wrong += 1          # 正常请求被截断
+        counted = metrics.LLM_RUNAWAY.labels("mock", "clean").value - runaway0
+
+    warm = policy.num_predict(probe, "clean")
+    print(f"num_predict for {probe} chars: cold={cold} -> learned={warm}")
+    print(f"runaway requests: {len(slow)}, unbounded avg {sum(slow) / max(1, len(slow)) * 1000:.0f}ms, "
+          f"budget avg {sum(cut) / max(1, len(cut)) * 1000:.0f}ms, counted={counted:.0f}")
+    if wrong or counted != len(slow) or warm >= cold:
+        failures.append(f"{wrong} requests misclassified, {counted:.0f}/{len(slow)} runaways counted")
+
+    for stream in (False, True):
+        used, took = tier_fallback(stream)
+        kind = "streamed" if stream else "plain"
+        print(f"slow top tier, {kind}: {used} after {took:.2f}s (deadline {FALLBACK_DEADLINE}s)")
+        if used != "fast" or took > FALLBACK_DEADLINE:
+            failures.append(f"slow top tier ({kind}): got {used} after {took:.2f}s, "
+                            f"expected fast within {FALLBACK_DEADLINE}s")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print("\n✅ runaways are cut off and counted; budgets tighten; a stuck tier falls back in time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import cpu_budget
+
+# =========================
+# ASR / LLM 抢核：有无 cpu_budget 时流式 chunk 的 RTF
+# =========================
+#   python -m benchmarks.bench_contention
+#
+# ASR 用固定计算量的 numpy 循环模拟（空闲时 RTF≈--rtf），LLM 用每个核一个忙等进程模拟
+# （llama.cpp 默认按全部核开线程）。三种情况各跑 --chunks 个 chunk，报 p50 / p95 RTF：
+#   idle       没有 LLM 负载
+#   contended  LLM 进程不绑核
+#   budget     ASR 线程绑 ASR 核，LLM 进程绑 LLM 核（等同 cpu_budget.apply + pin_ollama）
+# budget 下 p95 RTF 超过 1 退出码 1。核数 < 2 的机器没法划分，直接跳过。
+
+CHUNK_SECONDS = 0.6            # chunk_size [0, 10, 5]
+
+
+def _burn(cores, stop):
+    if cores is not None:
+        cpu_budget.pin_current_thread(cores)
+    x = 1.0
+    while not stop.is_set():
+        for _ in range(10000):
+            x = x * 1.0000001 + 1e-9
+
+
+def _asr_step(iters: int):
+    a = np.full((128, 128), 0.5, dtype=np.float32)
+    for _ in range(iters):
+        a = np.tanh(a @ a * 0.01)
+    return a
+
+
+def _calibrate(target: float) -> int:
+    iters = 10
+    while True:
+        t0 = time.perf_counter()
+        _asr_step(iters)
+        took = time.perf_counter() - t0
+        if took > 0.02:
+            return max(1, int(iters * target / took))
+        iters *= 2
+
+
+def run_case(budget, pin: bool, load: bool, iters: int, chunks: int):
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    procs = []
+    if load:
+        for _ in range(len(cpu_budget.available_cores())):
+            p = ctx.Process(target=_burn, args=(budget.llm_cores if pin else None, stop), daemon=True)
+            p.start()
+            procs.append(p)
+        time.sleep(0.3)
+
+    init = (lambda: cpu_budget.init_asr_thread(budget)) if pin else None
+    rtfs = []
+    with ThreadPoolExecutor(max_workers=1, initializer=init) as asr:
+        for _ in range(chunks):
+            t0 = time.perf_counter()
+            asr.submit(_asr_step, iters).result()
+            rtfs.append((time.perf_counter() - t0) / CHUNK_SECONDS)
+
+    stop.set()
+    for p in procs:
+        p.join()
+    rtfs.sort()
+    return rtfs[len(rtfs) // 2], rtfs[int(len(rtfs) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASR / LLM 抢核基准")
+    parser.add_argument("--rtf", type=float, default=0.4, help="空闲时每个 chunk 的目标 RTF")
+    parser.add_argument("--chunks", type=int, default=30)
+    parser.add_argument("--asr-cores", type=int, default=None, help="ASR 专用核数（默认同 cpu_budget）")
+    args = parser.parse_args()
+
+    budget = cpu_budget.plan(args.asr_cores)
+    if budget is None or not hasattr(os, "sched_setaffinity"):
+        print(f"⏭ skipped: needs >= 2 cores and sched_setaffinity (cores: {cpu_budget.available_cores()})")
+        return
+    print(f"{budget}")
+
+    os.environ.setdefault("OMP_NUM_THREADS", str(budget.asr_threads))
+    iters = _calibrate(args.rtf * CHUNK_SECONDS)
+    results = {}
+    print(f"{'case':<12}{'p50 RTF':>10}{'p95 RTF':>10}")
+    for name, pin, load in (("idle", False, False), ("contended", False, True), ("budget", True, True)):
+        p50, p95 = results[name] = run_case(budget, pin, load, iters, args.chunks)
+        print(f"{name:<12}{p50:>10.2f}{p95:>10.2f}")
+
+    if results["budget"][1] > 1.0:
+        print("\n❌ streaming falls behind real time even with a CPU budget")
+        raise SystemExit(1)
+    print("\n✅ streaming stays real-time under LLM load")
+
+
+if __name__ == "__main__":
+    main()
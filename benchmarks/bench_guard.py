@@ -0,0 +1,172 @@
+import argparse
+import time
+
+import requests
+
+import llm_policy
+import ollama_client
+
+from benchmarks import corpus
+from benchmarks.bench_textpath import _quiet
+from benchmarks.mock_ollama import MockOllama, echo_prompt
+from benchmarks.script_loader import load_definitions
+
+# =========================
+# 流式 guard：被终检扔掉的输出浪费了多少生成时间
+# =========================
+#   python -m benchmarks.bench_guard
+#
+# mock 每 --bad-every 个请求“胡编”一次，其余输出去掉语气词的原文（echo）：
+#   drift   开头十来个字照抄，后面是原文里没有的“总结”（覆盖率低）
+#   expand  原文说完接着复读（长度超过上限）
+# 两个前端各跑一遍同一批请求（mock 每个字 --char-ms 毫秒；mock 按请求序号决定输出，off / on 两遍一样）：
+#   typeinLLM     clean 模式，终检 = 相似度 + 覆盖率（drift + expand）
+#   typeinLLMNew  format 模式，终检 = 长度比（expand）
+# off = 不带 guard（等同改动前），on = 带 stream_guard_for 的规格（只有按终检换算的长度上限）。
+# 报终检不通过的请求一共花了多少时间。typeinLLM 的长度上限（相似度下限换算）比 num_predict 还宽，
+# guard 基本省不了时间，只报数。
+# 另外单独跑一批 punct（不混进上面那批，免得改变 llm_policy 学到的 num_predict）：每三个字加一个逗号
+# （clean 模式本来就会加标点），3-gram 覆盖率只有两成多，但相似度 / 长度多半还在终检范围内。
+# 以下情况退出码 1：
+#   - off 时终检放行的输出，on 时被 guard 断开（两批都查）
+#   - 没有一条 punct 被终检放行（上面那条就没测到低覆盖率的输出）
+#   - 胡编的输出被终检放行
+#   - typeinLLMNew 浪费的时间没有少 MIN_SAVING 以上
+#   - 流式请求（带 guard，长度上限永远到不了）的模型一直吐 token 时，没在 timeout 附近抛 requests.Timeout
+#     （requests 的 timeout 对流式只管单次读，截止时间要 _read_stream 自己查）
+
+DRIFT_KEEP = 12
+EXPAND_REPEAT = 3
+PUNCT_EVERY = 3
+MIN_SAVING = 0.3
+DEADLINE_TIMEOUT = 0.5         # 超时检查：generate 的 timeout（秒）
+DEADLINE_SLACK = 0.3           # 允许超出多少才算没守住
+# 模型自己编的“总结 / 解释”，和口述语料不共享词汇
+_INVENTED = ("综上所述该方案在整体架构层面具有显著优势能够有效提升系统的稳定性与可扩展性"
+             "同时建议团队在后续迭代中持续关注用户体验并结合行业最佳实践不断优化相关流程")
+
+
+def kind_of(n: int, bad_every: int, kinds) -> str:
+    """第 n 个请求（从 1 数）mock 输出哪一种；bad_every=0 时全是 kinds[0]"""
+    if not bad_every:
+        return kinds[0]
+    if n % bad_every:
+        return "echo"
+    return kinds[(n // bad_every) % len(kinds)]
+
+
+def make_script(bad_every: int, kinds):
+    seen = {"n": 0}
+
+    def script(req):
+        seen["n"] += 1
+        text = "".join(corpus._items(echo_prompt(req)))
+        kind = kind_of(seen["n"], bad_every, kinds)
+        if kind == "echo":
+            return text
+        if kind == "punct":
+            return "".join(ch + ("，" if i % PUNCT_EVERY == PUNCT_EVERY - 1 else "") for i, ch in enumerate(text))
+        if kind == "drift":
+            return text[:DRIFT_KEEP] + (_INVENTED * (len(text) // len(_INVENTED) + 2))[:len(text) * 2]
+        return text + "，也就是说" + text * EXPAND_REPEAT
+
+    return script
+
+
+def run(ns: dict, mode: str, guard_for, final_ok, bad_every: int, kinds, args, use_guard: bool) -> dict:
+    """返回浪费的时间和每个请求的 (输出种类, 结果)：accepted / rejected（终检不过）/ aborted（guard 断开）/ runaway"""
+    texts = corpus.transcripts(args.per_length, lengths=(40, 120, 400))
+    policy = llm_policy.ModelPolicy(["mock"])
+    system = ns["SYSTEM_EDIT_CLEAN"]
+    wasted, outcomes = 0.0, []
+    with MockOllama(script=make_script(bad_every, kinds), char_latency=args.char_ms / 1000) as mock:
+        with _quiet():
+            for n, raw in enumerate(texts, 1):
+                t0 = time.perf_counter()
+                try:
+                    data = llm_policy.generate_tiered(policy, system, "原始文本如下：\n" + raw, mode, timeout=60,
+                                                      url=mock.url, guard=guard_for(raw) if use_guard else None)
+                    outcome = "accepted" if final_ok(raw, data.get("response", "").strip()) else "rejected"
+                except llm_policy.GuardAbort:
+                    outcome = "aborted"
+                except llm_policy.RunawayGeneration:
+                    outcome = "runaway"
+                if outcome != "accepted":
+                    wasted += time.perf_counter() - t0
+                outcomes.append((kind_of(n, bad_every, kinds), outcome))
+    return {"wasted_ms": wasted * 1000, "outcomes": outcomes,
+            "rejected": sum(o != "accepted" for _, o in outcomes),
+            "aborted": sum(o == "aborted" for _, o in outcomes),
+            "bad_ok": sum(k in ("drift", "expand") and o == "accepted" for k, o in outcomes)}
+
+
+def false_aborts(off: dict, on: dict) -> int:
+    """off 时终检放行、on 时被 guard 断开的请求数"""
+    return sum(a == "accepted" and b == "aborted" for (_, a), (_, b) in zip(off["outcomes"], on["outcomes"]))
+
+
+def streamed_deadline() -> float:
+    """流式 + guard 的请求，mock 每字 20ms 吐 5 秒：返回抛 Timeout 用了多久（没抛返回 inf）"""
+    with MockOllama(script=lambda req: "口述内容" * 64, char_latency=0.02) as mock, _quiet():
+        t0 = time.perf_counter()
+        try:
+            ollama_client.generate("mock", "system", "原始文本如下：\n测试", url=mock.url,
+                                   timeout=DEADLINE_TIMEOUT, guard={"max_chars": 10000})
+        except requests.Timeout:
+            return time.perf_counter() - t0
+    return float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式 guard 基准")
+    parser.add_argument("--per-length", type=int, default=6)
+    parser.add_argument("--bad-every", type=int, default=3)
+    parser.add_argument("--char-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    old = load_definitions("typeinLLM.py")
+    new = load_definitions("typeinLLMNew.py")
+    cases = [
+        ("typeinLLM", old, "clean", old["stream_guard_for"],
+         lambda raw, out: old["is_llm_output_safe"](raw, out), ("drift", "expand"), False),
+        ("typeinLLMNew", new, "clean", lambda raw: new["stream_guard_for"](raw, "format"),
+         lambda raw, out: new["is_llm_output_safe"](raw, out, mode="format"), ("expand",), True),
+    ]
+
+    failures = []
+    print(f"{'script':<14}{'batch':<7}{'guard':<7}{'rejected':>9}{'aborted':>9}{'wasted ms':>11}")
+    for name, ns, mode, guard_for, final_ok, kinds, gate_saving in cases:
+        batches = {}
+        for batch, bad_every, batch_kinds in (("mixed", args.bad_every, kinds), ("punct", 0, ("punct",))):
+            for use_guard in (False, True):
+                r = batches[batch, use_guard] = run(ns, mode, guard_for, final_ok, bad_every, batch_kinds,
+                                                    args, use_guard)
+                print(f"{name:<14}{batch:<7}{'on' if use_guard else 'off':<7}{r['rejected']:>9}{r['aborted']:>9}"
+                      f"{r['wasted_ms']:>11.0f}")
+            aborted = false_aborts(batches[batch, False], batches[batch, True])
+            if aborted:
+                failures.append(f"{name}/{batch}: {aborted} outputs the final guard accepts were aborted mid-stream")
+
+        off, on = batches["mixed", False], batches["mixed", True]
+        if off["bad_ok"] or on["bad_ok"]:
+            failures.append(f"{name}: {off['bad_ok'] + on['bad_ok']} bad outputs accepted")
+        punct = batches["punct", False]
+        if punct["rejected"] == len(punct["outcomes"]):
+            failures.append(f"{name}: no punct output passed the final guard, low coverage was not exercised")
+        if gate_saving and on["wasted_ms"] > off["wasted_ms"] * (1 - MIN_SAVING):
+            failures.append(f"{name}: wasted {on['wasted_ms']:.0f}ms with guard vs {off['wasted_ms']:.0f}ms without")
+
+    took = streamed_deadline()
+    print(f"\nstreamed request with a {DEADLINE_TIMEOUT}s timeout: "
+          + (f"gave up after {took:.2f}s" if took < float("inf") else "never timed out"))
+    if took > DEADLINE_TIMEOUT + DEADLINE_SLACK:
+        failures.append(f"streamed request not stopped within {DEADLINE_TIMEOUT + DEADLINE_SLACK:.1f}s "
+                        f"of a {DEADLINE_TIMEOUT}s timeout")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print("\n✅ outputs that cannot pass the final guard are cut off early; anything it accepts is untouched")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import ollama_client
+
+from benchmarks.bench_textpath import _quiet
+from benchmarks.mock_ollama import MockOllama
+
+# =========================
+# 多 Ollama 后端：吞吐随后端数扩展 + 故障摘除 / 恢复
+# =========================
+#   python -m benchmarks.bench_pool
+#
+# 每个 mock 后端 concurrency=1（和默认 OLLAMA_NUM_PARALLEL 一样一次只跑一个生成），
+# 用 --clients 个线程并发请求，分别接 1..N 个后端比吞吐；
+# 然后停掉一个后端，确认请求全部在其余后端完成、坏后端被摘除，
+# 再在同一端口重新拉起，确认健康检查把它放回。任一项不满足退出码 1。
+
+MIN_SCALING = 0.7              # N 个后端的吞吐至少是单后端的 N * 0.7 倍
+
+
+def run_load(urls, n_requests: int, clients: int) -> float:
+    def one(i):
+        return ollama_client.generate("mock", "system", f"原始文本：\n第{i}条", url=urls, timeout=10)
+
+    t0 = time.perf_counter()
+    with _quiet(), ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(n_requests)))
+    return n_requests / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 Ollama 后端负载均衡基准")
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock 每次生成耗时（秒）")
+    parser.add_argument("--requests", type=int, default=36)
+    parser.add_argument("--clients", type=int, default=6)
+    args = parser.parse_args()
+
+    failures = []
+    with contextlib.ExitStack() as stack:
+        mocks = [stack.enter_context(MockOllama(latency=args.latency, concurrency=1))
+                 for _ in range(args.backends)]
+
+        # ---------- 扩展性 ----------
+        base = None
+        print(f"{'backends':<10}{'req/sec':>10}{'speedup':>10}")
+        for n in range(1, args.backends + 1):
+            rps = run_load([m.url for m in mocks[:n]], args.requests, args.clients)
+            base = base or rps
+            print(f"{n:<10}{rps:>10.1f}{rps / base:>10.2f}")
+            if n > 1 and rps < base * n * MIN_SCALING:
+                failures.append(f"{n} backends: {rps:.1f} req/s is < {MIN_SCALING:.0%} of linear")
+
+        # ---------- 摘除 + 重试 ----------
+        urls = [m.url for m in mocks]
+        pool = ollama_client.get_pool(urls)
+        dead = mocks[-1]
+        dead.stop()
+        before = [len(m.requests) for m in mocks]
+        retries0 = metrics.OLLAMA_RETRIES.labels().value
+        with _quiet():
+            for i in range(args.requests):
+                ollama_client.generate("mock", "system", f"第{i}条", url=urls, timeout=10)
+        served = [len(m.requests) - b for m, b in zip(mocks, before)]
+        ejected = not pool.backends[-1].healthy(time.monotonic())
+        retries = metrics.OLLAMA_RETRIES.labels().value - retries0
+        print(f"\nbackend down: served per backend {served}, retries={retries:.0f}, ejected={ejected}")
+        if sum(served) != args.requests or not ejected or retries > 1:
+            failures.append("failover: requests were lost or the dead backend was not ejected")
+
+        # ---------- 健康检查恢复 ----------
+        port = int(dead.url.split(":")[2].split("/")[0])
+        stack.enter_context(MockOllama(latency=args.latency, concurrency=1, port=port))
+        with _quiet():
+            pool.check()
+        back = pool.backends[-1].healthy(time.monotonic())
+        print(f"backend revived on :{port}: back in rotation={back}")
+        if not back:
+            failures.append("health check did not put the revived backend back")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print("\n✅ pool scales and fails over")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import time
+
+import kv_prefill
+import llm_policy
+import metrics
+
+from benchmarks import corpus
+from benchmarks.bench_textpath import _quiet
+from benchmarks.mock_ollama import MockOllama
+from benchmarks.script_loader import load_definitions
+
+# =========================
+# 说话过程中 prefill：长口述静音之后还要等多久
+# =========================
+#   python -m benchmarks.bench_prefill
+#
+# mock 模拟 prompt eval + 前缀 KV 缓存（每个没命中缓存的字 --prompt-ms 毫秒）和生成（每字 --char-ms），
+# 同时只跑一个请求（一个 runner）。每段口述按 --partial-ms 一个 partial、每次长 --partial-chars 个字
+# 长出来（时间压缩过，prefill 间隔 --interval 按同样比例缩小），然后静音 commit：
+#   cold  改动前：说话时不发请求
+#   warm  同样的 partial 喂给 kv_prefill.Prefiller，send = 脚本的 prefill_commit_prompt
+# commit 都跑 typeinLLMNew 的 postprocess（clean 模式：只有一次 LLM 调用，不走 fallback 链），
+# 记静音后到拿到结果的时间，以及 commit 请求实际 eval 了多少个 prompt 字。
+# 两边输出不一致、或最长一档 warm 的 p50 没比 cold 快 MIN_SAVING 以上，退出码 1。
+
+MIN_SAVING = 0.3
+
+
+def dictate(ns: dict, texts, args, prefiller):
+    """逐段口述 + 静音 commit，返回 [(字数, 秒, commit eval 的 prompt 字数, 输出)]"""
+    prompt_tokens = metrics.LLM_PROMPT_TOKENS.labels("mock")
+    results = []
+    for raw in texts:
+        if prefiller is not None:
+            prefiller.reset()
+        for end in range(args.partial_chars, len(raw) + args.partial_chars, args.partial_chars):
+            preview = raw[:end]
+            if prefiller is not None:
+                prefiller.offer(len(preview), lambda: preview)
+            time.sleep(args.partial_ms / 1000)
+
+        evaluated0 = prompt_tokens.value
+        t0 = time.perf_counter()
+        out = ns["postprocess"](raw)
+        results.append((len(raw), time.perf_counter() - t0, prompt_tokens.value - evaluated0, out))
+        if prefiller is not None:
+            prefiller.idle()
+    return results
+
+
+def p50(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="说话过程中 KV prefill 基准")
+    parser.add_argument("--per-length", type=int, default=4)
+    parser.add_argument("--partial-ms", type=float, default=20.0)
+    parser.add_argument("--partial-chars", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.1, help="prefill 最小间隔（秒，已压缩）")
+    parser.add_argument("--prompt-ms", type=float, default=0.2, help="每个没命中缓存的 prompt 字的 eval 耗时")
+    parser.add_argument("--char-ms", type=float, default=0.05, help="每生成一个字的耗时")
+    args = parser.parse_args()
+
+    lengths = (120, 400, 1500)
+    texts = corpus.transcripts(args.per_length, lengths=lengths)
+    runs = {}
+    with MockOllama(concurrency=1, prompt_char_latency=args.prompt_ms / 1000,
+                    char_latency=args.char_ms / 1000) as mock:
+        for name in ("cold", "warm"):
+            ns = load_definitions("typeinLLMNew.py")
+            ns.update(OLLAMA_URL=mock.url, LLM_MODE="clean", FAST_PATH_ENABLED=False,
+                      MODEL_POLICY=llm_policy.ModelPolicy(["mock"]))
+            prefiller = None
+            if name == "warm":
+                prefiller = kv_prefill.Prefiller(ns["prefill_commit_prompt"], interval=args.interval)
+            with _quiet():
+                runs[name] = dictate(ns, texts, args, prefiller)
+            if prefiller is not None:
+                print(f"warm: {prefiller.sent} prefills over {len(texts)} dictations")
+
+    print(f"{'chars':>6}{'cold ms':>10}{'warm ms':>10}{'cold eval':>11}{'warm eval':>11}")
+    summary = {}
+    for n in lengths:
+        row = {name: [r for r in runs[name] if r[0] == n] for name in runs}
+        cold_ms = p50(r[1] for r in row["cold"]) * 1000
+        warm_ms = p50(r[1] for r in row["warm"]) * 1000
+        cold_eval = p50(r[2] for r in row["cold"])
+        warm_eval = p50(r[2] for r in row["warm"])
+        summary[n] = (cold_ms, warm_ms)
+        print(f"{n:>6}{cold_ms:>10.1f}{warm_ms:>10.1f}{cold_eval:>11.0f}{warm_eval:>11.0f}")
+
+    failures = []
+    mismatched = sum(a[3] != b[3] for a, b in zip(runs["cold"], runs["warm"]))
+    if mismatched:
+        failures.append(f"{mismatched} commits produced different output with prefill")
+    cold_ms, warm_ms = summary[lengths[-1]]
+    if warm_ms > cold_ms * (1 - MIN_SAVING):
+        failures.append(f"{lengths[-1]}-char commits: {warm_ms:.0f}ms warm vs {cold_ms:.0f}ms cold")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print(f"\n✅ prefill during speech cuts post-silence latency {cold_ms / warm_ms:.1f}x "
+          f"for {lengths[-1]}-char dictations")
+
+
+if __name__ == "__main__":
+    main()
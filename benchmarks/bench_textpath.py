@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# 基准里不能连到正在跑的 talkie daemon（否则 LLM 请求不会打到 mock 上）
+os.environ["TALKIE_SOCKET"] = os.path.join("/tmp", f"talkie-bench-{os.getpid()}.sock")
+
+import async_runtime
+import commit_worker
+import llm_policy
+import talkie_render
+import textproc
+import transcript
+
+from benchmarks import corpus
+from benchmarks.mock_ollama import MockOllama
+from benchmarks.script_loader import load_definitions
+
+# =========================
+# 文本后处理路径的吞吐基准（每阶段 ops/sec + 内存分配），对比存档的 baseline
+# =========================
+#   python -m benchmarks.bench_textpath                   # 跑一遍并和 baseline 比，退化则退出码 1
+#   python -m benchmarks.bench_textpath --save-baseline   # 覆盖 baseline
+# 输出有没有变由 bench_textprops 比对（这里只管快慢和内存）。
+#
+# 速度门槛看相对值：每个阶段分 REPEATS 轮，每轮紧挨着再跑一个固定的纯 Python 校准负载，
+# 取“阶段 ops / 校准 ops”的中位数和 baseline 比。机器忙 / 降频时两边一起变慢，比值基本不动，
+# 只有代码本身变慢才会掉。commit_path（线程 + 事件循环 + 本地 HTTP）抖动太大，只报数不进门槛。
+#
+# 分配量：CPython 没有“累计分配次数”计数器，这里报 tracemalloc 的
+# 每次调用峰值（KiB）和跑完一轮后净增的内存块数（>0 说明有东西被留住了）。
+# baseline 和机器相关，换机器后先 --save-baseline 一次。
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "textpath.json")
+REPEATS = 5                    # 每个阶段跑几轮（取中位数）
+REPEAT_SECONDS = 0.08           # 每轮至少跑这么久（阶段和校准负载各自）
+SPEED_TOLERANCE = 0.40         # 相对速度比 baseline 低 40% 以上算退化
+UNGATED = {"commit_path"}      # 只报数的阶段
+MEMORY_TOLERANCE = 0.50        # 峰值内存比 baseline 高 50% 以上算退化
+
+
+class _Null(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+
+def _quiet():
+    """被测函数里有大量 debug print，计时期间丢掉（print 本身的开销仍然算在内）"""
+    return contextlib.redirect_stdout(_Null())
+
+
+def _calibration(text: str) -> int:
+    """校准负载：逐字循环 + 切片拼接，和被测的文本函数同一类开销，本身永远不改"""
+    out, n = [], 0
+    for i, ch in enumerate(text):
+        if ch in "，。；：":
+            out.append(text[n:i + 1])
+            n = i + 1
+    return len("".join(out))
+
+
+def _rate(fn, inputs, min_seconds: float) -> float:
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        for x in inputs:
+            fn(x)
+        calls += len(inputs)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_seconds:
+            return calls / elapsed
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(fn, inputs, calib_inputs, repeats: int = REPEATS, min_seconds: float = REPEAT_SECONDS) -> dict:
+    with _quiet():
+        for x in inputs[:3]:
+            fn(x)                       # warmup（正则编译、缓存）
+
+        rates, relative = [], []
+        for _ in range(repeats):
+            rate = _rate(fn, inputs, min_seconds)
+            rates.append(rate)
+            relative.append(rate / _rate(_calibration, calib_inputs, min_seconds))
+
+        tracemalloc.start()
+        peak = 0
+        blocks0 = sys.getallocatedblocks()
+        for x in inputs:
+            tracemalloc.reset_peak()
+            fn(x)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        net_blocks = sys.getallocatedblocks() - blocks0
+
+    return {"ops_per_sec": _median(rates), "relative": _median(relative),
+            "peak_kib": peak / 1024, "net_blocks": net_blocks}
+
+
+# =========================
+# 阶段定义
+# =========================
+def text_stages(per_length: int):
+    new = load_definitions("typeinLLMNew.py")
+
+    texts = corpus.transcripts(per_length)
+    cleaned = [textproc.preprocess_before_llm(t) for t in texts]
+    md_out = [corpus.markdown_list(t) for t in texts]
+    noisy_json = [corpus.outline_json(t, noisy=True) for t in texts]
+    with _quiet():
+        outlines = [o for o in (textproc.parse_outline(textproc.extract_first_json(j)) for j in noisy_json) if o]
+    payloads = [corpus.render_payload(t, k) for t in texts[::4]
+                for k in ("plain", "markdown", "latex", "mermaid")]
+
+    partials = [(t[:len(t) - 3], t[:len(t) - 5] + "改写了") for t in texts]   # 末尾改写的流式识别结果
+    raw_json = [corpus.outline_json(t) for t in texts]
+
+    guard = new["is_llm_output_safe"]
+    return {
+        "diff_new_part": (lambda p: transcript.diff_new_part(*p), partials),
+        "split_ordered_items": (textproc.split_ordered_items, texts),
+        "add_soft_breaks": (textproc.add_soft_breaks, texts),
+        "preprocess_before_llm": (textproc.preprocess_before_llm, texts),
+        "fast_format": (new["fast_format"], texts),
+        "is_llm_output_safe/reorder": (lambda p: guard(p[0], p[1], mode="reorder"), list(zip(cleaned, md_out))),
+        "is_llm_output_safe/format": (lambda p: guard(p[0], p[1], mode="format"), list(zip(cleaned, cleaned))),
+        "normalize_for_guard": (textproc.normalize_for_guard, md_out),
+        "ngram_coverage": (lambda p: textproc.ngram_coverage(p[0], p[1]), list(zip(cleaned, md_out))),
+        "clean_json_string": (textproc.clean_json_string, raw_json),
+        "extract_first_json+parse_outline": (
+            lambda j: textproc.parse_outline(textproc.extract_first_json(j)), noisy_json),
+        "outline_to_markdown": (textproc.outline_to_markdown, outlines),
+        "normalize_markdown": (textproc.normalize_markdown, md_out),
+        "TalkieMore.render": (talkie_render.render, payloads),
+    }
+
+
+def mock_script(req):
+    """按 system 前缀决定 mock 输出：重排 -> Markdown 列表，编辑 -> 去掉语气词的原文"""
+    text = corpus._items(req.get("prompt", "").split("：\n", 1)[-1])
+    if req.get("system") == textproc.SYSTEM_REORDER:
+        return corpus.markdown_list("".join(text))
+    return "\n".join(text)
+
+
+def commit_path(per_length: int, llm_latency: float) -> dict:
+    """
+    完整 commit 路径：preview -> 切句 + 静音端点 commit -> worker(postprocess + mock Ollama)
+    -> apply_finished_regions（按键注入换成空操作）
+    """
+    texts = corpus.transcripts(per_length)
+    new = load_definitions("typeinLLMNew.py")
+
+    with MockOllama(script=mock_script, latency=llm_latency) as mock:
+        async def run():
+            runtime = async_runtime.Runtime()
+            runtime.start()
+            doc = commit_worker.DocumentRegions()
+            applied = []
+
+            new.update({
+                "OLLAMA_URL": mock.url,
+                "MODEL_POLICY": llm_policy.ModelPolicy(new["OLLAMA_MODEL_TIERS"]),
+                "runtime": runtime,
+                "doc": doc,
+                "rescorer": None,
+                "recorder": None,
+                "prefiller": None,
+                "endpoint_pending": False,
+                "last_commit_time": 0.0,
+                "paste_text": lambda text: None,
+                "delete_chars": lambda n: None,
+                "replace_text": lambda n, text: applied.append(text),
+            })
+            worker = commit_worker.CommitWorker(
+                doc, new["postprocess"], on_done=lambda: runtime.post(new["apply_finished_regions"])
+            )
+            new["worker"] = worker
+            worker.start()
+
+            latencies = []
+            t0 = time.perf_counter()
+            for text in texts:
+                start = time.perf_counter()
+                doc.append_preview(text)
+                new["last_commit_time"] = 0.0
+                new["try_commit_if_needed"]()                 # 说话过程中的切句
+                new["commit_endpoint"]("silence")             # 静音端点：尾字已 flush，剩下的整段切走
+                while doc.pending:
+                    await asyncio.sleep(0.0005)
+                latencies.append(time.perf_counter() - start)
+            elapsed = time.perf_counter() - t0
+            runtime.cancel_timer("silence")
+            return elapsed, latencies, len(applied)
+
+        with _quiet():
+            elapsed, latencies, n_applied = asyncio.run(run())
+
+    latencies.sort()
+    return {
+        "ops_per_sec": len(texts) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "llm_requests": len(mock.requests),
+        "replacements": n_applied,
+    }
+
+
+# =========================
+# baseline
+# =========================
+def compare(results: dict, baseline: dict):
+    failures = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b or name in UNGATED:
+            continue
+        if "relative" not in b:
+            print(f"(baseline for {name} has no relative speed, run with --save-baseline)")
+        elif r["relative"] < b["relative"] * (1 - SPEED_TOLERANCE):
+            failures.append(f"{name}: {r['relative']:.3f} x calibration < baseline {b['relative']:.3f} "
+                            f"({r['ops_per_sec']:.0f} vs {b['ops_per_sec']:.0f} ops/s)")
+        if "peak_kib" in b and r["peak_kib"] > b["peak_kib"] * (1 + MEMORY_TOLERANCE) + 4:
+            failures.append(f"{name}: peak {r['peak_kib']:.1f} KiB > baseline {b['peak_kib']:.1f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本后处理路径吞吐基准")
+    parser.add_argument("--per-length", type=int, default=10, help="每档长度生成多少条口述")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="mock Ollama 每次生成耗时（秒）")
+    parser.add_argument("--only", help="只跑名字里包含这个子串的阶段")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    results = {}
+    calib_inputs = corpus.transcripts(args.per_length)
+    print(f"{'stage':<36}{'ops/sec':>12}{'x calib':>9}{'peak KiB':>10}{'net blocks':>12}")
+    for name, (fn, inputs) in text_stages(args.per_length).items():
+        if args.only and args.only not in name:
+            continue
+        r = results[name] = measure(fn, inputs, calib_inputs)
+        print(f"{name:<36}{r['ops_per_sec']:>12.0f}{r['relative']:>9.3f}{r['peak_kib']:>10.1f}{r['net_blocks']:>12}")
+
+    if not args.only or args.only in "commit_path":
+        r = results["commit_path"] = commit_path(args.per_length, args.llm_latency)
+        print(f"{'commit_path':<36}{r['ops_per_sec']:>12.1f}"
+              f"   p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms "
+              f"llm={r['llm_requests']} replaced={r['replacements']}  (not gated)")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"host": platform.node(), "python": platform.python_version(), "results": results},
+                      f, indent=2)
+        print(f"\n💾 baseline saved to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    except OSError:
+        print("\n(no baseline yet, run with --save-baseline)")
+        return
+
+    failures = compare(results, baseline)
+    if failures:
+        print("\n❌ regression vs baseline:")
+        for line in failures:
+            print("   " + line)
+        raise SystemExit(1)
+    print("\n✅ no regression vs baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+
+import talkie_render
+import textproc
+import transcript
+
+from benchmarks import corpus
+from benchmarks.bench_textpath import _quiet
+
+# =========================
+# 纯文本函数：性质检查 + 输出一致性
+# =========================
+#   python -m benchmarks.bench_textprops                   # 检查性质，并和存档的输出摘要比对
+#   python -m benchmarks.bench_textprops --save-baseline   # 有意改变输出之后更新摘要
+#
+# 被测函数都在 import 无副作用的模块里（textproc / transcript / talkie_render），
+# 不需要 load_definitions。输入是语料口述加上固定种子的随机模糊：
+#   口述     随机插空白 / 序号词 / 句末标点
+#   LLM 输出 outline JSON 随机截断、删字、插括号引号、单引号键、尾逗号、代码块和前后废话
+# 性质：
+#   diff_new_part          curr 去掉新增部分 = 和 prev 的公共前缀
+#   split_ordered_items    只改空白，幂等
+#   add_soft_breaks / preprocess_before_llm
+#                          只改空白；再跑一遍也只差空白（add_soft_breaks 每跑一遍会在
+#                          “第X点”前多加一个换行，脚本里 preprocess 两遍，这里锁住现状）
+#   normalize_for_guard    幂等，结果里没有空白和 #*`>-
+#   ngram_coverage         在 [0, 1]；自己对自己 = 1；目标加列表符号不变
+#   clean_json_string      幂等
+#   extract_first_json + parse_outline
+#                          outline 序列化后包上废话 / 代码块能原样解析回来；
+#                          模糊输入不抛异常，只返回 None 或合法 outline
+#   outline_to_markdown + normalize_markdown
+#                          列表行原样保留（只丢标题）；normalize_markdown 幂等
+#   render                 plain 原样返回；markdown 每个要点都在输出里
+# typeinLLM 的老口径（同样在 textproc 里）：
+#   preprocess_basic       只改空白，幂等
+#   extract_first_json(clean=False) + parse_outline(repair=False)
+#                          模糊输入只返回 None / 合法 outline，或抛 json.JSONDecodeError（调用方整段回退）；
+#                          outline 包上废话 / 代码块能原样解析回来
+# 输出一致性：每个函数在全部输入上的输出做 sha256，和 baselines/textprops.json 比，
+# 优化实现时用它确认输出一个字都没变（速度看 bench_textpath）。任一项不满足退出码 1。
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "textprops.json")
+SEED = 20240
+FUZZ_PER_TEXT = 6
+
+_NOISE = list("{}[]\",:'`\n #*-") + ["第二点", "。", "好的", "\\", "//"]
+_SPOKEN = [" ", "  ", "\t", "\n", "。", "；", "第一点", "第二点", "第三个：", "首先", "然后", "最后"]
+
+
+# =========================
+# 输入
+# =========================
+def spoken_inputs(rng: random.Random, texts):
+    out = list(texts)
+    for t in texts:
+        for _ in range(FUZZ_PER_TEXT):
+            chars = list(t)
+            for _ in range(rng.randint(1, 8)):
+                chars.insert(rng.randint(0, len(chars)), rng.choice(_SPOKEN))
+            out.append("".join(chars))
+    return out + ["", " ", "\n\n\n", "第二个：第三个：", "。-。-"]
+
+
+def outlines(texts):
+    """合法 outline（parse_outline 的输出形态：文字去过首尾空白、非空、最多 8 条）"""
+    out = []
+    for t in texts:
+        items = [it for it in corpus._items(t) if "//" not in it][:8]
+        if items:
+            out.append({"title": items[0][:12], "bullets": [
+                {"text": it, "sub": [{"text": it[:6]}] if len(it) > 12 else []} for it in items]})
+    return out
+
+
+def wrap(rng: random.Random, body: str) -> str:
+    """LLM 常见的包装：前后废话、代码块"""
+    prefix = rng.choice(["", "好的，下面是结果：\n", "```json\n", "好的：\n```json\n"])
+    suffix = rng.choice(["", "\n```", "\n```\n以上。", "\n说明：已按要求整理。"])
+    return prefix + body + suffix
+
+
+def mutate(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 6)):
+        op = rng.random()
+        pos = rng.randint(0, len(chars))
+        if op < 0.35:
+            chars.insert(pos, rng.choice(_NOISE))
+        elif op < 0.6 and chars:
+            del chars[min(pos, len(chars) - 1)]
+        elif op < 0.75:
+            chars = chars[:pos]
+        elif op < 0.9:
+            chars[pos:pos] = chars[max(0, pos - 10):pos]
+        else:
+            return "".join(chars).replace('"', "'", rng.randint(1, 4))
+    return "".join(chars)
+
+
+def llm_outputs(rng: random.Random, texts):
+    out = []
+    for t in texts:
+        for noisy in (False, True):
+            clean = corpus.outline_json(t, noisy=noisy)
+            out.append(clean)
+            out.extend(wrap(rng, mutate(rng, clean)) for _ in range(FUZZ_PER_TEXT))
+    return out + ["", "{", "}", "{}", "[]", "{{}}", "null", '{"bullets": 3}', '{"bullets": [1, "a", null]}']
+
+
+# =========================
+# 性质
+# =========================
+def _ws(s: str) -> str:
+    return re.sub(r"\s+", "", s)
+
+
+def _valid_outline(o) -> bool:
+    if o is None:
+        return True
+    return (isinstance(o.get("title"), str) and 0 < len(o["bullets"]) <= 8
+            and all(b["text"] and b["text"] == b["text"].strip() and len(b["sub"]) <= 8
+                    and all(s["text"] and s["text"] == s["text"].strip() for s in b["sub"])
+                    for b in o["bullets"]))
+
+
+def _parse_strict(text: str):
+    """typeinLLM 的解析：坏 JSON 会抛 JSONDecodeError（这里换成字符串，算合法结果）"""
+    try:
+        return textproc.parse_outline(textproc.extract_first_json(text, clean=False), repair=False)
+    except json.JSONDecodeError:
+        return "JSONDecodeError"
+
+
+def check(name: str, fn, inputs, prop, failures: list, outputs: dict):
+    """对每个输入跑 fn（parse_outline 之类的 debug print 丢掉），检查 prop(输入, 输出)；
+    异常也算失败。输出留给一致性摘要"""
+    results, bad = [], []
+    for x in inputs:
+        try:
+            with _quiet():
+                y = fn(x)
+        except Exception as e:
+            bad.append(f"{x!r:.60} raised {e!r}")
+            continue
+        results.append(y)
+        if not prop(x, y):
+            bad.append(f"{x!r:.60} -> {y!r:.60}")
+    outputs[name] = results
+    status = "ok" if not bad else f"{len(bad)} failed"
+    print(f"{name:<40}{len(inputs):>7}  {status}")
+    if bad:
+        failures.append(f"{name}: {len(bad)}/{len(inputs)} inputs violate the property, e.g. {bad[0]}")
+
+
+def run_checks(per_length: int):
+    rng = random.Random(SEED)
+    texts = corpus.transcripts(per_length)
+    spoken = spoken_inputs(rng, texts)
+    pairs = [(a, a[:rng.randint(0, len(a))] + b[:rng.randint(0, len(b))])
+             for a, b in zip(spoken, spoken[1:] + spoken[:1])]
+    trees = outlines(texts)
+    llm = llm_outputs(rng, texts)
+    mds = [textproc.outline_to_markdown(o) for o in trees] + [corpus.markdown_list(t) for t in texts] + llm
+    payloads = [corpus.render_payload(t, k) for t in texts for k in ("plain", "markdown", "latex", "mermaid")]
+
+    pre = textproc.preprocess_before_llm
+    norm = textproc.normalize_for_guard
+    failures, outputs = [], {}
+
+    def common_prefix(p):
+        prev, curr = p
+        n = 0
+        while n < min(len(prev), len(curr)) and prev[n] == curr[n]:
+            n += 1
+        return n
+
+    check("diff_new_part", lambda p: transcript.diff_new_part(*p), pairs,
+          lambda p, y: p[1][:len(p[1]) - len(y)] == p[1][:common_prefix(p)] and p[1].endswith(y),
+          failures, outputs)
+    check("split_ordered_items", textproc.split_ordered_items, spoken,
+          lambda x, y: _ws(y) == _ws(x) and textproc.split_ordered_items(y) == y, failures, outputs)
+    check("add_soft_breaks", textproc.add_soft_breaks, spoken,
+          lambda x, y: _ws(y) == _ws(x) and _ws(textproc.add_soft_breaks(y)) == _ws(y), failures, outputs)
+    check("preprocess_before_llm", pre, spoken,
+          lambda x, y: _ws(y) == _ws(x) and _ws(pre(y)) == _ws(y), failures, outputs)
+    check("normalize_for_guard", norm, spoken + mds,
+          lambda x, y: norm(y) == y and not re.search(r"[\s#*`>\-]", y), failures, outputs)
+    check("ngram_coverage", lambda p: textproc.ngram_coverage(*p), [(a, b) for a, b in zip(spoken, mds)],
+          lambda p, y: 0.0 <= y <= 1.0, failures, outputs)
+    check("ngram_coverage/self", lambda t: textproc.ngram_coverage(t, "- " + t.replace("。", "。\n- ")), spoken,
+          lambda x, y: y == (1.0 if len(norm(x)) >= 3 else 0.0), failures, outputs)
+    check("clean_json_string", textproc.clean_json_string, llm,
+          lambda x, y: textproc.clean_json_string(y) == y, failures, outputs)
+    check("extract_first_json+parse_outline",
+          lambda t: textproc.parse_outline(textproc.extract_first_json(t)), llm,
+          lambda x, y: _valid_outline(y), failures, outputs)
+    check("parse_outline/round_trip",
+          lambda o: textproc.parse_outline(textproc.extract_first_json(
+              wrap(rng, json.dumps(o, ensure_ascii=False, indent=rng.choice([None, 2]))))), trees,
+          lambda o, y: y == o, failures, outputs)
+    check("outline_to_markdown+normalize_markdown",
+          lambda o: textproc.normalize_markdown(textproc.outline_to_markdown(o)), trees,
+          lambda o, y: y == textproc.outline_to_markdown({**o, "title": ""}), failures, outputs)
+    check("normalize_markdown", textproc.normalize_markdown, mds,
+          lambda x, y: textproc.normalize_markdown(y) == y, failures, outputs)
+    check("render", talkie_render.render, payloads,
+          lambda p, y: (y == p["text"] if p["type"] == "plain" else
+                        all(i in y for b in p.get("blocks", ()) for i in b.get("items", ()))),
+          failures, outputs)
+
+    basic = textproc.preprocess_basic
+    check("preprocess_basic", basic, spoken,
+          lambda x, y: _ws(y) == _ws(x) and basic(y) == y, failures, outputs)
+    check("extract_first_json+parse_outline/strict", _parse_strict, llm,
+          lambda x, y: y == "JSONDecodeError" or _valid_outline(y), failures, outputs)
+    check("parse_outline/strict_round_trip",
+          lambda o: _parse_strict(wrap(rng, json.dumps(o, ensure_ascii=False, indent=rng.choice([None, 2])))),
+          trees, lambda o, y: y == o, failures, outputs)
+    return failures, outputs
+
+
+def digests(outputs: dict) -> dict:
+    return {name: hashlib.sha256(json.dumps(values, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+            for name, values in outputs.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="纯文本函数性质检查 + 输出一致性")
+    parser.add_argument("--per-length", type=int, default=10, help="每档长度生成多少条口述")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    print(f"{'property':<40}{'inputs':>7}")
+    failures, outputs = run_checks(args.per_length)
+    current = digests(outputs)
+
+    if args.save_baseline:
+        if failures:
+            print("\n❌ " + "\n❌ ".join(failures))
+            raise SystemExit(1)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"per_length": args.per_length, "seed": SEED, "digests": current}, f, indent=2)
+        print(f"\n💾 output digests saved to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        baseline = None
+        print("\n(no output baseline yet, run with --save-baseline)")
+    if baseline is not None:
+        if baseline.get("per_length") != args.per_length:
+            print(f"\n(baseline was saved with --per-length {baseline.get('per_length')}, parity not checked)")
+        else:
+            changed = [name for name, d in current.items() if baseline["digests"].get(name) not in (None, d)]
+            if changed:
+                failures.append("output changed vs baseline: " + ", ".join(changed))
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print("\n✅ all properties hold; outputs match the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import time
+
+import requests
+
+import metrics
+import ollama_client
+
+from benchmarks import corpus
+from benchmarks.bench_textpath import _quiet
+from benchmarks.mock_ollama import MockOllama
+
+# =========================
+# qwen3 推理 token：关掉 / 流式过滤 前后每次 commit 的输出 token 和耗时
+# =========================
+#   python -m benchmarks.bench_think
+#
+# mock 在答案前吐 --think-chars 个字的 <think> 段（每字 --char-ms 毫秒）：
+#   before   改动前的客户端：不带 think 参数、非流式，推理全部生成后再丢
+#   honor    Ollama 支持 think=false：推理根本不生成
+#   ignore   旧 Ollama 不认 think：第一次发现后改走流式过滤（推理仍然生成，但不进答案）
+#   reject   模型不支持 think 参数（本来就不推理）：第一次 400 后去掉参数重发
+# 另外检查 generate 的 stop 参数和 options 里已有的 stop 合并（脚本 OLLAMA_OPTIONS 的 stop 不能被覆盖）。
+# 任何一种输出里还有 <think>，或 honor 的 token 没有比 before 少，或 stop 被覆盖，退出码 1。
+
+
+def _script(req):
+    text = req.get("prompt", "").split("：\n", 1)[-1]
+    return "\n".join(f"- {it}" for it in corpus._items(text))
+
+
+def before(url, prompt) -> dict:
+    payload = {"model": "mock", "system": "system", "prompt": prompt, "stream": False,
+               "options": {"num_ctx": ollama_client.OLLAMA_NUM_CTX}}
+    return requests.post(url, json=payload, timeout=30).json()
+
+
+def run(case: str, prompts, think_chars: int, char_latency: float) -> dict:
+    api = "ignore" if case == "before" else case
+    think_chars = 0 if case == "reject" else think_chars
+    ollama_client._think_ignored.discard("mock")
+    ollama_client._think_unsupported.discard("mock")
+    tokens, leaked = 0, 0
+    with MockOllama(script=_script, char_latency=char_latency, think_chars=think_chars, think_api=api) as mock:
+        t0 = time.perf_counter()
+        with _quiet():
+            for prompt in prompts:
+                if case == "before":
+                    data = before(mock.url, prompt)
+                else:
+                    data = ollama_client.generate("mock", "system", prompt, url=mock.url, timeout=30)
+                tokens += data.get("eval_count") or 0
+                if case != "before" and "<think>" in data.get("response", ""):
+                    leaked += 1
+        elapsed = time.perf_counter() - t0
+    return {"tokens": tokens / len(prompts), "ms": elapsed / len(prompts) * 1000, "leaked": leaked}
+
+
+def stop_merged() -> bool:
+    """options 里的 stop 和 stop 参数都要发给服务端，去重、保持顺序"""
+    ollama_client._think_ignored.discard("mock")
+    options = {"stop": ["\n#", "<think>", "\n\n\n"]}
+    with MockOllama(script=_script) as mock, _quiet():
+        ollama_client.generate("mock", "system", "原始文本：\n第一点测试", options=options,
+                               url=mock.url, timeout=30, stop=["\n\n\n", "\n\n说明："])
+        sent = mock.requests[-1]["options"].get("stop")
+    print(f"stop sent: {sent!r}")
+    return sent == ["\n#", "<think>", "\n\n\n", "\n\n说明："] and options["stop"] == ["\n#", "<think>", "\n\n\n"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qwen3 推理 token 基准")
+    parser.add_argument("--think-chars", type=int, default=300)
+    parser.add_argument("--char-ms", type=float, default=0.3)
+    parser.add_argument("--per-length", type=int, default=5)
+    args = parser.parse_args()
+
+    prompts = ["原始文本：\n" + t for t in corpus.transcripts(args.per_length, lengths=(40, 120, 400))]
+    results = {}
+    print(f"{'case':<10}{'tokens/commit':>15}{'ms/commit':>12}")
+    for case in ("before", "honor", "ignore", "reject"):
+        r = results[case] = run(case, prompts, args.think_chars, args.char_ms / 1000)
+        print(f"{case:<10}{r['tokens']:>15.0f}{r['ms']:>12.1f}")
+
+    disabled = metrics.LLM_THINK_DISABLED.labels("mock").value
+    dropped = metrics.LLM_THINK_TOKENS.labels("mock").value
+    print(f"\nthink disabled at API: {disabled:.0f} requests, reasoning tokens dropped: {dropped:.0f}")
+
+    if not stop_merged():
+        print("\n❌ generate(stop=...) dropped the stop strings already in options")
+        raise SystemExit(1)
+
+    leaked = sum(r["leaked"] for r in results.values())
+    if leaked or results["honor"]["tokens"] >= results["before"]["tokens"]:
+        print(f"\n❌ {leaked} responses still contain <think>, or disabling thinking saved nothing")
+        raise SystemExit(1)
+    print("\n✅ no reasoning reaches the output; think=false saves "
+          f"{results['before']['tokens'] - results['honor']['tokens']:.0f} tokens/commit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import random
+import re
+import time
+
+import transcript
+
+from benchmarks import corpus
+
+# =========================
+# 长时间口述：每个 partial 的 CPU 随会话长度的变化
+# =========================
+#   python -m benchmarks.bench_transcript
+#
+# 模拟一段一直不停顿的口述（不触发 commit）：识别结果每次往后长几个字，偶尔改写最后两个字。
+# 每个 partial 做一遍 “diff 出新增 -> 追加到 preview -> 找句子切点”：
+#   string   改动前：diff_new_part 从头逐字比较，preview += ，find_sentence_cut 扫整段
+#   segment  transcript.StreamDiff + SegmentBuffer
+# 在会话长到 --sizes 各档时测每个 partial 的耗时。两边输出不一致、或 segment 在最长一档
+# 比最短一档慢 --max-growth 倍以上，退出码 1。
+
+_SENTENCE_END = "。！？!?；;"
+_ORD_MARK = re.compile(r"第[一二三四五六七八九十0-9]+[点个]")
+SAMPLE = 200                   # 每档测这么多个 partial
+
+
+def old_diff_new_part(prev: str, curr: str) -> str:
+    i = 0
+    while i < len(prev) and i < len(curr) and prev[i] == curr[i]:
+        i += 1
+    return curr[i:]
+
+
+def old_find_sentence_cut(text: str, min_chars: int) -> int:
+    cut = 0
+    for i, ch in enumerate(text):
+        if ch in _SENTENCE_END:
+            cut = i + 1
+    for m in _ORD_MARK.finditer(text):
+        if m.start() > cut:
+            cut = m.start()
+    return cut if cut >= min_chars else 0
+
+
+def hypotheses(total: int, seed: int = 7):
+    """累积的流式识别结果：每步多 2~6 个字，约 1/5 的步会改写末尾两个字"""
+    rng = random.Random(seed)
+    text = ""
+    source = "。".join(corpus.transcripts(1, lengths=(1500,)) * (total // 1000 + 2))
+    pos = 0
+    while len(text) < total:
+        if text and rng.random() < 0.2:
+            text = text[:-2] + source[pos - 2:pos][::-1]
+        step = rng.randint(2, 6)
+        text += source[pos:pos + step]
+        pos += step
+        yield text
+
+
+class StringPath:
+    def __init__(self):
+        self.last_text = ""
+        self.preview = ""
+
+    def step(self, text: str, min_chars: int):
+        new_part = old_diff_new_part(self.last_text, text)
+        self.last_text = text
+        self.preview += new_part
+        return new_part, old_find_sentence_cut(self.preview, min_chars)
+
+
+class SegmentPath:
+    def __init__(self):
+        self.diff = transcript.StreamDiff()
+        self.preview = transcript.SegmentBuffer()
+
+    def step(self, text: str, min_chars: int):
+        new_part = self.diff.update(text)
+        self.preview.append(new_part)
+        return new_part, self.preview.sentence_cut(min_chars)
+
+
+def run(path, sizes, min_chars: int):
+    """返回每档会话长度下每个 partial 的平均微秒数，以及全部输出（用于比对）"""
+    timings, outputs = {}, []
+    pending = list(sizes)
+    window = []
+    for text in hypotheses(max(sizes) + SAMPLE * 6):
+        t0 = time.perf_counter()
+        out = path.step(text, min_chars)
+        took = time.perf_counter() - t0
+        outputs.append(out)
+        if pending and len(text) >= pending[0]:
+            window.append(took)
+            if len(window) >= SAMPLE:
+                timings[pending.pop(0)] = sum(window) / len(window) * 1e6
+                window = []
+    return timings, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长会话 transcript 基准")
+    parser.add_argument("--sizes", default="1000,10000,40000", help="逗号分隔的会话字数档")
+    parser.add_argument("--min-chars", type=int, default=8)
+    parser.add_argument("--max-growth", type=float, default=3.0)
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    old, old_out = run(StringPath(), sizes, args.min_chars)
+    new, new_out = run(SegmentPath(), sizes, args.min_chars)
+
+    print(f"{'chars':>8}{'string µs':>12}{'segment µs':>12}")
+    for size in sizes:
+        print(f"{size:>8}{old[size]:>12.1f}{new[size]:>12.1f}")
+
+    failures = []
+    mismatched = sum(a != b for a, b in zip(old_out, new_out))
+    if mismatched or len(old_out) != len(new_out):
+        failures.append(f"{mismatched} partials differ between string and segment paths")
+    growth = new[sizes[-1]] / new[sizes[0]]
+    if growth > args.max_growth:
+        failures.append(f"segment per-partial cost grows {growth:.1f}x from {sizes[0]} to {sizes[-1]} chars")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        raise SystemExit(1)
+    print(f"\n✅ per-partial cost stays flat ({growth:.1f}x over the session; "
+          f"string path {old[sizes[-1]] / old[sizes[0]]:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import glob
+import os
+import time
+import wave
+
+import numpy as np
+
+import two_pass
+
+# =========================
+# 两遍识别的延迟 / 准确率对比（回放语料）
+# =========================
+# 语料目录：每条 xxx.wav（16k 单声道 int16）配一个 xxx.txt（参考文本）
+# 对每个 chunk_size：流式逐块喂入，记录每块推理耗时和首字延迟，算流式 CER；
+# 再用离线 paraformer 整段重识别，记录耗时和 CER。
+#
+#   python -m benchmarks.bench_two_pass --corpus ./replay --device cpu
+
+STREAM_MODEL = "paraformer-zh-streaming"
+CHUNK_CANDIDATES = [[0, 10, 5], [0, 8, 4], [0, 5, 5]]
+SAMPLE_RATE = 16000
+
+
+def load_wav(path: str):
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != SAMPLE_RATE or f.getsampwidth() != 2:
+            raise ValueError(f"{path}: need 16k int16 wav")
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+        if f.getnchannels() > 1:
+            data = data.reshape(-1, f.getnchannels()).mean(axis=1)
+    return data.astype(np.float32) / 32767.0
+
+
+def load_corpus(root: str):
+    items = []
+    for wav in sorted(glob.glob(os.path.join(root, "*.wav"))):
+        ref = os.path.splitext(wav)[0] + ".txt"
+        if not os.path.exists(ref):
+            continue
+        with open(ref, encoding="utf-8") as f:
+            items.append((load_wav(wav), f.read().strip()))
+    return items
+
+
+def _norm(text: str) -> str:
+    # 只比字，不比标点和空白（流式模型本来就不出标点）
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def cer(hyp: str, ref: str) -> float:
+    ref = _norm(ref)
+    return edit_distance(_norm(hyp), ref) / max(1, len(ref))
+
+
+def run_streaming(model, audio, chunk_size):
+    """返回 (全文, 每块推理耗时列表, 首个非空 partial 的音频时间点秒)"""
+    stride = chunk_size[1] * 960          # 一个 chunk = 60ms
+    cache = {}
+    text = ""
+    step_times = []
+    first_partial = None
+
+    for start in range(0, len(audio), stride):
+        block = audio[start:start + stride]
+        is_final = start + stride >= len(audio)
+        t0 = time.perf_counter()
+        res = model.generate(
+            input=block, cache=cache, is_final=is_final, chunk_size=chunk_size,
+            encoder_chunk_look_back=4, decoder_chunk_look_back=1,
+        )
+        step_times.append(time.perf_counter() - t0)
+        piece = (res[0].get("text") or "") if res else ""
+        if piece and first_partial is None:
+            # 首字延迟 = 这块音频结束的时间点 + 这块的推理耗时
+            first_partial = (start + len(block)) / SAMPLE_RATE + step_times[-1]
+        text += piece
+    return text, step_times, first_partial
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两遍识别：延迟 / 准确率对比")
+    parser.add_argument("--corpus", required=True, help="wav + txt 回放语料目录")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    items = load_corpus(args.corpus)
+    if not items:
+        raise SystemExit(f"no wav/txt pairs in {args.corpus}")
+    total_sec = sum(len(a) for a, _ in items) / SAMPLE_RATE
+    print(f"📂 {len(items)} utterances, {total_sec:.1f}s audio")
+
+    from funasr import AutoModel
+    stream_model = AutoModel(model=STREAM_MODEL, device=args.device, disable_update=True)
+    offline_model = AutoModel(model=two_pass.OFFLINE_MODEL, device=args.device, disable_update=True)
+
+    rows = []
+    for chunk_size in CHUNK_CANDIDATES:
+        steps, firsts, errs = [], [], []
+        for audio, ref in items:
+            text, step_times, first = run_streaming(stream_model, audio, chunk_size)
+            steps.extend(step_times)
+            if first is not None:
+                firsts.append(first)
+            errs.append(cer(text, ref))
+        rows.append((
+            f"stream {chunk_size}",
+            chunk_size[1] * 0.06 * 1000,
+            float(np.percentile(steps, 50)) * 1000,
+            float(np.percentile(steps, 95)) * 1000,
+            float(np.mean(firsts)) * 1000 if firsts else float("nan"),
+            float(np.mean(errs)),
+        ))
+
+    lat, errs = [], []
+    for audio, ref in items:
+        t0 = time.perf_counter()
+        res = offline_model.generate(input=audio)
+        lat.append(time.perf_counter() - t0)
+        errs.append(cer((res[0].get("text") or "") if res else "", ref))
+    rows.append((
+        f"offline {two_pass.OFFLINE_MODEL}",
+        float("nan"),
+        float(np.percentile(lat, 50)) * 1000,
+        float(np.percentile(lat, 95)) * 1000,
+        float("nan"),
+        float(np.mean(errs)),
+    ))
+
+    print()
+    print(f"{'pass':<28}{'chunk ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'first ms':>10}{'CER':>8}")
+    for name, chunk_ms, p50, p95, first, err in rows:
+        print(f"{name:<28}{chunk_ms:>10.0f}{p50:>10.1f}{p95:>10.1f}{first:>10.0f}{err:>8.3f}")
+    print("\n(offline p50/p95 = 每条整段重识别耗时，即 commit 额外等待的上限参考)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import json
+import random
+
+# =========================
+# 合成的中文口述语料（确定性，固定 seed）
+# =========================
+# 模拟 paraformer 流式输出：没有标点、夹杂语气词和口头禅、“第一点第二点”式列点，
+# 长度从一句话到几分钟的连续口述都有。同时生成对应的“LLM 输出”样本
+# （JSON 大纲 / Markdown 列表），给 parse / render 类函数用。
+
+SEED = 20240601
+LENGTHS = (12, 40, 120, 400, 1500)     # 每档目标字数
+
+_TOPICS = [
+    "这个项目的进度", "下周的发布计划", "用户反馈的问题", "数据库迁移方案", "新同事的入职安排",
+    "季度预算", "语音输入法的延迟", "模型的部署方式", "测试覆盖率", "客户演示的准备",
+]
+_CLAUSES = [
+    "我们需要先把接口定下来", "然后再去跟后端对一下", "其实这个问题上周就发现了", "就是说缓存没有及时失效",
+    "测试那边还需要两天", "文档还没有更新", "先把最重要的几个功能做完", "性能这块要再压一压",
+    "内存占用比之前高了不少", "发布之前要再跑一遍回归", "这个需求优先级比较高", "可以考虑先灰度一部分用户",
+    "日志里能看到很多超时", "配置文件要统一放到一个地方", "大家有问题可以随时提",
+]
+_FILLERS = ["嗯", "呃", "那个", "这个", "就是", "然后呢", "你知道吧", "就是说", "其实"]
+_ORDINALS = ["第一点", "第二点", "第三点", "第四点", "第五点", "第六点"]
+_LIST_WORDS = ["首先", "其次", "然后", "最后"]
+
+
+def _sentence(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        if rng.random() < 0.4:
+            parts.append(rng.choice(_FILLERS))
+        parts.append(rng.choice(_CLAUSES))
+    return "".join(parts)
+
+
+def _transcript(rng: random.Random, target: int) -> str:
+    out = "关于" + rng.choice(_TOPICS) + rng.choice(["我说几点", "我简单说一下", "大概是这样"])
+    style = rng.choice(["ordinal", "list_words", "free"])
+    i = 0
+    while len(out) < target:
+        if style == "ordinal" and i < len(_ORDINALS):
+            out += _ORDINALS[i] + rng.choice(["是", "", "就是"])
+        elif style == "list_words" and i < len(_LIST_WORDS):
+            out += _LIST_WORDS[i]
+        out += _sentence(rng)
+        if rng.random() < 0.15:
+            w = rng.choice(["这个", "那个", "就是"])
+            out += w * rng.randint(2, 3)      # 口吃式重复
+        i += 1
+    return out[: max(target, 8)]
+
+
+def transcripts(per_length: int = 20, lengths=LENGTHS, seed: int = SEED):
+    rng = random.Random(seed)
+    return [_transcript(rng, n) for n in lengths for _ in range(per_length)]
+
+
+def _items(text: str):
+    """按序号/连接词粗略切成要点（只给 mock 输出用）"""
+    for w in _ORDINALS + _LIST_WORDS:
+        text = text.replace(w, "\n")
+    for f in _FILLERS:
+        text = text.replace(f, "")
+    return [s for s in (x.strip() for x in text.split("\n")) if s] or [text]
+
+
+def outline_json(text: str, noisy: bool = False) -> str:
+    """模拟 struct 模式的 LLM 输出；noisy=True 时带上常见毛病（前后废话、代码块、尾逗号）"""
+    items = _items(text)
+    obj = {
+        "title": items[0][:12],
+        "bullets": [{"text": it, "sub": [{"text": it[:6]}] if len(it) > 12 else []} for it in items[1:] or items],
+    }
+    body = json.dumps(obj, ensure_ascii=False)
+    if noisy:
+        body = "好的，下面是结果：\n```json\n" + body.replace("]}", "],}", 1) + "\n```\n以上。"
+    return body
+
+
+def markdown_list(text: str) -> str:
+    """模拟 reorder / markdown 模式的 LLM 输出"""
+    lines = []
+    for it in _items(text):
+        lines.append(f"- {it}")
+        if len(it) > 20:
+            lines.append(f"  - {it[:10]}")
+    return "说明：以下为整理结果\n" + "\n".join(lines) + "\n"
+
+
+def render_payload(text: str, kind: str) -> dict:
+    """TalkieMore.render 的输入"""
+    items = _items(text)
+    if kind == "markdown":
+        return {"type": "markdown", "title": items[0][:12], "blocks": [
+            {"type": "paragraph", "text": items[0]},
+            {"type": "bullets", "items": items[1:] or items},
+            {"type": "steps", "items": items[:3]},
+        ]}
+    if kind == "latex":
+        return {"type": "latex", "latex": r"\frac{a^2 + b^2}{\sqrt{c}}"}
+    if kind == "mermaid":
+        return {"type": "mermaid", "diagram": "flowchart TD\n" + "\n".join(
+            f"N{i}[{it[:8]}] --> N{i + 1}" for i, it in enumerate(items))}
+    return {"type": "plain", "text": text}
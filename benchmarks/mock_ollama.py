@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================
+# 本地 mock Ollama（/api/generate），输出和延迟都可以脚本化
+# =========================
+#   with MockOllama(script=lambda req: "- 要点", latency=0.05) as mock:
+#       ollama_client.generate(..., url=mock.url)
+#
+# script(req) 返回要生成的文本；latency 是秒数或 latency(req) -> 秒数。
+# stream=True 时按 chunk_chars 个字一帧吐 NDJSON，帧间隔平摊 latency。
+# 响应里带 prompt_eval_count / eval_count / *_duration，数值和实际耗时一致。
+# concurrency=N 模拟 OLLAMA_NUM_PARALLEL：同时最多生成 N 个，其余排队。
+# options.stop / options.num_predict 和真 Ollama 一样生效（1 个字 = 1 个 token），
+# done_reason 给 "stop" / "length"；char_latency 是每生成一个字的耗时，截断就省时间。
+# think_chars>0 模拟 qwen3：答案前先吐 <think>…</think>。think_api 模拟不同版本的 Ollama：
+#   "honor"  请求带 think=false 就不推理   "ignore"  不认 think 字段，照样推理
+#   "reject" 请求里有 think 字段就回 400（模型不支持 thinking）
+# prompt_char_latency>0 模拟 prompt eval 和前缀 KV 缓存：每个模型记住上一次的 system + prompt，
+# 新请求只有公共前缀之后的字要 eval（1 个字 = 1 个 token，prompt_eval_count 也只算这部分）。
+# GET /api/tags 给健康检查用。
+
+
+def echo_prompt(req: dict) -> str:
+    """默认脚本：把 prompt 里“原始文本”之后的内容原样返回"""
+    prompt = req.get("prompt", "")
+    for marker in ("原始文本如下：\n", "原始文本：\n", "【口述内容】\n"):
+        if marker in prompt:
+            return prompt.split(marker, 1)[1].strip()
+    return prompt.strip()
+
+
+class MockOllama:
+    def __init__(self, script=echo_prompt, latency=0.0, chunk_chars: int = 4,
+                 host: str = "127.0.0.1", port: int = 0, concurrency: int = None,
+                 char_latency: float = 0.0, think_chars: int = 0, think_api: str = "honor",
+                 prompt_char_latency: float = 0.0):
+        self.script = script
+        self.think_chars = think_chars
+        self.think_api = think_api
+        self.latency = latency
+        self.char_latency = char_latency
+        self.prompt_char_latency = prompt_char_latency
+        self.kv = {}                  # model -> 上一次 eval 过的 system + prompt
+        self.chunk_chars = chunk_chars
+        self.requests = []            # 收到的请求（测试里检查 options / system 前缀用）
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(concurrency) if concurrency else None
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                req = json.loads(body or b"{}")
+                with mock.lock:
+                    mock.requests.append(req)
+                if mock.slots is None:
+                    mock.handle(self, req)
+                else:
+                    with mock.slots:
+                        mock.handle(self, req)
+
+            def do_GET(self):
+                payload = json.dumps({"models": []}).encode()
+                self.send_response(200 if self.path == "/api/tags" else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}/api/generate"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ---------- 生成 ----------
+    def _latency(self, req) -> float:
+        return self.latency(req) if callable(self.latency) else float(self.latency)
+
+    @staticmethod
+    def _limit(req, text: str):
+        """按 options.stop / num_predict 截断，返回 (text, done_reason)"""
+        opts = req.get("options") or {}
+        for s in opts.get("stop") or ():
+            if s in text:
+                text = text[:text.index(s)]
+        limit = opts.get("num_predict")
+        if limit is not None and 0 <= limit < len(text):
+            return text[:limit], "length"
+        return text, "stop"
+
+    def _prompt_eval(self, req) -> int:
+        """这次要 eval 的 prompt 字数（去掉和该模型上一次请求的公共前缀）"""
+        context = req.get("system", "") + "\x00" + req.get("prompt", "")
+        with self.lock:
+            cached = self.kv.get(req.get("model"), "")
+            self.kv[req.get("model")] = context
+        return len(context) - len(os.path.commonprefix([cached, context]))
+
+    def _stats(self, req, text: str, seconds: float, done_reason: str = "stop", evaluated: int = 0) -> dict:
+        ns = int(seconds * 1e9)
+        prompt_ns = int(self.prompt_char_latency * evaluated * 1e9) or ns // 10
+        return {
+            "model": req.get("model", ""),
+            "done": True,
+            "done_reason": done_reason,
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": prompt_ns,
+            "eval_count": max(1, len(text)),
+            "eval_duration": max(1, ns - prompt_ns),
+            "load_duration": 0,
+            "total_duration": ns,
+        }
+
+    def handle(self, h, req: dict):
+        t0 = time.perf_counter()
+        if self.think_api == "reject" and "think" in req:
+            payload = json.dumps({"error": f'"{req.get("model")}" does not support thinking'}).encode()
+            h.send_response(400)
+            h.send_header("Content-Type", "application/json")
+            h.send_header("Content-Length", str(len(payload)))
+            h.end_headers()
+            h.wfile.write(payload)
+            return
+
+        evaluated = self._prompt_eval(req)
+        prompt_delay = self.prompt_char_latency * evaluated
+        text = self.script(req)
+        if self.think_chars and not (self.think_api == "honor" and req.get("think") is False):
+            text = "<think>\n" + "嗯让我想想" * (self.think_chars // 5) + "\n</think>\n\n" + text
+        text, done_reason = self._limit(req, text)
+        delay = self._latency(req) + self.char_latency * len(text)
+
+        if not req.get("stream", True):
+            time.sleep(prompt_delay + delay)
+            data = {"response": text, **self._stats(req, text, time.perf_counter() - t0, done_reason, evaluated)}
+            payload = json.dumps(data, ensure_ascii=False).encode()
+            h.send_response(200)
+            h.send_header("Content-Type", "application/json")
+            h.send_header("Content-Length", str(len(payload)))
+            h.end_headers()
+            h.wfile.write(payload)
+            return
+
+        # 流式：chunked NDJSON，客户端提前断开就停
+        h.send_response(200)
+        h.send_header("Content-Type", "application/x-ndjson")
+        h.send_header("Transfer-Encoding", "chunked")
+        h.end_headers()
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        step = delay / len(pieces)
+        try:
+            if prompt_delay:
+                time.sleep(prompt_delay)     # 第一帧要等 prompt eval 完
+            for piece in pieces:
+                if step:
+                    time.sleep(step)
+                _write_chunk(h, {"model": req.get("model", ""), "response": piece, "done": False})
+            _write_chunk(h, {"response": "", **self._stats(req, text, time.perf_counter() - t0, done_reason,
+                                                           evaluated)})
+            h.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def _write_chunk(h, obj: dict):
+    line = json.dumps(obj, ensure_ascii=False).encode() + b"\n"
+    h.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+    h.wfile.flush()
@@ -0,0 +1,40 @@
+import ast
+import os
+
+# =========================
+# 从前端脚本里只取出“纯定义”，不执行加载模型 / 开麦克风 / 按键注入
+# =========================
+# 前端脚本是平铺的：import 时就会连 daemon、加载 paraformer、打开 InputStream。
+# 基准测试只需要里面的函数和常量，所以按 AST 过滤顶层语句：
+#   - 保留：函数 / 类定义，常量赋值（全大写或下划线开头的名字）
+#   - 保留：import（跳过 sounddevice / pyautogui / pyperclip 这类碰硬件的）
+#   - 丢掉：其它一切（模型、runtime、with InputStream、asyncio.run …）
+# 依赖被丢掉的全局变量（doc / worker / runtime …）的函数，由调用方往 namespace 里补。
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKIP_IMPORTS = {"sounddevice", "pyautogui", "pyperclip"}
+
+
+def _keep(node) -> bool:
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return True
+    if isinstance(node, ast.Import):
+        return not any(a.name.split(".")[0] in SKIP_IMPORTS for a in node.names)
+    if isinstance(node, ast.ImportFrom):
+        return (node.module or "").split(".")[0] not in SKIP_IMPORTS
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        return all(isinstance(t, ast.Name) and (t.id.isupper() or t.id.startswith("_")) for t in targets)
+    return False
+
+
+def load_definitions(script: str, namespace: dict = None) -> dict:
+    """执行 script（相对仓库根目录）里的纯定义部分，返回它的全局 namespace"""
+    path = os.path.join(ROOT, script)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    tree.body = [node for node in tree.body if _keep(node)]
+    ns = {"__name__": f"bench:{script}", "__file__": path}
+    ns.update(namespace or {})
+    exec(compile(tree, path, "exec"), ns)
+    return ns
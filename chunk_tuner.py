@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+import cpu_budget
+import live_config
+import metrics
+
+# =========================
+# 流式参数标定 + 运行时 RTF 降档
+# =========================
+# chunk 越小 preview 越快，但每秒音频要跑更多次 generate，慢机器上 RTF 会超过 1，
+# 音频越积越多。标定：在本机把每个候选档位都跑一遍，记录每 chunk 解码耗时，
+# 选“RTF 留足余量”的档位里延迟最低的那个，写进 latency_profile.json。
+# 运行时：脚本把每个 chunk 的解码耗时交给 RTFMonitor，RTF 持续偏高就降到下一档。
+#
+#   python -m chunk_tuner --device mps [--wav sample.wav]
+
+PROFILE_PATH = os.environ.get(
+    "TALKIE_PROFILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency_profile.json")
+)
+
+# 从“延迟最低、最费算力”到“最省算力”排列；降档就是往后走一格
+PROFILES = [
+    {"chunk_size": [0, 5, 5], "encoder_chunk_look_back": 4, "decoder_chunk_look_back": 1},
+    {"chunk_size": [0, 8, 4], "encoder_chunk_look_back": 4, "decoder_chunk_look_back": 1},
+    {"chunk_size": [0, 10, 5], "encoder_chunk_look_back": 4, "decoder_chunk_look_back": 1},
+    {"chunk_size": [0, 10, 5], "encoder_chunk_look_back": 2, "decoder_chunk_look_back": 1},
+    {"chunk_size": [0, 16, 8], "encoder_chunk_look_back": 2, "decoder_chunk_look_back": 0},
+]
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 960            # chunk_size 的单位：60ms
+
+CALIBRATE_SECONDS = 20.0       # 每个档位喂多少秒音频
+CALIBRATE_MAX_RTF = 0.6        # 标定选档：p95 RTF 不超过这个才算“安全”
+
+STEP_DOWN_RTF = 0.9            # 运行时：EWMA RTF 超过这个 …
+STEP_DOWN_AFTER = 5            # … 连续这么多个 chunk 就降一档
+STEP_DOWN_COOLDOWN = 20        # 降档后至少再观察这么多个 chunk
+_EWMA_ALPHA = 0.2
+
+
+def chunk_seconds(profile: dict) -> float:
+    return profile["chunk_size"][1] * FRAME_SAMPLES / SAMPLE_RATE
+
+
+def chunk_stride(profile: dict) -> int:
+    return profile["chunk_size"][1] * FRAME_SAMPLES
+
+
+def _host_key(device: str) -> str:
+    return f"{platform.node()}/{device}"
+
+
+# =========================
+# 持久化
+# =========================
+def _read_all(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_profile(device: str, path: str = PROFILE_PATH) -> dict:
+    """本机 + 该 device 的标定结果；没有（或文件坏了）返回 {}，脚本保持默认值"""
+    entry = _read_all(path).get(_host_key(device))
+    if not entry:
+        return {}
+    try:
+        profile = live_config.validate(entry["profile"])
+    except (KeyError, TypeError, live_config.ConfigError) as e:
+        print(f"⚠️ latency profile ignored ({path}): {e}")
+        return {}
+    print(f"⚙️ latency profile: {profile}")
+    return profile
+
+
+def save_profile(device: str, profile: dict, measured: list, path: str = PROFILE_PATH):
+    data = _read_all(path)
+    data[_host_key(device)] = {
+        "profile": profile,
+        "measured": measured,
+        "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# =========================
+# 运行时：RTF 监控 + 降档
+# =========================
+def _index_of(profile: dict) -> int:
+    """当前参数在 PROFILES 里的位置；不在表里就按 chunk 长度找最近的一档"""
+    for i, p in enumerate(PROFILES):
+        if all(profile.get(k) == v for k, v in p.items()):
+            return i
+    step = profile.get("chunk_size", [0, 10, 5])[1]
+    for i, p in enumerate(PROFILES):
+        if p["chunk_size"][1] >= step:
+            return i
+    return len(PROFILES) - 1
+
+
+class RTFMonitor:
+    def __init__(self, current: dict):
+        self.reset(current)
+
+    def reset(self, current: dict):
+        """参数被换掉（降档 / 热更新）后调用"""
+        self.index = _index_of(current)
+        self.chunk_sec = chunk_seconds(current)
+        self.rtf = None
+        self._over = 0
+        self._cooldown = STEP_DOWN_COOLDOWN
+
+    def observe(self, decode_seconds: float):
+        """
+        每个 chunk 解码完调用一次
+
+        需要降档时返回下一档参数（dict，键同 talkie.toml），否则返回 None。
+        """
+        rtf = decode_seconds / self.chunk_sec
+        metrics.ASR_RTF.labels("busy" if cpu_budget.llm_busy() else "idle").observe(rtf)
+        self.rtf = rtf if self.rtf is None else self.rtf + _EWMA_ALPHA * (rtf - self.rtf)
+
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return None
+
+        self._over = self._over + 1 if self.rtf > STEP_DOWN_RTF else 0
+        if self._over < STEP_DOWN_AFTER or self.index + 1 >= len(PROFILES):
+            return None
+
+        nxt = PROFILES[self.index + 1]
+        print(f"🐢 ASR RTF {self.rtf:.2f} > {STEP_DOWN_RTF} -> step down to {nxt}")
+        self.reset(nxt)
+        return {k: (list(v) if isinstance(v, list) else v) for k, v in nxt.items()}
+
+
+# =========================
+# 标定
+# =========================
+def _calibration_audio(wav_path: str = None, seconds: float = CALIBRATE_SECONDS):
+    if wav_path:
+        import wave
+        with wave.open(wav_path, "rb") as f:
+            if f.getframerate() != SAMPLE_RATE or f.getsampwidth() != 2:
+                raise SystemExit(f"{wav_path}: need 16k int16 wav")
+            audio = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32767.0
+            if f.getnchannels() > 1:
+                audio = audio.reshape(-1, f.getnchannels()).mean(axis=1)
+    else:
+        # 没给录音就用合成信号（谐波 + 噪声）；解码开销主要在编码器，和内容关系不大
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        f0 = 160 + 40 * np.sin(2 * np.pi * 0.7 * t)
+        audio = 0.1 * np.sin(2 * np.pi * np.cumsum(f0) / SAMPLE_RATE)
+        audio += 0.01 * np.random.default_rng(0).standard_normal(len(t))
+        audio = audio.astype(np.float32)
+
+    n = int(seconds * SAMPLE_RATE)
+    if len(audio) < n:
+        audio = np.tile(audio, n // max(1, len(audio)) + 1)
+    return audio[:n]
+
+
+def measure(model, profile: dict, audio) -> dict:
+    stride = chunk_stride(profile)
+    cache = {}
+    times = []
+    chunks = [audio[i:i + stride] for i in range(0, len(audio) - stride + 1, stride)]
+
+    for i, chunk in enumerate(chunks):
+        t0 = time.perf_counter()
+        model.generate(input=chunk, cache=cache, is_final=i == len(chunks) - 1, **profile)
+        times.append(time.perf_counter() - t0)
+
+    steady = times[2:] or times          # 前两个 chunk 有 warmup 开销
+    p95 = float(np.percentile(steady, 95))
+    sec = chunk_seconds(profile)
+    return {
+        "profile": profile,
+        "decode_p50_ms": round(float(np.percentile(steady, 50)) * 1000, 1),
+        "decode_p95_ms": round(p95 * 1000, 1),
+        "rtf_p95": round(p95 / sec, 3),
+        # 出字延迟 ≈ chunk + lookahead + 解码
+        "latency_ms": round(((profile["chunk_size"][1] + profile["chunk_size"][2]) * FRAME_SAMPLES
+                             / SAMPLE_RATE + p95) * 1000, 1),
+    }
+
+
+def pick(measured: list) -> dict:
+    """RTF 安全的档位里选延迟最低的；都不安全就选 RTF 最低的"""
+    safe = [m for m in measured if m["rtf_p95"] <= CALIBRATE_MAX_RTF]
+    if safe:
+        return min(safe, key=lambda m: m["latency_ms"])["profile"]
+    print(f"⚠️ no profile stays under RTF {CALIBRATE_MAX_RTF}, using the cheapest one")
+    return min(measured, key=lambda m: m["rtf_p95"])["profile"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在本机标定流式 ASR 参数（chunk_size / look_back）")
+    parser.add_argument("--device", default="mps", help='要和脚本里 load_asr_model 的 device 一致')
+    parser.add_argument("--wav", help="16k 单声道 wav（可选，默认用合成信号）")
+    parser.add_argument("--seconds", type=float, default=CALIBRATE_SECONDS)
+    parser.add_argument("--path", default=PROFILE_PATH)
+    args = parser.parse_args()
+
+    import talkie_daemon
+    model = talkie_daemon.load_asr_model(device=args.device)
+    audio = _calibration_audio(args.wav, args.seconds)
+
+    measured = []
+    print(f"{'chunk_size':<14}{'enc/dec':>8}{'p50 ms':>9}{'p95 ms':>9}{'RTF p95':>9}{'latency ms':>12}")
+    for profile in PROFILES:
+        m = measure(model, profile, audio)
+        measured.append(m)
+        print(f"{str(profile['chunk_size']):<14}"
+              f"{profile['encoder_chunk_look_back']:>4}/{profile['decoder_chunk_look_back']:<3}"
+              f"{m['decode_p50_ms']:>9}{m['decode_p95_ms']:>9}{m['rtf_p95']:>9}{m['latency_ms']:>12}")
+
+    best = pick(measured)
+    save_profile(args.device, best, measured, args.path)
+    print(f"\n✅ {_host_key(args.device)} -> {best}\n   saved to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
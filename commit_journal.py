@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+
+# =========================
+# commit 日志：每次 commit 的原文和处理结果追加写进二进制日志
+# =========================
+# 进程中途崩了、或者 LLM 把一段话改坏了，原文就只剩屏幕上贴出去的结果。
+# 这里每个 commit 记一条 (时间, 原文, 预清洗, 模式, 模型, 输出, guard 分数)：
+# - commit worker 线程里只做编码 + 放进内存队列，不碰磁盘
+# - 后台 writer 线程攒一批（GROUP_COMMIT_SECONDS 内到的）一次 write + 一次 fsync（group commit）
+# - 每条记录带长度和 crc32，崩溃时写了一半的尾巴在读的时候被丢掉；
+#   每次打开都新起一个分段文件，不往可能损坏的旧文件后面接
+# - 分段超过 ROTATE_BYTES 换新文件，只保留最近 KEEP_SEGMENTS 个
+# - 磁盘卡住时队列最多 MAX_PENDING 条，再多就丢（记 talkie_journal_dropped_total），
+#   commit 路径的开销始终有上界
+#
+# 后处理里用 note() / note_guard() 往当前 commit 上挂字段（线程局部，worker 线程里有效）。
+#
+#   python -m commit_journal list --last 20
+#   python -m commit_journal show 12
+#   python -m commit_journal export out.jsonl        # 离线重处理用
+
+DEFAULT_DIR = os.environ.get(
+    "TALKIE_JOURNAL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal")
+)
+GROUP_COMMIT_SECONDS = 0.2     # 一批最多攒这么久
+ROTATE_BYTES = 16 * 1024 * 1024
+KEEP_SEGMENTS = 32             # 16MiB x 32，够几个月的口述
+MAX_PENDING = 1024
+
+SUFFIX = ".tjl"
+_MAGIC = b"TALKJNL1"
+_FRAME = struct.Struct("<II")          # payload 长度, crc32(payload)
+_FIXED = struct.Struct("<ddB")         # 时间戳, commit 耗时, guard 分数个数
+_STR = struct.Struct("<I")
+_SCORE = struct.Struct("<d")
+_FIELDS = ("raw", "preprocessed", "mode", "model", "processed")
+
+
+# =========================
+# 编码
+# =========================
+def _pack_str(out: list, s: str):
+    b = (s or "").encode("utf-8")
+    out.append(_STR.pack(len(b)))
+    out.append(b)
+
+
+def encode(entry: dict) -> bytes:
+    guard = entry.get("guard") or {}
+    out = [_FIXED.pack(entry.get("t") or time.time(), entry.get("seconds") or 0.0, len(guard))]
+    for name in _FIELDS:
+        _pack_str(out, entry.get(name) or "")
+    for name, value in guard.items():
+        _pack_str(out, name)
+        out.append(_SCORE.pack(float(value)))
+    payload = b"".join(out)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(payload: bytes) -> dict:
+    t, seconds, n_scores = _FIXED.unpack_from(payload, 0)
+    pos = _FIXED.size
+    entry = {"t": t, "seconds": seconds}
+
+    def read_str():
+        nonlocal pos
+        (n,) = _STR.unpack_from(payload, pos)
+        pos += _STR.size
+        s = payload[pos:pos + n].decode("utf-8")
+        pos += n
+        return s
+
+    for name in _FIELDS:
+        entry[name] = read_str()
+    guard = {}
+    for _ in range(n_scores):
+        name = read_str()
+        (guard[name],) = _SCORE.unpack_from(payload, pos)
+        pos += _SCORE.size
+    entry["guard"] = guard
+    return entry
+
+
+# =========================
+# 写入
+# =========================
+class CommitJournal:
+    def __init__(self, directory: str = DEFAULT_DIR, rotate_bytes: int = ROTATE_BYTES,
+                 keep: int = KEEP_SEGMENTS, interval: float = GROUP_COMMIT_SECONDS,
+                 max_pending: int = MAX_PENDING):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.keep = keep
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._queued = 0           # 累计入队条数
+        self._durable = 0          # 累计已 fsync 条数
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._open_segment()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="journal")
+        self.thread.start()
+
+    def record(self, raw: str, processed: str, preprocessed: str = "", mode: str = "", model: str = "",
+               guard: dict = None, seconds: float = 0.0, t: float = None) -> bool:
+        """编码后入队（不等磁盘）；writer 跟不上时丢弃并返回 False"""
+        frame = encode({"t": t, "seconds": seconds, "raw": raw, "preprocessed": preprocessed,
+                        "mode": mode, "model": model, "processed": processed, "guard": guard})
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                metrics.JOURNAL_DROPPED.inc()
+                return False
+            self._pending.append(frame)
+            self._queued += 1
+            if len(self._pending) == 1:
+                self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """等到目前入队的记录都落盘"""
+        with self._cond:
+            target = self._queued
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._durable >= target or self._file is None, timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.thread.join()
+
+    # ---------- writer 线程 ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._closed:
+                    # group commit：第一条到了以后再等一会儿，让同一批的记录一起 fsync
+                    self._cond.wait_for(lambda: self._closed or len(self._pending) >= self.max_pending // 2,
+                                        self.interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._durable += len(batch)
+                if closed and not self._pending:
+                    self._file.close()
+                    self._file = None
+                    self._cond.notify_all()
+                    return
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        t0 = time.perf_counter()
+        try:
+            self._file.write(b"".join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            print(f"⚠️ commit journal write failed ({len(batch)} records lost): {e}")
+            metrics.JOURNAL_DROPPED.inc(len(batch))
+            return
+        metrics.JOURNAL_FSYNC_SECONDS.observe(time.perf_counter() - t0)
+        metrics.JOURNAL_RECORDS.inc(len(batch))
+        if self._file.tell() >= self.rotate_bytes:
+            self._file.close()
+            self._open_segment()
+
+    def _open_segment(self):
+        # 毫秒时间戳做文件名：按名字排序 = 按时间排序；同一毫秒就往后挪
+        stamp = int(time.time() * 1000)
+        while os.path.exists(self._segment_path(stamp)):
+            stamp += 1
+        path = self._segment_path(stamp)
+        self._file = open(path, "xb")
+        self._file.write(_MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        _fsync_dir(self.directory)
+        self.path = path
+
+        for old in segments(self.directory)[:-self.keep]:
+            try:
+                os.unlink(old)
+            except OSError:
+                pass
+
+    def _segment_path(self, stamp: int) -> str:
+        return os.path.join(self.directory, f"{stamp:013d}{SUFFIX}")
+
+
+def _fsync_dir(directory: str):
+    """新建文件后 fsync 目录，文件名本身才算落盘（Windows 上打不开目录，跳过）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# =========================
+# 当前 commit 的字段（worker 线程局部）
+# =========================
+_trace = threading.local()
+
+
+def begin():
+    _trace.fields = {}
+
+
+def note(**fields):
+    """后处理过程中给当前 commit 记字段（preprocessed / mode / model）；不在 commit 里时忽略"""
+    current = getattr(_trace, "fields", None)
+    if current is not None:
+        current.update(fields)
+
+
+def note_guard(**scores):
+    current = getattr(_trace, "fields", None)
+    if current is not None:
+        current.setdefault("guard", {}).update(scores)
+
+
+def end() -> dict:
+    fields = getattr(_trace, "fields", None) or {}
+    _trace.fields = None
+    return fields
+
+
+# =========================
+# 读取（恢复 / 离线重处理）
+# =========================
+def segments(directory: str = DEFAULT_DIR):
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(SUFFIX))
+    except OSError:
+        return []
+    return [os.path.join(directory, n) for n in names]
+
+
+def read_segment(path: str):
+    """逐条读一个分段；遇到截断 / crc 不对的尾巴（崩溃时写了一半）就停"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        raise ValueError(f"{path}: not a talkie commit journal")
+    pos = len(_MAGIC)
+    while pos + _FRAME.size <= len(data):
+        size, crc = _FRAME.unpack_from(data, pos)
+        start = pos + _FRAME.size
+        payload = data[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            print(f"⚠️ {os.path.basename(path)}: torn record at byte {pos}, {len(data) - pos} bytes skipped")
+            return
+        entry = decode(payload)
+        entry["segment"] = os.path.basename(path)
+        entry["offset"] = pos
+        yield entry
+        pos = start + size
+
+
+def read(directory: str = DEFAULT_DIR, since: float = None):
+    """按时间顺序读出全部记录；since 给时间戳则只要之后的"""
+    for path in segments(directory):
+        for entry in read_segment(path):
+            if since is None or entry["t"] >= since:
+                yield entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看 / 导出 commit 日志")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list")
+    ls.add_argument("--last", type=int, default=0, help="只看最后 N 条")
+    show = sub.add_parser("show")
+    show.add_argument("index", type=int, help="list 里的序号")
+    exp = sub.add_parser("export")
+    exp.add_argument("out", help=".jsonl，每行一条记录")
+    args = parser.parse_args()
+
+    entries = list(read(args.dir))
+
+    if args.cmd == "list":
+        start = max(0, len(entries) - args.last) if args.last else 0
+        for i in range(start, len(entries)):
+            e = entries[i]
+            when = time.strftime("%m-%d %H:%M:%S", time.localtime(e["t"]))
+            scores = " ".join(f"{k}={v:.2f}" for k, v in e["guard"].items())
+            print(f"{i:>5}  {when}  {e['mode']:<14} {e['model']:<12} {scores:<24} {e['raw'][:40]!r}")
+        return
+
+    if args.cmd == "show":
+        if not 0 <= args.index < len(entries):
+            raise SystemExit(f"no record #{args.index} ({len(entries)} in the journal)")
+        print(json.dumps(entries[args.index], ensure_ascii=False, indent=2))
+        return
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+    print(f"✅ {len(entries)} records -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
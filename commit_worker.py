@@ -0,0 +1,149 @@
+import threading
+import time
+from queue import Queue
+
+import commit_journal
+import metrics
+import transcript
+
+# =========================
+# 后台 commit：文档区域归属 + worker 线程
+# =========================
+# 光标之前“还没定稿”的内容被拆成若干 region，每段只有一个主人：
+# - preview（末尾）：主线程独占，新识别的字直接追加
+# - 已切出的 region：交给 worker 做后处理，主线程只读
+# worker 只算结果，不碰屏幕；主线程在自己的循环里一次性把队首已完成的
+# region 删掉重贴（后面的原文原样重贴），所以替换是原子的，preview 不会被打断。
+# preview 存在 transcript.SegmentBuffer 里（追加 O(1)，句子切点增量维护）；
+# 所有 region 在屏幕上的总字数单独记账，替换时不用逐个求和。
+# 给了 journal 时每个 region 处理完记一条（原文 + 结果 + 后处理里 note 的字段，见 commit_journal.py）。
+
+
+class Region:
+    __slots__ = ("raw", "len", "processed", "second_pass")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.len = len(raw)          # 屏幕上占的字符数（=原文长度）
+        self.processed = None        # None = worker 处理中
+        self.second_pass = None      # 可选：离线重识别的 Future（见 two_pass.py）
+
+
+def _as_block(text: str) -> str:
+    """列表/多行结果后面补换行，避免和下一段粘在同一行"""
+    if "\n" in text or text.lstrip().startswith("-"):
+        return text.rstrip("\n") + "\n"
+    return text
+
+
+class DocumentRegions:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.regions = []    # 已交给 worker 的 region，按文档顺序
+        self.on_screen = 0   # 这些 region 在屏幕上占的总字数
+        self._preview = transcript.SegmentBuffer()   # 末尾 preview（主线程独占）
+
+    @property
+    def preview(self) -> str:
+        """preview 全文（要 join，热路径上用 preview_len / sentence_cut）"""
+        return self._preview.text()
+
+    @property
+    def preview_len(self) -> int:
+        return len(self._preview)
+
+    @property
+    def preview_visible(self) -> int:
+        """preview 里的非空白字数"""
+        return self._preview.visible
+
+    def sentence_cut(self, min_chars: int = 0) -> int:
+        return self._preview.sentence_cut(min_chars)
+
+    @property
+    def pending(self) -> int:
+        with self.lock:
+            return len(self.regions)
+
+    def append_preview(self, text: str):
+        with self.lock:
+            self._preview.append(text)
+
+    def cut(self, n: int = None) -> Region:
+        """把 preview 前 n 个字符（默认全部）移交给 worker"""
+        with self.lock:
+            region = Region(self._preview.take(n))
+            self.regions.append(region)
+            self.on_screen += region.len
+        return region
+
+    def finish(self, region: Region, processed: str):
+        with self.lock:
+            region.processed = _as_block(processed)
+
+    def take_finished(self):
+        """
+        取出队首所有已完成的 region
+
+        返回 (要回删的字符数, 要粘贴的文本, 完成的 region 数)；没有完成的返回 None。
+        """
+        with self.lock:
+            n_done = 0
+            for region in self.regions:
+                if region.processed is None:
+                    break
+                n_done += 1
+            if not n_done:
+                return None
+
+            done = self.regions[:n_done]
+            del self.regions[:n_done]
+
+            chars_to_delete = self.on_screen + len(self._preview)
+            self.on_screen -= sum(r.len for r in done)
+            replacement = (
+                "".join(r.processed for r in done)
+                + "".join(r.raw for r in self.regions)
+                + self._preview.text()
+            )
+        return chars_to_delete, replacement, n_done
+
+
+class CommitWorker:
+    """单线程按顺序处理 region：postprocess(raw) -> processed"""
+
+    def __init__(self, doc: DocumentRegions, postprocess, on_done=None, prepare=None, journal=None):
+        self.doc = doc
+        self.postprocess = postprocess
+        self.on_done = on_done       # 每完成一个 region 调一次（在 worker 线程里）
+        self.prepare = prepare       # 可选：prepare(region) -> 送去后处理的原文（如第二遍识别结果）
+        self.journal = journal       # 可选：commit_journal.CommitJournal，每个 region 记一条
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, region: Region):
+        self.queue.put(region)
+
+    def _run(self):
+        while True:
+            region = self.queue.get()
+            t0 = time.perf_counter()
+            raw = region.raw
+            commit_journal.begin()
+            try:
+                raw = self.prepare(region) if self.prepare is not None else region.raw
+                processed = self.postprocess(raw)
+            except Exception as e:
+                print("⚠️ commit worker failed:", repr(e))
+                processed = region.raw
+            seconds = time.perf_counter() - t0
+            metrics.COMMIT_SECONDS.observe(seconds)
+            fields = commit_journal.end()
+            if self.journal is not None:
+                self.journal.record(raw, processed or region.raw, seconds=seconds, **fields)
+            self.doc.finish(region, processed or region.raw)
+            if self.on_done is not None:
+                self.on_done()
@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import threading
+
+# =========================
+# CPU 预算：给流式 ASR 留几个专用核，其余给 LLM
+# =========================
+# 纯 CPU 机器上 paraformer（PyTorch/OpenMP）和 Ollama runner 默认都按“全部核”开线程，
+# commit 时两边抢核，chunk 解码超过实时、preview 卡住。这里把核分成两份：
+#   - ASR：ASR executor 线程绑到 asr_cores（它之后创建的 OpenMP 线程继承亲和性），
+#     torch 线程数 = len(asr_cores)
+#   - LLM：进程里其它线程绑到 llm_cores；Ollama 请求带 num_thread = len(llm_cores)；
+#     能找到本机 ollama 进程时也把它绑到 llm_cores
+# macOS 没有 sched_setaffinity，只设线程数。
+#
+# 按主机配置（cpu_budget.json，路径可用 TALKIE_CPU_BUDGET 改）：
+#   {"my-box": {"asr_cores": [6, 7]}}
+# 没配置时 device == "cpu" 按核数自动分（最后两个核给 ASR），其它 device 不动。
+#
+#   python -m cpu_budget                     # 看本机会怎么分
+#   python -m cpu_budget --asr-cores 6,7     # 写进本机配置
+
+BUDGET_PATH = os.environ.get(
+    "TALKIE_CPU_BUDGET", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpu_budget.json")
+)
+DEFAULT_ASR_CORES = 2
+PIN_OLLAMA = True              # 尝试把本机 ollama 进程绑到 LLM 核（没权限就跳过）
+
+current = None                 # apply() 之后的生效预算（ollama_client 读它决定 num_thread）
+
+
+class Budget:
+    def __init__(self, asr_cores, llm_cores):
+        self.asr_cores = sorted(asr_cores)
+        self.llm_cores = sorted(llm_cores)
+
+    @property
+    def asr_threads(self) -> int:
+        return len(self.asr_cores)
+
+    @property
+    def llm_threads(self) -> int:
+        return len(self.llm_cores)
+
+    def __repr__(self):
+        return f"Budget(asr={self.asr_cores}, llm={self.llm_cores})"
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan(asr_cores=None, cores=None):
+    """asr_cores: 核编号列表或个数；核太少（<2）返回 None，不做划分"""
+    cores = cores or available_cores()
+    if len(cores) < 2:
+        return None
+    if asr_cores is None:
+        asr_cores = DEFAULT_ASR_CORES if len(cores) >= 4 else 1
+    if isinstance(asr_cores, int):
+        asr_cores = cores[-asr_cores:]      # 0 号核通常还要处理中断，ASR 用编号靠后的
+    asr = [c for c in asr_cores if c in cores]
+    llm = [c for c in cores if c not in asr]
+    if not asr or not llm:
+        raise ValueError(f"asr_cores {asr_cores} must be a proper subset of {cores}")
+    return Budget(asr, llm)
+
+
+# =========================
+# 持久化（按主机）
+# =========================
+def _read_all(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load(device: str = "cpu", path: str = BUDGET_PATH):
+    entry = _read_all(path).get(platform.node())
+    try:
+        if entry:
+            return plan(entry["asr_cores"])
+        return plan() if device == "cpu" else None
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"⚠️ cpu budget ignored ({path}): {e}")
+        return None
+
+
+def save(asr_cores, path: str = BUDGET_PATH):
+    data = _read_all(path)
+    data[platform.node()] = {"asr_cores": sorted(asr_cores)}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+# =========================
+# 生效
+# =========================
+def pin_current_thread(cores) -> bool:
+    """Linux 上 pid=0 只影响调用线程；之后它创建的线程继承亲和性"""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+def init_asr_thread(budget: Budget):
+    """ASR executor 的 initializer：在 ASR 线程里执行，第一次推理之前"""
+    pin_current_thread(budget.asr_cores)
+    try:
+        import torch
+        torch.set_num_threads(budget.asr_threads)
+    except ImportError:
+        pass
+
+
+def pin_ollama(budget: Budget) -> int:
+    """把本机 ollama 进程（含 runner）的所有线程绑到 LLM 核，返回绑了几个进程"""
+    if not hasattr(os, "sched_setaffinity") or not os.path.isdir("/proc"):
+        return 0
+    pinned = 0
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                if not f.read().startswith("ollama"):
+                    continue
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                os.sched_setaffinity(int(tid), budget.llm_cores)
+            pinned += 1
+        except OSError:
+            continue
+    return pinned
+
+
+def apply(budget: Budget):
+    """
+    在主线程、加载 ASR 模型和创建 executor 之前调用：
+    主线程（以及之后创建的非 ASR 线程）-> LLM 核，Ollama 请求的 num_thread -> LLM 核数
+    """
+    global current
+    if budget is None:
+        return
+    current = budget
+    # 环境变量只对之后才初始化的 OpenMP / MKL 生效，所以要在 import torch 之前
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(budget.asr_threads))
+    pinned = pin_current_thread(budget.llm_cores)
+    n = pin_ollama(budget) if PIN_OLLAMA and pinned else 0
+    print(f"🧮 cpu budget: ASR {budget.asr_cores} / LLM {budget.llm_cores}"
+          f"{'' if pinned else ' (thread counts only, no affinity on this OS)'}"
+          f"{f', pinned {n} ollama process(es)' if n else ''}")
+
+
+# =========================
+# 争用观测：LLM 是否正在生成
+# =========================
+# ollama_client / daemon 代发时标记在途的 LLM 请求；ASR RTF 按 busy / idle 分开记，
+# 两者差距就是 LLM 对流式识别的影响
+_llm_active = 0
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def llm_active():
+    global _llm_active
+    with _lock:
+        _llm_active += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _llm_active -= 1
+
+
+def llm_busy() -> bool:
+    return _llm_active > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASR / LLM 核划分")
+    parser.add_argument("--asr-cores", help="逗号分隔的核编号（如 6,7），写进本机配置")
+    parser.add_argument("--path", default=BUDGET_PATH)
+    args = parser.parse_args()
+
+    if args.asr_cores:
+        cores = [int(c) for c in args.asr_cores.split(",")]
+        budget = plan(cores)
+        save(budget.asr_cores, args.path)
+        print(f"💾 saved for {platform.node()}: {budget}")
+        return
+    print(f"{platform.node()}: cores {available_cores()} -> {load(path=args.path)}")
+
+
+if __name__ == "__main__":
+    main()
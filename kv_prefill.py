@@ -0,0 +1,94 @@
+import threading
+import time
+
+# =========================
+# 说话过程中预热 Ollama 的 KV 缓存（speculative prefill）
+# =========================
+# 用户还在说话时 runner 是空闲的，静音触发 commit 之后才从头 eval 整段 prompt，
+# 长口述光 prompt eval 就要等好几百毫秒。这里在说话过程中定期把 commit 时会发的
+# system + prompt（按当前 preview 拼）送去只做 prompt eval（ollama_client.prefill）：
+# Ollama 按前缀复用 KV，commit 时只剩最后新增的几个字和 decode。
+#
+# - 事件循环里 offer() 只比较长度和时间，条件都满足才取 preview 文本交给后台线程：
+#     preview 至少 MIN_CHARS 字（短 prompt 的 eval 本来就快）
+#     比上次 prefill 多了至少 MIN_NEW_CHARS 字，且距上次至少 INTERVAL 秒
+#     上一个 prefill 已经回来（不排队：下一个 partial 再试）
+#     busy() 为假（有 commit 在跑时别跟它抢 runner）
+# - commit 把 preview 切走后调 reset()，从头算
+# - send(text) 由前端脚本提供：按 postprocess 第一次 LLM 调用的方式拼 prompt 再发；
+#   失败只打印（连续失败只打一次），不影响 commit
+
+PREFILL_INTERVAL = 1.0
+PREFILL_MIN_CHARS = 40
+PREFILL_MIN_NEW_CHARS = 12
+
+
+class Prefiller:
+    def __init__(self, send, busy=None, interval: float = PREFILL_INTERVAL,
+                 min_chars: int = PREFILL_MIN_CHARS, min_new_chars: int = PREFILL_MIN_NEW_CHARS):
+        self.send = send
+        self.busy = busy
+        self.interval = interval
+        self.min_chars = min_chars
+        self.min_new_chars = min_new_chars
+
+        self.sent = 0                # 发出去的次数
+        self._sent_len = 0           # 上次 prefill 时的 preview 长度
+        self._last = float("-inf")
+        self._failing = False
+
+        self._cond = threading.Condition()
+        self._next = None
+        self._running = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name="prefill")
+        self.thread.start()
+
+    def offer(self, length: int, text) -> bool:
+        """
+        preview 长了（事件循环里调）；length 是当前 preview 字数，text() 按需取全文
+
+        真的交给后台线程时返回 True。
+        """
+        if length < self.min_chars or length - self._sent_len < self.min_new_chars:
+            return False
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return False
+        if self.busy is not None and self.busy():
+            return False
+        with self._cond:
+            if self._running:
+                return False
+            self._next = text()
+            self._running = True
+            self._cond.notify()
+        self._sent_len = length
+        self._last = now
+        self.sent += 1
+        return True
+
+    def reset(self):
+        """preview 被 commit 切走了：下一段从头算"""
+        self._sent_len = 0
+
+    def idle(self, timeout: float = None) -> bool:
+        """等在跑的 prefill 回来（基准里用）"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._running, timeout)
+
+    # ---------- 后台线程 ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._next is not None)
+                text, self._next = self._next, None
+            try:
+                self.send(text)
+                self._failing = False
+            except Exception as e:
+                if not self._failing:
+                    print(f"⚠️ KV prefill failed (commits are unaffected): {e!r}")
+                self._failing = True
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
@@ -0,0 +1,129 @@
+import os
+import threading
+import tomllib
+
+# =========================
+# 运行时可热更新的配置（talkie.toml）
+# =========================
+# - 只覆盖文件里写了的键，没写的保持脚本里的默认值
+# - 每个键有类型 + 取值校验，文件写错时打印原因并保留旧配置
+# - watcher 线程轮询 mtime，变化后只把“改了的键”交给脚本的 apply 回调
+# - 流式参数（chunk_size 等）变化只需要清 ASR cache，不重建 AutoModel
+
+DEFAULT_PATH = os.environ.get(
+    "TALKIE_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "talkie.toml")
+)
+POLL_INTERVAL = 0.2
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _is_chunk_size(v) -> bool:
+    return len(v) == 3 and all(isinstance(x, int) and x >= 0 for x in v) and v[1] > 0
+
+
+def _is_model_list(v) -> bool:
+    return len(v) > 0 and all(isinstance(x, str) and x for x in v)
+
+
+# 配置键 -> (脚本里的全局变量名, 类型, 校验, 说明)
+FIELDS = {
+    "silence_timeout": ("SILENCE_TIMEOUT", float, lambda v: 0.1 <= v <= 10, "0.1~10 秒"),
+    "energy_threshold": ("ENERGY_THRESHOLD", float, lambda v: 0 < v < 1, "0~1"),
+    "min_commit_gap": ("MIN_COMMIT_GAP", float, lambda v: 0 <= v <= 10, "0~10 秒"),
+    "llm_mode": ("LLM_MODE", str, lambda v: v in ("clean", "markdown", "smart_markdown"),
+                 "clean / markdown / smart_markdown"),
+    "ollama_model_tiers": ("OLLAMA_MODEL_TIERS", list, _is_model_list, "非空模型名列表（便宜 → 贵）"),
+    "safe_sim_high": ("SAFE_SIM_HIGH", float, lambda v: 0 <= v <= 1, "0~1"),
+    "safe_sim_low": ("SAFE_SIM_LOW", float, lambda v: 0 <= v <= 1, "0~1"),
+    "safe_ngram_cov": ("SAFE_NGRAM_COV", float, lambda v: 0 <= v <= 1, "0~1"),
+    "safe_len_ratio_min": ("SAFE_LEN_RATIO_MIN", float, lambda v: 0 <= v <= 10, "0~10"),
+    "safe_len_ratio_max": ("SAFE_LEN_RATIO_MAX", float, lambda v: 0 < v <= 10, "0~10"),
+    "chunk_size": ("chunk_size", list, _is_chunk_size, "3 个非负整数，中间 > 0，如 [0, 10, 5]"),
+    "encoder_chunk_look_back": ("encoder_chunk_look_back", int, lambda v: 0 <= v <= 16, "0~16"),
+    "decoder_chunk_look_back": ("decoder_chunk_look_back", int, lambda v: 0 <= v <= 16, "0~16"),
+}
+
+STREAMING_KEYS = {"chunk_size", "encoder_chunk_look_back", "decoder_chunk_look_back"}
+
+
+def validate(raw: dict) -> dict:
+    out = {}
+    for key, value in raw.items():
+        if key not in FIELDS:
+            raise ConfigError(f"unknown key: {key}")
+        _, typ, check, hint = FIELDS[key]
+
+        if typ is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if not isinstance(value, typ) or isinstance(value, bool):
+            raise ConfigError(f"{key} must be {typ.__name__}, got {value!r}")
+        if not check(value):
+            raise ConfigError(f"{key}={value!r} out of range ({hint})")
+        out[key] = value
+
+    lo = out.get("safe_len_ratio_min")
+    hi = out.get("safe_len_ratio_max")
+    if lo is not None and hi is not None and lo >= hi:
+        raise ConfigError("safe_len_ratio_min must be < safe_len_ratio_max")
+    return out
+
+
+def load_config(path: str = DEFAULT_PATH) -> dict:
+    with open(path, "rb") as f:
+        raw = tomllib.load(f)
+    return validate(raw)
+
+
+def snapshot(namespace: dict) -> dict:
+    """从脚本 globals() 里取出当前值（脚本没有的键跳过）"""
+    return {key: namespace[name] for key, (name, *_) in FIELDS.items() if name in namespace}
+
+
+def apply_to(namespace: dict, changes: dict):
+    """把变更写回脚本 globals()（函数都是调用时读全局变量，写回即生效）"""
+    for key, value in changes.items():
+        namespace[FIELDS[key][0]] = value
+
+
+class ConfigWatcher:
+    def __init__(self, current: dict, on_change, path: str = DEFAULT_PATH, interval: float = POLL_INTERVAL):
+        self.path = path
+        self.current = dict(current)
+        self.on_change = on_change     # on_change(changes: dict)，在 watcher 线程里调用
+        self.interval = interval
+        self._mtime = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+            self._stop.wait(self.interval)
+
+    def reload(self):
+        try:
+            new = load_config(self.path)
+        except (OSError, tomllib.TOMLDecodeError, ConfigError) as e:
+            print(f"⚠️ config not applied ({self.path}): {e}")
+            return
+
+        changes = {k: v for k, v in new.items() if self.current.get(k) != v}
+        if not changes:
+            return
+        self.current.update(changes)
+        self.on_change(changes)
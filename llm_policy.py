@@ -0,0 +1,224 @@
+import threading
+import time
+
+import requests
+
+import metrics
+import ollama_client
+
+# =========================
+# 模型分级 + 每次 commit 的延迟 deadline
+# =========================
+# tiers 从便宜到贵排列。每次调用根据：输入长度、路由模式、最近实测 tokens/sec
+# 选一个预计能在 deadline 内跑完的档位；超时就降一档重试，
+# 连最便宜的档位也来不及就抛 DeadlineExceeded，由调用方退回 raw_clean。
+# 降档要真的来得及：还有更便宜的档位时，这一档最多用剩余时间的 (1 - FALLBACK_RESERVE)，
+# 剩下的留给下一档（选档也按留出后的时间估）。
+#
+# 生成预算：改写 N 个字的输出本来就不该比 N 个 token 多太多，所以每次调用都带
+# num_predict = BASE + 输入字数 × 比例上限。比例上限冷启动用 OUTPUT_RATIO × 2（宽松），
+# 之后按该 mode 实测的 输出 token / 输入字数（EWMA 均值 + 3 倍偏差）收紧。
+# 撞到上限（done_reason == "length"）算失控生成：计数并抛 RunawayGeneration，调用方回退。
+
+DEFAULT_TIERS = ["qwen3:0.6b", "qwen3:1.7b"]
+
+# 结构类任务默认用最高档，纯清洗/短文本用最低档
+HEAVY_MODES = {"reorder", "struct", "markdown", "mermaid", "latex"}
+SMALL_INPUT_CHARS = 40
+
+# 输出 token / 输入字符 的经验比例（JSON 包装会更长）
+OUTPUT_RATIO = {
+    "clean": 1.1,
+    "plain": 1.5,
+    "markdown": 1.4,
+    "reorder": 1.3,
+    "struct": 1.8,
+    "latex": 1.5,
+    "mermaid": 2.0,
+}
+
+NUM_PREDICT_BASE = 48         # 固定开销（JSON 包装、列表符号）
+NUM_PREDICT_MAX = 4096
+COLD_RATIO_FACTOR = 2.0        # 冷启动：比例上限 = OUTPUT_RATIO × 这个
+RATIO_MIN_SAMPLES = 5          # 某 mode 观测到这么多次成功生成后才用实测上限
+RATIO_SPREAD = 3.0             # 实测上限 = 均值 + RATIO_SPREAD × 平均偏差
+
+# deadline = BASE + 每字符预算，封顶 MAX（秒）
+DEADLINE_BASE = 3.0
+DEADLINE_PER_CHAR = 0.05
+DEADLINE_MAX = 20.0
+MIN_CALL_SECONDS = 0.5        # 剩余时间不够一次调用就直接放弃
+FALLBACK_RESERVE = 0.35       # 不是最便宜档时，剩余时间至少留这个比例给降档
+
+_EWMA_ALPHA = 0.3
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class GuardAbort(RuntimeError):
+    """流式 guard 判定输出过不了，生成被提前断开"""
+
+
+class RunawayGeneration(RuntimeError):
+    """生成撞到 num_predict 上限：输出被截断，不能用"""
+
+
+def deadline_for(text: str) -> float:
+    """返回本次 commit 的绝对 deadline（time.monotonic 时间）"""
+    budget = min(DEADLINE_MAX, DEADLINE_BASE + len(text or "") * DEADLINE_PER_CHAR)
+    return time.monotonic() + budget
+
+
+def remaining(deadline) -> float:
+    if deadline is None:
+        return float("inf")
+    return deadline - time.monotonic()
+
+
+def expired(deadline) -> bool:
+    return remaining(deadline) < MIN_CALL_SECONDS
+
+
+class ModelPolicy:
+    def __init__(self, tiers=None, default_tps: float = 30.0, default_overhead: float = 0.5):
+        self.tiers = list(tiers or DEFAULT_TIERS)
+        self.lock = threading.Lock()
+        # 冷启动用默认值，之后用 EWMA 跟踪实测
+        self.tok_per_sec = {m: default_tps * (len(self.tiers) - i) for i, m in enumerate(self.tiers)}
+        self.overhead = {m: default_overhead for m in self.tiers}
+        # mode -> (输出/输入 比例的 EWMA 均值, EWMA 平均偏差, 样本数)
+        self.ratio = {}
+
+    def set_tiers(self, tiers):
+        """热更新档位列表；已经测过速度的模型保留统计"""
+        with self.lock:
+            old_tps, old_overhead = self.tok_per_sec, self.overhead
+            self.tiers = list(tiers)
+            default_tps = min(old_tps.values()) if old_tps else 30.0
+            self.tok_per_sec = {m: old_tps.get(m, default_tps) for m in self.tiers}
+            self.overhead = {m: old_overhead.get(m, 0.5) for m in self.tiers}
+
+    def observe(self, model: str, data: dict, mode: str = None, input_chars: int = 0):
+        """用 Ollama 返回的 eval_count / eval_duration 更新该档位速度（和该 mode 的输出比例）"""
+        eval_count = data.get("eval_count") or 0
+        eval_ns = data.get("eval_duration") or 0
+        overhead_ns = (data.get("prompt_eval_duration") or 0) + (data.get("load_duration") or 0)
+
+        with self.lock:
+            if eval_count and eval_ns:
+                tps = eval_count / (eval_ns / 1e9)
+                old = self.tok_per_sec.get(model, tps)
+                self.tok_per_sec[model] = old + _EWMA_ALPHA * (tps - old)
+            old = self.overhead.get(model, overhead_ns / 1e9)
+            self.overhead[model] = old + _EWMA_ALPHA * (overhead_ns / 1e9 - old)
+
+            # 截断的生成不代表真实比例，不计入
+            answer_tokens = eval_count - (data.get("think_tokens") or 0)
+            if mode and input_chars and answer_tokens > 0 and data.get("done_reason") not in ("length", "guard"):
+                r = answer_tokens / input_chars
+                mean, dev, n = self.ratio.get(mode, (r, 0.0, 0))
+                self.ratio[mode] = (mean + _EWMA_ALPHA * (r - mean),
+                                    dev + _EWMA_ALPHA * (abs(r - mean) - dev), n + 1)
+
+    def _mean_ratio(self, mode: str) -> float:
+        mean, _, n = self.ratio.get(mode, (0.0, 0.0, 0))
+        return mean if n >= RATIO_MIN_SAMPLES else OUTPUT_RATIO.get(mode, 1.3)
+
+    def num_predict(self, text_len: int, mode: str) -> int:
+        """本次调用的生成 token 上限"""
+        cold = OUTPUT_RATIO.get(mode, 1.3) * COLD_RATIO_FACTOR
+        with self.lock:
+            mean, dev, n = self.ratio.get(mode, (0.0, 0.0, 0))
+        cap = min(cold, mean + RATIO_SPREAD * dev) if n >= RATIO_MIN_SAMPLES else cold
+        return min(NUM_PREDICT_MAX, int(NUM_PREDICT_BASE + text_len * cap))
+
+    def estimate(self, model: str, text_len: int, mode: str) -> float:
+        """预计本次调用耗时（秒）"""
+        with self.lock:
+            tokens = text_len * self._mean_ratio(mode)
+            return self.overhead[model] + tokens / max(self.tok_per_sec[model], 1e-3)
+
+    def choose(self, text_len: int, mode: str, deadline=None) -> str:
+        want = 0
+        if mode in HEAVY_MODES or text_len > SMALL_INPUT_CHARS:
+            want = len(self.tiers) - 1
+
+        # 有更便宜的档位可降时，只能用留出降档时间之后的那部分
+        budget = remaining(deadline) * (1 - FALLBACK_RESERVE) * 0.8
+        while want > 0 and self.estimate(self.tiers[want], text_len, mode) > budget:
+            want -= 1
+        return self.tiers[want]
+
+    def cheaper(self, model: str):
+        i = self.tiers.index(model) if model in self.tiers else 0
+        return self.tiers[i - 1] if i > 0 else None
+
+
+def generate_tiered(policy: ModelPolicy, system: str, prompt: str, mode: str,
+                    deadline=None, timeout: float = 40, options: dict = None,
+                    url: str = ollama_client.OLLAMA_URL, stop=None, format: str = None,
+                    guard: dict = None) -> dict:
+    """
+    选档位调用 Ollama；超时降一档，deadline 用完抛 DeadlineExceeded
+
+    num_predict 按输入长度和 mode 自动给（见 ModelPolicy.num_predict），
+    stop / format 原样传给 Ollama；撞到上限抛 RunawayGeneration。
+    guard（stream_guard 规格）给了就边生成边检查，过不了抛 GuardAbort。
+    返回的 dict 额外带一个 "model" 字段，表示最终用的是哪一档。
+    """
+    model = policy.choose(len(prompt), mode, deadline)
+    options = {**(options or {}), "num_predict": policy.num_predict(len(prompt), mode)}
+
+    while True:
+        left = min(timeout, remaining(deadline))
+        if left < MIN_CALL_SECONDS:
+            raise DeadlineExceeded(f"deadline passed before {model} could run")
+        if deadline is not None and policy.cheaper(model) is not None:
+            # 留 FALLBACK_RESERVE 给下一档；留完不够一次调用就直接降档
+            left = min(left, remaining(deadline) * (1 - FALLBACK_RESERVE))
+            if left < MIN_CALL_SECONDS:
+                print(f"⏱ no time for {model} -> {policy.cheaper(model)}")
+                model = policy.cheaper(model)
+                continue
+
+        try:
+            data = ollama_client.generate(model, system, prompt, options=options, timeout=left, url=url,
+                                          stop=stop, format=format, guard=guard)
+        except requests.Timeout:
+            cheaper = policy.cheaper(model)
+            if cheaper is None:
+                metrics.LLM_TIER_TIMEOUTS.labels(model).inc()
+                raise DeadlineExceeded(f"{model} timed out after {left:.1f}s")
+            metrics.LLM_TIER_TIMEOUTS.labels(model).inc()
+            print(f"⏱ {model} missed deadline -> {cheaper}")
+            model = cheaper
+            continue
+
+        policy.observe(model, data, mode, len(prompt))
+        metrics.record_generation(model, data)
+        data["model"] = model
+        if data.get("done_reason") == "length":
+            metrics.LLM_RUNAWAY.labels(model, mode).inc()
+            raise RunawayGeneration(f"{model} hit num_predict={options['num_predict']} in {mode} mode")
+        if data.get("done_reason") == "guard":
+            metrics.LLM_GUARD_ABORTS.labels(model, mode).inc()
+            raise GuardAbort(f"{model} aborted in {mode} mode: {data.get('guard_reason')}")
+        return data
+
+
+def prefill(policy: ModelPolicy, system: str, prompt: str, mode: str, deadline=None,
+            timeout: float = 10, options: dict = None, url: str = ollama_client.OLLAMA_URL) -> dict:
+    """
+    说话过程中预热 KV 缓存：按 commit 时同样的规则选档位（同一个模型的缓存才用得上），只做 prompt eval
+
+    不进速度统计（没有生成，tokens/sec 没意义），也不降档重试：来不及这次就算了。
+    返回的 dict 同样带 "model"。
+    """
+    model = policy.choose(len(prompt), mode, deadline)
+    data = ollama_client.prefill(model, system, prompt, options=options, timeout=timeout, url=url)
+    metrics.LLM_PREFILLS.labels(model).inc()
+    metrics.LLM_PREFILL_TOKENS.labels(model).inc(data.get("prompt_eval_count") or 0)
+    data["model"] = model
+    return data
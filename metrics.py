@@ -0,0 +1,309 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================
+# 进程内指标 + Prometheus 文本格式的 HTTP 端点
+# =========================
+# counter / gauge / histogram 三种，带 label；全部线程安全（worker 线程、
+# ASR executor、事件循环都会打点）。gauge 可以挂一个函数，抓取时才求值
+# （队列深度这种不用每次变化都去 set）。
+#
+#   curl http://127.0.0.1:9464/metrics
+
+METRICS_PORT = int(os.environ.get("TALKIE_METRICS_PORT", "9464"))
+METRICS_HOST = "127.0.0.1"      # 只监听本机；要汇总到集群用 node 上的 Prometheus 抓
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels=()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+        with self.lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        """没有 label 的指标直接在自己身上打点"""
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def render(self, name, label_names, values):
+        return [f"{name}{_label_str(label_names, values)} {_fmt(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+        self.fn = None
+
+    def set(self, value: float):
+        with self.lock:
+            self.value = float(value)
+
+    def set_function(self, fn):
+        """抓取时调用 fn() 取值（fn 要快、不能阻塞）"""
+        self.fn = fn
+
+    def render(self, name, label_names, values):
+        value = self.value
+        if self.fn is not None:
+            try:
+                value = float(self.fn())
+            except Exception:
+                return []
+        return [f"{name}{_label_str(label_names, values)} {_fmt(value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, fn):
+        self._default().set_function(fn)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        with self.lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def render(self, name, label_names, values):
+        with self.lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        lines = []
+        acc = 0
+        for bound, c in zip(self.buckets, counts):
+            acc += c
+            lines.append(f"{name}_bucket{_label_str(label_names, values, [('le', _fmt(bound))])} {acc}")
+        lines.append(f"{name}_bucket{_label_str(label_names, values, [('le', '+Inf')])} {n}")
+        lines.append(f"{name}_sum{_label_str(label_names, values)} {_fmt(total)}")
+        lines.append(f"{name}_count{_label_str(label_names, values)} {n}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _add(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                return self.metrics[metric.name]
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self._add(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# =========================
+# 管线指标（各模块直接 import 使用）
+# =========================
+COMMITS = REGISTRY.counter("talkie_commits_total", "Regions handed to the commit worker", ["reason"])
+COMMIT_SECONDS = REGISTRY.histogram("talkie_commit_seconds", "postprocess() wall time per region")
+FAST_PATH = REGISTRY.counter("talkie_fast_path_total", "Rule fast path lookups (hit = LLM skipped)", ["result"])
+FALLBACKS = REGISTRY.counter("talkie_fallbacks_total", "Commits that fell back from the requested LLM output",
+                             ["mode", "cause"])
+GUARD_REJECTIONS = REGISTRY.counter("talkie_guard_rejections_total", "LLM outputs rejected by the safety guard",
+                                    ["mode"])
+LLM_ERRORS = REGISTRY.counter("talkie_llm_errors_total", "Failed LLM calls", ["mode", "kind"])
+QUEUE_DEPTH = REGISTRY.gauge("talkie_queue_depth", "Items waiting in a pipeline queue", ["queue"])
+
+ASR_RTF = REGISTRY.histogram("talkie_asr_rtf", "Per-chunk ASR decode time / chunk duration "
+                             "(llm=busy while an LLM generation is in flight)", ["llm"],
+                             buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1.0, 1.5, 2.0, 5.0))
+
+LLM_REQUESTS = REGISTRY.counter("talkie_llm_requests_total", "Completed Ollama generations", ["model"])
+LLM_TIER_TIMEOUTS = REGISTRY.counter("talkie_llm_tier_timeouts_total", "Generations that timed out on a tier",
+                                     ["model"])
+LLM_PROMPT_TOKENS = REGISTRY.counter("talkie_llm_prompt_eval_tokens_total",
+                                     "Prompt tokens Ollama had to evaluate (cached prefix excluded)", ["model"])
+LLM_EVAL_TOKENS = REGISTRY.counter("talkie_llm_eval_tokens_total", "Generated tokens", ["model"])
+LLM_TOKENS_PER_SEC = REGISTRY.histogram("talkie_llm_tokens_per_second", "Generation speed", ["model"],
+                                        buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 300))
+LLM_PROMPT_EVAL_SECONDS = REGISTRY.histogram("talkie_llm_prompt_eval_seconds", "Prompt evaluation time", ["model"])
+LLM_LOAD_SECONDS = REGISTRY.histogram("talkie_llm_load_seconds", "Model load time reported by Ollama", ["model"])
+LLM_TOTAL_SECONDS = REGISTRY.histogram("talkie_llm_total_seconds", "Total generation time reported by Ollama",
+                                       ["model"])
+LLM_RUNAWAY = REGISTRY.counter("talkie_llm_runaway_total", "Generations cut off at the num_predict budget",
+                               ["model", "mode"])
+LLM_THINK_DISABLED = REGISTRY.counter("talkie_llm_think_disabled_total",
+                                      "Generations with reasoning disabled at the API (no <think> tokens)",
+                                      ["model"])
+LLM_THINK_TOKENS = REGISTRY.counter("talkie_llm_think_tokens_total",
+                                    "Reasoning tokens generated and then dropped (API could not disable them)",
+                                    ["model"])
+LLM_GUARD_ABORTS = REGISTRY.counter("talkie_llm_guard_aborts_total",
+                                    "Streams closed because the output could no longer pass the guard",
+                                    ["model", "mode"])
+LLM_EARLY_STOPS = REGISTRY.counter("talkie_llm_early_stops_total",
+                                   "Streams closed as soon as the JSON answer was complete", ["model"])
+LLM_PREFILLS = REGISTRY.counter("talkie_llm_prefills_total",
+                                "Prompt-only requests sent during speech to warm the KV cache", ["model"])
+LLM_PREFILL_TOKENS = REGISTRY.counter("talkie_llm_prefill_tokens_total",
+                                      "Prompt tokens evaluated ahead of the commit by prefill requests", ["model"])
+OLLAMA_OUTSTANDING = REGISTRY.gauge("talkie_ollama_outstanding", "In-flight requests per Ollama backend",
+                                    ["backend"])
+OLLAMA_EJECTIONS = REGISTRY.counter("talkie_ollama_ejections_total", "Times an Ollama backend was ejected",
+                                    ["backend"])
+OLLAMA_RETRIES = REGISTRY.counter("talkie_ollama_retries_total", "Requests retried on another Ollama backend")
+JOURNAL_RECORDS = REGISTRY.counter("talkie_journal_records_total", "Commit journal records made durable")
+JOURNAL_DROPPED = REGISTRY.counter("talkie_journal_dropped_total",
+                                   "Commit journal records dropped because the writer fell behind")
+JOURNAL_FSYNC_SECONDS = REGISTRY.histogram("talkie_journal_fsync_seconds", "write + fsync time per journal batch",
+                                           buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+
+def record_generation(model: str, data: dict):
+    """把 Ollama 响应里的统计（eval_count / *_duration 等）记下来"""
+    eval_count = data.get("eval_count") or 0
+    eval_ns = data.get("eval_duration") or 0
+
+    LLM_REQUESTS.labels(model).inc()
+    LLM_PROMPT_TOKENS.labels(model).inc(data.get("prompt_eval_count") or 0)
+    LLM_EVAL_TOKENS.labels(model).inc(eval_count)
+    if eval_count and eval_ns:
+        LLM_TOKENS_PER_SEC.labels(model).observe(eval_count / (eval_ns / 1e9))
+    LLM_PROMPT_EVAL_SECONDS.labels(model).observe((data.get("prompt_eval_duration") or 0) / 1e9)
+    LLM_LOAD_SECONDS.labels(model).observe((data.get("load_duration") or 0) / 1e9)
+    LLM_TOTAL_SECONDS.labels(model).observe((data.get("total_duration") or 0) / 1e9)
+
+
+# =========================
+# HTTP 端点
+# =========================
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass      # 抓取日志不刷屏
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST, registry: Registry = REGISTRY):
+    """后台线程起 HTTP 服务；端口被占用时只打印警告（多开前端时常见）"""
+    handler = type("Handler", (_Handler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"⚠️ metrics endpoint not started ({host}:{port}): {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"📈 metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,502 @@
+import json
+import threading
+import time
+
+import requests
+
+import cpu_budget
+import metrics
+import stream_guard
+
+# =========================
+# Ollama 客户端：固定 system 前缀 + 稳定 options（让 runner 复用 KV 缓存）
+# =========================
+# 说明：
+# - 固定指令放在 system 里，用户文本放在 prompt 里；模板渲染后前缀逐字节一致，
+#   Ollama 会复用上一轮已经算过的前缀 KV，只需要 eval 新增的用户文本。
+# - options 里任何会触发 runner 重载的参数（num_ctx 等）必须每次完全一致，
+#   所以统一在这里注入，调用方不要再单独传 num_ctx。
+# - keep_alive 让模型常驻，避免两次 commit 之间被卸载。
+# - url 可以是多个后端（列表，或逗号分隔的字符串），见下面的 BackendPool。
+# - 带 guard 规格的请求走流式，边收边跑 stream_guard.StreamGuard，确定过不了就断开
+#   （done_reason = "guard"），不等模型把注定要扔的输出说完。
+# - prefill() 只做 prompt eval 不生成：说话过程中先把 commit 要发的 prompt 前缀算进 KV 缓存
+#   （见 kv_prefill.py）；多后端时紧接着的同 (model, system) 请求优先发到 prefill 过的后端，缓存才在那边。
+
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_NUM_CTX = 4096
+OLLAMA_KEEP_ALIVE = "30m"
+
+HEALTH_INTERVAL = 5.0          # 健康检查间隔（秒）
+HEALTH_TIMEOUT = 1.0
+EJECT_SECONDS = 10.0           # 第一次失败摘除这么久，连续失败翻倍
+MAX_EJECT_SECONDS = 60.0
+PREFILL_PREDICT = 1            # prefill 只要 prompt eval，生成 1 个 token 就停
+
+
+def _ms(ns) -> float:
+    return (ns or 0) / 1e6
+
+
+def report_stats(model: str, data: dict):
+    """每次调用打印 prompt eval / eval 统计，用来确认前缀缓存是否生效"""
+    print(
+        f"[ollama] {model} "
+        f"prompt_eval={data.get('prompt_eval_count', 0)}tok/{_ms(data.get('prompt_eval_duration')):.0f}ms "
+        f"eval={data.get('eval_count', 0)}tok/{_ms(data.get('eval_duration')):.0f}ms "
+        f"load={_ms(data.get('load_duration')):.0f}ms "
+        f"total={_ms(data.get('total_duration')):.0f}ms"
+    )
+
+
+# =========================
+# 多后端：最少在途请求路由 + 健康检查 + 摘除 + 换后端重试
+# =========================
+# Ollama 一个 runner 同时只跑有限个请求，多个 commit / 多个前端会排在同一个
+# runner 后面。起多个实例（不同端口或不同机器）后把 url 写成列表：
+#   - 路由：选在途请求最少的健康后端（并列时轮转）
+#   - 被动摘除：连接失败 / 5xx 就摘掉一段时间（指数退避），请求换下一个后端重试
+#     （temperature=0 的生成是幂等的，重试安全）；读超时不重试，交给分级降档处理
+#   - 主动健康检查：后台线程定期 GET /api/tags，恢复的后端提前放回
+#   - 全部被摘除时仍然试最早到期的那个，不直接失败
+# 同一组 url 在进程内共享一个 pool（daemon 里就是所有前端共享）。
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.tags_url = url.split("/api/", 1)[0] + "/api/tags"
+        self.outstanding = 0
+        self.failures = 0             # 连续失败次数（成功一次清零）
+        self.ejected_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class BackendPool:
+    def __init__(self, urls, health_interval: float = HEALTH_INTERVAL):
+        self.backends = [Backend(u) for u in urls]
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self._turn = 0
+        self._checker = None
+        for b in self.backends:
+            metrics.OLLAMA_OUTSTANDING.labels(b.url).set_function(lambda b=b: b.outstanding)
+
+    def acquire(self, exclude=(), prefer: str = None):
+        """
+        选一个后端并占一个在途名额；exclude 里的都试过了就返回 None
+
+        prefer 是上次处理同一前缀的后端 url（KV 缓存在那边）：它健康且在途数并列最少时优先选它。
+        """
+        with self.lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.healthy(now)]
+            if not healthy:
+                healthy = [min(candidates, key=lambda b: b.ejected_until)]
+            self._turn += 1
+            n = len(healthy)
+            backend = min((healthy[(self._turn + i) % n] for i in range(n)), key=lambda b: b.outstanding)
+            warm = next((b for b in healthy if b.url == prefer), None)
+            if warm is not None and warm.outstanding == backend.outstanding:
+                backend = warm
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend, failed: bool = None):
+        """failed=True 摘除，False 记成功，None（超时之类）不改健康状态"""
+        with self.lock:
+            backend.outstanding -= 1
+            if failed:
+                self._eject(backend, time.monotonic())
+            elif failed is False:
+                backend.failures = 0
+                backend.ejected_until = 0.0
+
+    def _eject(self, backend: Backend, now: float):
+        if len(self.backends) < 2:
+            return                    # 只有一个后端时摘了也没有别的可选
+        backend.failures += 1
+        seconds = min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** (backend.failures - 1))
+        backend.ejected_until = now + seconds
+        metrics.OLLAMA_EJECTIONS.labels(backend.url).inc()
+        print(f"🚫 ollama backend {backend.url} ejected for {seconds:.0f}s")
+
+    def check(self):
+        """一轮健康检查"""
+        for b in self.backends:
+            try:
+                requests.get(b.tags_url, timeout=HEALTH_TIMEOUT).raise_for_status()
+                ok = True
+            except requests.RequestException:
+                ok = False
+            with self.lock:
+                now = time.monotonic()
+                if ok and not b.healthy(now):
+                    b.ejected_until = 0.0
+                    print(f"✅ ollama backend {b.url} back in rotation")
+                elif not ok and b.healthy(now):
+                    self._eject(b, now)
+
+    def start_health_checks(self):
+        if self._checker is not None or len(self.backends) < 2:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.health_interval)
+                self.check()
+
+        self._checker = threading.Thread(target=loop, daemon=True, name="ollama-health")
+        self._checker.start()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url) -> BackendPool:
+    """url: 单个地址、逗号分隔的地址串或地址列表"""
+    urls = tuple(u.strip() for u in (url.split(",") if isinstance(url, str) else url) if u.strip())
+    with _pools_lock:
+        pool = _pools.get(urls)
+        if pool is None:
+            pool = _pools[urls] = BackendPool(urls)
+            pool.start_health_checks()
+        return pool
+
+
+def _backend_failure(exc) -> bool:
+    """连接不上 / 5xx 算后端故障（换后端重试）；读超时和 4xx 不算"""
+    if isinstance(exc, requests.ConnectionError):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+
+# =========================
+# Qwen3 思考模式：API 关掉；关不掉就在流里过滤
+# =========================
+# qwen3 默认先输出 <think>…</think> 再给答案，这些 token 全是白花的生成时间。
+#   - 默认请求带 think=false（Ollama ≥ 0.9），模型根本不生成推理
+#   - 模型不支持 think 参数（400）：去掉参数重发，之后这个模型不再带
+#   - 旧 Ollama 不认识 think 字段、照样输出 <think>：这个模型之后改走流式，
+#     ThinkFilter 边收边丢推理段；stop / num_predict 改在客户端对“答案部分”执行
+#     （服务端的 stop 会误切推理段，num_predict 会把推理也算进去），
+#     format=json 时顶层 JSON 闭合就断开连接，不等模型吐空白
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+THINK_ALLOWANCE = 1024         # 流式过滤时服务端 num_predict 额外给推理留的 token
+
+_think_unsupported = set()     # think 参数会报 400 的模型
+_think_ignored = set()         # 带了 think=false 仍然输出 <think> 的模型（走流式过滤）
+
+
+class ThinkFilter:
+    """流式去掉 <think>…</think>；标签可能被切在两帧之间"""
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+        self.think_tokens = 0
+
+    def feed(self, piece: str) -> str:
+        if not self.in_think and not self.pending and "<" not in piece:
+            return piece             # 绝大多数帧：不在推理段里，也没有标签
+        was_thinking = self.in_think
+        s = self.pending + piece
+        self.pending = ""
+        out = []
+        while s:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            i = s.find(tag)
+            if i < 0:
+                k = _partial_suffix(s, tag)
+                if not self.in_think:
+                    out.append(s[:len(s) - k])
+                self.pending = s[len(s) - k:] if k else ""
+                break
+            if not self.in_think:
+                out.append(s[:i])
+            s = s[i + len(tag):]
+            self.in_think = not self.in_think
+        if was_thinking or self.in_think:
+            self.think_tokens += 1
+        return "".join(out)
+
+    def flush(self) -> str:
+        rest, self.pending = self.pending, ""
+        return "" if self.in_think else rest
+
+
+def _partial_suffix(s: str, tag: str) -> int:
+    """s 的结尾有几个字符可能是 tag 的开头"""
+    for k in range(min(len(s), len(tag) - 1), 0, -1):
+        if tag.startswith(s[-k:]):
+            return k
+    return 0
+
+
+def strip_think(text: str):
+    """非流式响应里去掉推理段，返回 (答案, 推理段字数)"""
+    out, thought = [], 0
+    while True:
+        i = text.find(THINK_OPEN)
+        if i < 0:
+            out.append(text)
+            break
+        j = text.find(THINK_CLOSE, i)
+        out.append(text[:i])
+        end = len(text) if j < 0 else j + len(THINK_CLOSE)
+        thought += end - i
+        text = text[end:]
+    return "".join(out).lstrip(), thought
+
+
+class _JsonTracker:
+    """增量跟踪顶层 JSON 是否已闭合（跳过字符串里的括号）"""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_str = False
+        self.escape = False
+
+    def feed(self, text: str) -> bool:
+        for ch in text:
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+            elif ch == '"':
+                self.in_str = True
+            elif ch in "{[":
+                self.depth += 1
+                self.started = True
+            elif ch in "}]":
+                self.depth -= 1
+                if self.started and self.depth == 0:
+                    return True
+        return False
+
+
+def _read_stream(resp, model: str, limit=None, stop=None, json_mode: bool = False, guard: dict = None,
+                 deadline: float = None) -> dict:
+    """
+    读 NDJSON 流：过滤推理段，客户端执行 stop / 答案 token 上限 / guard，答案完成就断开
+
+    deadline 是 time.monotonic() 的绝对时间：requests 的 timeout 对流式响应只管单次读，
+    模型一直在吐 token 就永远不会超时，所以每帧自己查，过了就断开并抛 requests.Timeout。
+    """
+    t0 = time.perf_counter()
+    filt = ThinkFilter()
+    tracker = _JsonTracker() if json_mode else None
+    checker = stream_guard.StreamGuard(**guard) if guard else None
+    span = max((len(s) for s in stop or ()), default=1) - 1     # stop 串可能跨帧
+    text, tokens, answer_tokens, checked = "", 0, 0, 0
+    final, done_reason, abort = {}, "stop", None
+    try:
+        for line in resp.iter_lines():
+            if deadline is not None and time.monotonic() > deadline:
+                raise requests.Timeout(f"{model} still streaming after the deadline ({tokens} tokens)")
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("done"):
+                # 不 break：把流读完（chunked 结尾），连接才能放回连接池复用
+                final = chunk
+                done_reason = chunk.get("done_reason") or "stop"
+                text += filt.flush()
+                continue
+            tokens += 1
+            visible = filt.feed(chunk.get("response") or "")
+            if not visible:
+                continue
+            answer_tokens += 1
+            text += visible
+            # 只看新到的部分（加上可能跨帧的前 span 个字），长输出不会每帧重扫全文
+            start = max(0, len(text) - len(visible) - span)
+            hit = next((s for s in stop or () if text.find(s, start) >= 0), None)
+            if hit is not None:
+                text = text[:text.find(hit, start)]
+                break
+            if checker is not None and len(text) - span > checked:
+                # 末尾 span 个字还可能被跨帧的 stop 切掉，先不算进 guard（guard 只能多放、不能多断）
+                abort = checker.feed(text[checked:len(text) - span])
+                checked = len(text) - span
+                if abort:
+                    done_reason = "guard"
+                    break
+            if tracker is not None and tracker.feed(visible):
+                metrics.LLM_EARLY_STOPS.labels(model).inc()
+                break
+            if limit is not None and answer_tokens >= limit:
+                done_reason = "length"
+                break
+    finally:
+        resp.close()                 # 提前断开：Ollama 会取消这次生成
+
+    ns = int((time.perf_counter() - t0) * 1e9)
+    data = {k: v for k, v in final.items() if k != "response"}
+    data.setdefault("eval_count", tokens)
+    data.setdefault("eval_duration", ns)
+    data.setdefault("total_duration", ns)
+    data.update({"response": text.lstrip(), "done_reason": done_reason, "think_tokens": filt.think_tokens})
+    if abort:
+        data["guard_reason"] = abort
+    return data
+
+
+# (model, system) -> 最近一次 prefill 落在的后端 url；下一个同前缀的 generate 取走，优先发过去
+_warm = {}
+
+
+def _post(url, payload: dict, timeout: float, read, pin: bool = False) -> dict:
+    """
+    按 BackendPool 选后端发请求；后端故障换下一个重试（共用 timeout）
+
+    pin=True（prefill）：记下成功的后端；否则优先用（并取走）之前 prefill 记下的后端。
+    read(resp, deadline) 解析响应；deadline 是整次调用的绝对截止时间（流式读取自己每帧检查）。
+    """
+    pool = get_pool(url)
+    key = (payload["model"], payload["system"])
+    prefer = _warm.get(key) if pin else _warm.pop(key, None)
+    deadline = time.monotonic() + timeout
+    tried = []
+    last_error = None
+    while True:
+        left = deadline - time.monotonic()
+        backend = pool.acquire(exclude=tried, prefer=prefer) if left > 0 else None
+        if backend is None:
+            raise last_error or requests.Timeout(f"no time left to reach {url}")
+        tried.append(backend)
+        try:
+            with cpu_budget.llm_active():
+                resp = requests.post(backend.url, json=payload, timeout=left, stream=payload["stream"])
+                resp.raise_for_status()
+                data = read(resp, deadline)
+        except requests.RequestException as e:
+            failed = _backend_failure(e)
+            pool.release(backend, failed=failed or None)
+            if not failed:
+                raise
+            last_error = e
+            if len(tried) < len(pool.backends):
+                metrics.OLLAMA_RETRIES.inc()
+            continue
+        pool.release(backend, failed=False)
+        if pin:
+            _warm[key] = backend.url
+        return data
+
+
+def _think_rejected(exc) -> bool:
+    resp = getattr(exc, "response", None)
+    return resp is not None and resp.status_code == 400 and "think" in resp.text.lower()
+
+
+def _payload(model: str, system: str, prompt: str, options: dict = None) -> dict:
+    """generate / prefill 共用：前缀和 options 逐字节一致，prefill 算好的 KV 才能被复用"""
+    opts = dict(options or {})
+    opts["num_ctx"] = OLLAMA_NUM_CTX
+    if cpu_budget.current is not None:
+        opts["num_thread"] = cpu_budget.current.llm_threads     # 同样每次一致，不会触发重载
+
+    payload = {
+        "model": model,
+        "system": system,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": opts,
+    }
+    if model not in _think_unsupported:
+        payload["think"] = False
+    return payload
+
+
+def generate(model: str, system: str, prompt: str, options: dict = None,
+             timeout: float = 40, url: str = OLLAMA_URL, stop=None, format: str = None,
+             guard: dict = None) -> dict:
+    """
+    调用 /api/generate，返回完整的响应 dict（调用方自己取 response）
+
+    system 必须是模块级常量（逐字节稳定），prompt 只放本次变化的内容。
+    stop 是停止串列表；format="json" 让 Ollama 约束输出为一个 JSON（闭合即结束）。
+    url 是多个后端时按 BackendPool 路由，后端故障换下一个重试（共用 timeout）。
+    推理（<think>）默认在 API 层关掉，见上面的说明；响应里不会带推理段。
+    guard 是 stream_guard.StreamGuard 的参数 dict：给了就走流式，过不了时提前断开，
+    返回 done_reason="guard"、guard_reason=原因。
+    """
+    payload = _payload(model, system, prompt, options)
+    opts = payload["options"]
+    if format:
+        payload["format"] = format
+
+    # 调用方的 stop 追加到 options 里已有的（比如脚本 OLLAMA_OPTIONS 的 stop）之后，去重，不覆盖
+    stop = list(dict.fromkeys([*(opts.pop("stop", None) or ()), *(stop or ())]))
+    limit, client_stop = None, None
+    if model in _think_ignored:
+        limit = opts.pop("num_predict", None)
+        if limit is not None:
+            opts["num_predict"] = limit + THINK_ALLOWANCE
+        client_stop = stop
+        payload["stream"] = True
+    else:
+        if stop:
+            opts["stop"] = stop
+        payload["stream"] = guard is not None
+
+    if payload["stream"]:
+        read = lambda resp, deadline: _read_stream(resp, model, limit, client_stop, json_mode=format == "json",
+                                                   guard=guard, deadline=deadline)
+    else:
+        read = lambda resp, deadline: resp.json()
+    try:
+        data = _post(url, payload, timeout, read)
+    except requests.HTTPError as e:
+        if "think" not in payload or not _think_rejected(e):
+            raise
+        print(f"ℹ️ {model} does not accept the think parameter, sending without it")
+        _think_unsupported.add(model)
+        del payload["think"]
+        data = _post(url, payload, timeout, read)
+
+    if model not in _think_ignored:
+        if not payload["stream"] and THINK_OPEN in (data.get("response") or ""):
+            # Ollama 没认 think=false：这次就地去掉
+            raw = data["response"]
+            data["response"], thought = strip_think(raw)
+            data["think_tokens"] = round((data.get("eval_count") or 0) * thought / len(raw))
+        if data.get("think_tokens"):
+            # 之后这个模型走流式过滤（guard 请求本来就是流式，推理已经被 ThinkFilter 丢掉了）
+            print(f"ℹ️ {model} still emits <think> with think=false, filtering the stream from now on")
+            _think_ignored.add(model)
+
+    if data.get("think_tokens"):
+        metrics.LLM_THINK_TOKENS.labels(model).inc(data["think_tokens"])
+    elif payload.get("think") is False:
+        metrics.LLM_THINK_DISABLED.labels(model).inc()
+    report_stats(model, data)
+    return data
+
+
+def prefill(model: str, system: str, prompt: str, options: dict = None,
+            timeout: float = 10, url: str = OLLAMA_URL) -> dict:
+    """
+    只做 prompt eval：把 system + prompt 的 KV 算进 runner 的缓存，不要结果
+
+    请求和 generate 同样构造（options / think 一致），只是 num_predict=PREFILL_PREDICT；
+    之后同前缀的 generate 只需 eval 新增的部分。服务端的 num_predict 连推理 token 一起算，
+    不认 think=false 的模型也只多生成 1 个 token。返回原始响应（带 prompt_eval_count / 耗时）。
+    """
+    payload = _payload(model, system, prompt, options)
+    payload["options"]["num_predict"] = PREFILL_PREDICT
+    return _post(url, payload, timeout, lambda resp, deadline: resp.json(), pin=True)
@@ -1,11 +1,15 @@
 import sounddevice as sd
 import numpy as np
-from funasr import AutoModel
+import time
+
+import audio_capture
+import talkie_daemon
 
 # =========================
 # 1. 初始化模型
 # =========================
-model = AutoModel(
+# talkie_daemon 在跑就直接连上去（毫秒级），否则本地加载
+model = talkie_daemon.load_asr_model(
     model="paraformer-zh-streaming",
     device="mps"  # Intel Mac 改成 "cpu"
 )
@@ -20,6 +24,10 @@ decoder_chunk_look_back = 1
 
 chunk_stride = chunk_size[1] * 960  # 10 * 60ms * 16000 = 9600 samples
 
+# 端点检测：静音超过 SILENCE_TIMEOUT 就 is_final=True 把尾字吐出来并重置 cache
+SILENCE_TIMEOUT = 0.6
+ENERGY_THRESHOLD = 0.008
+
 # 全局 cache（重点）
 cache = {}
 
@@ -29,18 +37,50 @@ audio_buffer = np.zeros((0,), dtype=np.float32)
 # 上一次打印的文本（防止重复刷屏）
 last_text = ""
 
+last_voice_time = time.monotonic()
+speaking = False          # 上次端点之后是否说过话
+
 
 # =========================
 # 3. 回调函数
 # =========================
-def record_callback(indata, frames, time, status):
+def flush_endpoint():
+    """is_final=True 吐出 lookahead 里的尾字，然后清 cache（cache 只活一句话）"""
     global audio_buffer, last_text
 
-    if status:
-        print(status)
+    res = model.generate(
+        input=audio_buffer,
+        cache=cache,
+        is_final=True,
+        chunk_size=chunk_size,
+        encoder_chunk_look_back=encoder_chunk_look_back,
+        decoder_chunk_look_back=decoder_chunk_look_back,
+    )
+    audio_buffer = np.zeros((0,), dtype=np.float32)
+    cache.clear()
+
+    if res and res[0].get("text") and res[0]["text"] != last_text:
+        print(res[0]["text"], end="", flush=True)
+    last_text = ""
+
+
+def record_callback(block):
+    global audio_buffer, last_text, last_voice_time, speaking
+
+    # 原生采样率/声道 → 16k 单声道
+    audio = capture.convert(block)
+
+    now = time.monotonic()
+    rms = float(np.sqrt(np.mean(audio * audio)) + 1e-12)
+    if rms > ENERGY_THRESHOLD:
+        last_voice_time = now
+        speaking = True
+    elif speaking and now - last_voice_time >= SILENCE_TIMEOUT:
+        speaking = False
+        flush_endpoint()
+        print()   # 一句话一行
+        return
 
-    # sounddevice: (frames, channels) → 1D float32
-    audio = indata[:, 0].astype(np.float32)
     audio_buffer = np.concatenate([audio_buffer, audio])
 
     # 每满一个 chunk 才送模型
@@ -67,25 +107,15 @@ def record_callback(indata, frames, time, status):
 # =========================
 # 4. 启动麦克风
 # =========================
+# 按麦克风原生采样率/声道打开（很多 Linux 声卡不支持直接开 16k）
+capture = audio_capture.AudioCapture(record_callback)
+
 print("🎙 正在监听麦克风，说话即可（Ctrl+C 结束）")
-with sd.InputStream(
-    samplerate=sample_rate,
-    channels=1,
-    dtype="float32",
-    callback=record_callback,
-):
+with capture.open():
     try:
         while True:
             sd.sleep(1000)
     except KeyboardInterrupt:
+        # 通知模型最后一段（尾字照样打印出来）
+        flush_endpoint()
         print("\n🛑 停止录音")
-
-        # 通知模型最后一段
-        model.generate(
-            input=np.zeros((0,), dtype=np.float32),
-            cache=cache,
-            is_final=True,
-            chunk_size=chunk_size,
-            encoder_chunk_look_back=encoder_chunk_look_back,
-            decoder_chunk_look_back=decoder_chunk_look_back,
-        )
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import struct
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# =========================
+# 会话录音：16k 音频写进预分配的 mmap 环形文件，带每段话的标记
+# =========================
+# 用户报“这句识别错了”时，能把那一段原始音频导出来复现。
+# - 文件大小固定（默认 1 小时），写满从头覆盖；写入就是一次 memcpy 到 page cache，
+#   不做 fsync，长时间会话不会越跑越慢
+# - 音频回调不碰它：脚本在事件循环里拿到 16k 单声道后再 write
+# - 每次 commit 切 region 时 mark 一下，标记（样本区间 + 原文）追加到旁边的 .jsonl
+# - 重启后接着写（绝对样本位置连续）；开头已经被覆盖的标记不再列出（打开时清掉，会话中 utterances 也跳过）
+#
+#   python -m session_recorder list
+#   python -m session_recorder export 12 out.wav      # 或 out.flac
+
+DEFAULT_PATH = os.environ.get(
+    "TALKIE_RECORDING", os.path.join(os.path.dirname(os.path.abspath(__file__)), "session.ring")
+)
+DEFAULT_SECONDS = 3600
+SAMPLE_RATE = 16000
+
+_MAGIC = b"TALKREC1"
+_HEADER = struct.Struct("<8sIQ")      # magic, sample_rate, capacity（样本数）
+_HEADER_SIZE = 4096                   # 样本区按页对齐
+_WRITTEN_OFFSET = 64                  # uint64：累计写入样本数（绝对位置）
+
+
+class SessionRecorder:
+    def __init__(self, path: str = DEFAULT_PATH, seconds: float = DEFAULT_SECONDS,
+                 sample_rate: int = SAMPLE_RATE, readonly: bool = False):
+        self.path = path
+        self.markers_path = path + ".jsonl"
+        self.sample_rate = sample_rate
+        self.readonly = readonly
+        capacity = int(seconds * sample_rate)
+
+        if not readonly and not self._compatible(capacity):
+            # 新建（或参数变了）：预分配整个文件，之后只在里面覆盖写
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, sample_rate, capacity))
+                f.truncate(_HEADER_SIZE + capacity * 2)
+            if os.path.exists(self.markers_path):
+                os.unlink(self.markers_path)
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r" if readonly else "r+")
+        magic, self.sample_rate, self.capacity = _HEADER.unpack(bytes(self._mm[:_HEADER.size]))
+        if magic != _MAGIC:
+            raise ValueError(f"{path}: not a talkie session recording")
+        self._written = self._mm[_WRITTEN_OFFSET:_WRITTEN_OFFSET + 8].view("<u8")
+        self._samples = self._mm[_HEADER_SIZE:_HEADER_SIZE + self.capacity * 2].view("<i2")
+
+        self.markers = self._load_markers()
+        self._mark_start = self.position
+        self._flac = None
+
+        if not readonly:
+            self._rewrite_markers()
+            self._append_marker({"kind": "session", "start": self.position, "t": time.time()})
+
+    def _compatible(self, capacity: int) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                magic, rate, cap = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return magic == _MAGIC and rate == self.sample_rate and cap == capacity
+
+    @property
+    def position(self) -> int:
+        """累计写入的样本数（绝对位置，标记用它）"""
+        return int(self._written[0])
+
+    @property
+    def oldest(self) -> int:
+        """环里还留着的最早样本的绝对位置"""
+        return max(0, self.position - self.capacity)
+
+    # ---------- 写入（事件循环线程） ----------
+    def write(self, audio):
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2")
+        if len(pcm) > self.capacity:
+            pcm = pcm[-self.capacity:]
+
+        pos = self.position
+        start = pos % self.capacity
+        first = min(len(pcm), self.capacity - start)
+        self._samples[start:start + first] = pcm[:first]
+        if first < len(pcm):
+            self._samples[:len(pcm) - first] = pcm[first:]
+        self._written[0] = pos + len(pcm)
+
+    def mark(self, text: str = "", **extra):
+        """一段话结束（commit 切 region 时调用）：记录 [上次 mark, 现在) 的样本区间"""
+        end = self.position
+        if end <= self._mark_start:
+            return None
+        marker = {"kind": "utterance", "start": self._mark_start, "end": end,
+                  "t": time.time(), "text": text, **extra}
+        self._mark_start = end
+        self._append_marker(marker)
+        return marker
+
+    def close(self):
+        if not self.readonly:
+            self._mm.flush()
+        if self._flac is not None:
+            self._flac.shutdown(wait=True)
+
+    # ---------- 标记 ----------
+    def _load_markers(self):
+        markers = []
+        try:
+            with open(self.markers_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        markers.append(json.loads(line))
+                    except ValueError:
+                        pass      # 上次崩溃时写了半行
+        except OSError:
+            pass
+        return [m for m in markers if self._intact(m)]
+
+    def _intact(self, marker: dict) -> bool:
+        # 开头被覆盖的标记只剩半段音频，导出时 read 会报错：整条算丢了
+        return marker["start"] >= self.oldest
+
+    def _rewrite_markers(self):
+        tmp = self.markers_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for m in self.markers:
+                f.write(json.dumps(m, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.markers_path)
+
+    def _append_marker(self, marker: dict):
+        self.markers.append(marker)
+        with open(self.markers_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(marker, ensure_ascii=False) + "\n")
+
+    def utterances(self):
+        """还能完整导出的话（会话中环也在被覆盖，不能只靠打开时的清理）"""
+        return [m for m in self.markers if m["kind"] == "utterance" and self._intact(m)]
+
+    # ---------- 导出 ----------
+    def read(self, start: int, end: int):
+        """读 [start, end) 绝对样本区间（int16）；已经被覆盖的部分报错"""
+        if start < self.oldest or end > self.position or start > end:
+            raise ValueError(f"samples [{start}, {end}) no longer in the ring "
+                             f"(have [{self.oldest}, {self.position}))")
+        a, b = start % self.capacity, end % self.capacity
+        if end - start == 0:
+            return np.zeros(0, dtype="<i2")
+        if a < b:
+            return np.array(self._samples[a:b])
+        return np.concatenate([self._samples[a:], self._samples[:b]])
+
+    def export_wav(self, marker: dict, out_path: str):
+        pcm = self.read(marker["start"], marker["end"])
+        with wave.open(out_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(pcm.tobytes())
+        return out_path
+
+    def export_flac(self, marker: dict, out_path: str):
+        """后台压缩成 FLAC（需要 soundfile），返回 Future；音频先在当前线程拷出来"""
+        pcm = self.read(marker["start"], marker["end"])
+        if self._flac is None:
+            self._flac = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flac")
+        return self._flac.submit(_write_flac, out_path, pcm, self.sample_rate)
+
+
+def _write_flac(out_path: str, pcm, sample_rate: int) -> str:
+    try:
+        import soundfile as sf
+    except ImportError:
+        raise RuntimeError("FLAC export needs the soundfile package (pip install soundfile)")
+    sf.write(out_path, pcm, sample_rate, format="FLAC", subtype="PCM_16")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出会话录音里的某段话")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    exp = sub.add_parser("export")
+    exp.add_argument("index", type=int, help="list 里的序号")
+    exp.add_argument("out", help=".wav 或 .flac")
+    args = parser.parse_args()
+
+    rec = SessionRecorder(args.path, readonly=True)
+    utts = rec.utterances()
+
+    if args.cmd == "list":
+        for i, m in enumerate(utts):
+            sec = (m["end"] - m["start"]) / rec.sample_rate
+            when = time.strftime("%m-%d %H:%M:%S", time.localtime(m["t"]))
+            print(f"{i:>4}  {when}  {sec:6.1f}s  {m.get('text', '')!r}")
+        return
+
+    if not 0 <= args.index < len(utts):
+        raise SystemExit(f"no utterance #{args.index} ({len(utts)} in the ring)")
+    marker = utts[args.index]
+    if args.out.endswith(".flac"):
+        rec.export_flac(marker, args.out).result()
+    else:
+        rec.export_wav(marker, args.out)
+    rec.close()
+    print(f"✅ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
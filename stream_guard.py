@@ -0,0 +1,53 @@
+# =========================
+# 流式 guard：边生成边算长度，确定过不了终检就断开
+# =========================
+# 原来 is_llm_output_safe 要等整段生成完才跑：模型一开始复读 / 膨胀，也得等它说完再扔掉。
+# 这里随着流式 token 增量累计输出长度（和 textproc.normalize_for_guard 同样的归一化：去 #*`>- 和空白），
+# 超过 max_chars 就断开。max_chars 由调用方按终检的上限换算：超过了终检一定不过。
+# 只拦终检一定会拦的输出——覆盖率之类终检不一定看的条件不在这里判，否则会断掉终检本来会放行的输出。
+# list_only=True 时只算列表行（去掉前导空白后以 - 开头），和 normalize_markdown 的取舍一致。
+#
+# 规格是普通 dict（要能经 daemon 转发），ollama_client 每次请求（含换后端重试）新建一个 StreamGuard：
+#   guard = {"max_chars": 300, "list_only": True}
+
+MIN_SOURCE_CHARS = 40          # 原文短于这个不值得走流式：输出本来就短（num_predict 也小），断开省不了多少
+
+_DROP = set("#*`>-")
+
+
+def normalize(text: str) -> str:
+    return "".join(ch for ch in text if ch not in _DROP and not ch.isspace())
+
+
+class StreamGuard:
+    def __init__(self, max_chars: float, list_only: bool = False):
+        self.max_chars = max_chars
+        self.list_only = list_only
+
+        self.length = 0              # 已计入的归一化字数
+        self._line_start = True
+        self._in_list = not list_only
+
+    def _filter(self, piece: str) -> str:
+        if not self.list_only:
+            return normalize(piece)
+        out = []
+        for ch in piece:
+            if ch == "\n":
+                self._line_start = True
+                continue
+            if self._line_start:
+                if ch.isspace():
+                    continue
+                self._in_list = ch == "-"
+                self._line_start = False
+            if self._in_list and ch not in _DROP and not ch.isspace():
+                out.append(ch)
+        return "".join(out)
+
+    def feed(self, piece: str):
+        """送入一段新生成的文本；确定过不了时返回原因字符串，否则 None"""
+        self.length += len(self._filter(piece))
+        if self.length > self.max_chars:
+            return f"output {self.length} chars > limit {self.max_chars:.0f}"
+        return None
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import cpu_budget
+import llm_policy
+import metrics
+import ollama_client
+
+# =========================
+# 常驻 daemon：一份 paraformer + 每个连接自己的流式 cache + 共享 Ollama 客户端
+# =========================
+# 前端（typein / typeinLLM / typeinLLMNew / TalkieMore / realtime_asr）启动时
+# 先尝试连 Unix socket，连上就不再自己加载模型，切换前端只需要毫秒级。
+#
+# 协议：帧 = 1 字节类型 + 4 字节长度（网络序）+ payload，一问一答
+#   → STREAM  JSON 流式参数，开始一条新流（清空该连接的 cache），无回复
+#   → AUDIO   int16 小端 PCM，16k 单声道，is_final=False  ← TEXT
+#   → FINAL   同上，is_final=True                          ← TEXT
+#   → LLM     JSON 请求（system/prompt/mode/...）          ← LLM_RESULT JSON
+#             带 "prefill": true 时只预热 KV（llm_policy.prefill）
+#             按请求里的 tiers 各用一个 ModelPolicy：档位不同的前端不会互相覆盖、清掉速度统计
+#   ← ERROR   utf-8 错误信息
+
+SOCKET_PATH = os.environ.get("TALKIE_SOCKET", f"/tmp/talkie-{os.getuid()}.sock")
+ASR_MODEL = "paraformer-zh-streaming"
+
+MSG_STREAM = 0x01
+MSG_AUDIO = 0x02
+MSG_FINAL = 0x03
+MSG_LLM = 0x04
+MSG_TEXT = 0x81
+MSG_LLM_RESULT = 0x82
+MSG_ERROR = 0x8F
+
+_HEADER = struct.Struct("!BI")
+
+DEFAULT_STREAM_PARAMS = {
+    "chunk_size": [0, 10, 5],
+    "encoder_chunk_look_back": 4,
+    "decoder_chunk_look_back": 1,
+}
+
+# 远程 ASR 等回复的上限：1 秒 + 几个 chunk 的音频时长（daemon 卡住时不能把 ASR 线程永远挂住）
+ASR_SAMPLE_RATE = 16000
+ASR_REPLY_CHUNKS = 4
+ASR_CONNECT_TIMEOUT = 1.0
+
+
+def float_to_pcm16(audio) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def pcm16_to_float(payload: bytes):
+    return np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32767.0
+
+
+# =========================
+# 客户端（前端用，同步 socket）
+# =========================
+def _send_frame(sock, kind: int, payload: bytes = b""):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("talkie daemon closed the connection")
+        buf += part
+    return bytes(buf)
+
+
+def _recv_frame(sock):
+    kind, length = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return kind, _recv_exact(sock, length)
+
+
+def _connect(path: str, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class RemoteASRModel:
+    """
+    和 AutoModel.generate 一样的调用方式，推理在 daemon 里做
+
+    cache 语义保持一致：调用方传入空 dict 就是开始新的一条流
+    （所以前端 cache.clear() 之后照常工作）。
+
+    每次等回复最多 1 秒 + ASR_REPLY_CHUNKS 个 chunk 的时长。超时 / 连接断了：这个 chunk 返回 []
+    （前端照常跳过），下一个 chunk 重连并开一条新流；重连不上抛 ConnectionError。
+    """
+
+    def __init__(self, path: str = SOCKET_PATH):
+        self.path = path
+        self.sock = _connect(path, timeout=ASR_CONNECT_TIMEOUT)
+        self._params = None
+
+    def _reply_timeout(self, audio_samples: int, chunk_size) -> float:
+        stride = chunk_size[1] * 960 / ASR_SAMPLE_RATE
+        return 1.0 + ASR_REPLY_CHUNKS * max(stride, audio_samples / ASR_SAMPLE_RATE)
+
+    def generate(self, input, cache, is_final=False, chunk_size=None,
+                 encoder_chunk_look_back=None, decoder_chunk_look_back=None, **kwargs):
+        params = {
+            "chunk_size": list(chunk_size or DEFAULT_STREAM_PARAMS["chunk_size"]),
+            "encoder_chunk_look_back": encoder_chunk_look_back,
+            "decoder_chunk_look_back": decoder_chunk_look_back,
+        }
+        if self.sock is None:
+            try:
+                self.sock = _connect(self.path, timeout=ASR_CONNECT_TIMEOUT)
+            except OSError as e:
+                raise ConnectionError(f"talkie daemon at {self.path} is gone: {e!r}") from e
+            self._params = None           # 新连接在 daemon 那边没有流，重新开一条
+            print(f"🔌 reconnected to talkie daemon: {self.path}")
+
+        timeout = self._reply_timeout(len(input), params["chunk_size"])
+        try:
+            self.sock.settimeout(timeout)
+            if not cache or params != self._params:
+                _send_frame(self.sock, MSG_STREAM, json.dumps(params).encode())
+                cache["daemon_stream"] = True
+                self._params = params
+
+            _send_frame(self.sock, MSG_FINAL if is_final else MSG_AUDIO, float_to_pcm16(input))
+            kind, payload = _recv_frame(self.sock)
+        except OSError as e:              # socket.timeout / ConnectionError 都是 OSError
+            self.sock.close()
+            self.sock = None
+            print(f"⚠️ talkie daemon did not answer within {timeout:.1f}s ({e!r}), "
+                  "dropping this chunk and reconnecting")
+            return []
+        if kind == MSG_ERROR:
+            raise RuntimeError(f"talkie daemon: {payload.decode()}")
+        return [{"text": payload.decode()}]
+
+
+def load_asr_model(device: str = "cpu", model: str = ASR_MODEL, path: str = SOCKET_PATH):
+    """有 daemon 就连 daemon，没有就本地加载（旧行为）"""
+    try:
+        remote = RemoteASRModel(path)
+        print(f"🔌 attached to talkie daemon: {path}")
+        return remote
+    except OSError:
+        from funasr import AutoModel
+        print("📦 talkie daemon not running, loading ASR model locally")
+        return AutoModel(model=model, device=device)
+
+
+def generate_tiered(policy, system: str, prompt: str, mode: str, deadline=None,
+                    timeout: float = 40, options: dict = None, url: str = None,
+                    stop=None, format: str = None, guard: dict = None) -> dict:
+    """
+    同 llm_policy.generate_tiered；daemon 在就让 daemon 代发（共享模型速度统计），
+    否则本地直接调 Ollama
+    """
+    url = url or ollama_client.OLLAMA_URL
+    left = llm_policy.remaining(deadline)
+    try:
+        sock = _connect(SOCKET_PATH, timeout=min(timeout, left) + 1.0)
+    except OSError:
+        return llm_policy.generate_tiered(policy, system, prompt, mode, deadline=deadline,
+                                          timeout=timeout, options=options, url=url,
+                                          stop=stop, format=format, guard=guard)
+
+    req = {
+        "system": system,
+        "prompt": prompt,
+        "mode": mode,
+        "tiers": policy.tiers,
+        "remaining": None if deadline is None else left,
+        "timeout": timeout,
+        "options": options,
+        "url": url,
+        "stop": stop,
+        "format": format,
+        "guard": guard,
+    }
+    result = _ask_llm(sock, req)
+    if "error" in result:
+        if result.get("kind") == "deadline":
+            raise llm_policy.DeadlineExceeded(result["error"])
+        if result.get("kind") == "runaway":
+            raise llm_policy.RunawayGeneration(result["error"])
+        if result.get("kind") == "guard":
+            raise llm_policy.GuardAbort(result["error"])
+        raise RuntimeError(f"talkie daemon: {result['error']}")
+
+    data = result["data"]
+    policy.observe(data.get("model"), data, mode, len(prompt))
+    metrics.record_generation(data.get("model"), data)
+    return data
+
+
+def prefill(policy, system: str, prompt: str, mode: str, deadline=None,
+            timeout: float = 10, options: dict = None, url: str = None) -> dict:
+    """同 llm_policy.prefill；daemon 在就让 daemon 代发（和 commit 走同一个后端池，缓存才对得上）"""
+    url = url or ollama_client.OLLAMA_URL
+    try:
+        sock = _connect(SOCKET_PATH, timeout=timeout + 1.0)
+    except OSError:
+        return llm_policy.prefill(policy, system, prompt, mode, deadline=deadline,
+                                  timeout=timeout, options=options, url=url)
+
+    req = {
+        "prefill": True,
+        "system": system,
+        "prompt": prompt,
+        "mode": mode,
+        "tiers": policy.tiers,
+        "remaining": None if deadline is None else llm_policy.remaining(deadline),
+        "timeout": timeout,
+        "options": options,
+        "url": url,
+    }
+    result = _ask_llm(sock, req)
+    if "error" in result:
+        raise RuntimeError(f"talkie daemon: {result['error']}")
+    return result["data"]
+
+
+def _ask_llm(sock, req: dict) -> dict:
+    """发一个 LLM 请求帧、收回复（用完关掉 sock）"""
+    try:
+        with cpu_budget.llm_active():
+            _send_frame(sock, MSG_LLM, json.dumps(req).encode())
+            kind, payload = _recv_frame(sock)
+    finally:
+        sock.close()
+
+    if kind == MSG_ERROR:
+        raise RuntimeError(f"talkie daemon: {payload.decode()}")
+    return json.loads(payload)
+
+
+# =========================
+# 服务端
+# =========================
+class TalkieDaemon:
+    def __init__(self, device: str, path: str = SOCKET_PATH):
+        # 先划分 CPU（要在 import torch 之前），ASR 线程绑 ASR 核，其余线程 + Ollama 用剩下的
+        budget = cpu_budget.load(device)
+        cpu_budget.apply(budget)
+
+        from funasr import AutoModel
+
+        self.path = path
+        t0 = time.perf_counter()
+        self.model = AutoModel(model=ASR_MODEL, device=device)
+        print(f"📦 {ASR_MODEL} loaded in {time.perf_counter() - t0:.1f}s")
+
+        # 模型只有一份：推理串行；LLM 请求互不影响，可以并行
+        self.asr_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="asr",
+            initializer=None if budget is None else lambda: cpu_budget.init_asr_thread(budget),
+        )
+        self.llm_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+        # tuple(tiers) -> ModelPolicy；前端热更新档位后是新的 key，旧的统计留着（档位改回来还能用）
+        self.policies = {}
+        self._policies_lock = threading.Lock()
+
+    def run_asr(self, audio, cache: dict, is_final: bool, params: dict) -> str:
+        res = self.model.generate(input=audio, cache=cache, is_final=is_final, **params)
+        if not res:
+            return ""
+        return res[0].get("text") or ""
+
+    def policy_for(self, tiers) -> llm_policy.ModelPolicy:
+        key = tuple(tiers or llm_policy.DEFAULT_TIERS)
+        with self._policies_lock:
+            policy = self.policies.get(key)
+            if policy is None:
+                policy = self.policies[key] = llm_policy.ModelPolicy(list(key))
+            return policy
+
+    def run_llm(self, req: dict) -> dict:
+        policy = self.policy_for(req.get("tiers"))
+        deadline = None if req.get("remaining") is None else time.monotonic() + req["remaining"]
+        if req.get("prefill"):
+            try:
+                data = llm_policy.prefill(
+                    policy, req["system"], req["prompt"], req["mode"], deadline=deadline,
+                    timeout=req.get("timeout", 10), options=req.get("options"), url=req["url"],
+                )
+            except Exception as e:
+                return {"error": repr(e)}
+            return {"data": data}
+        try:
+            data = llm_policy.generate_tiered(
+                policy, req["system"], req["prompt"], req["mode"], deadline=deadline,
+                timeout=req.get("timeout", 40), options=req.get("options"), url=req["url"],
+                stop=req.get("stop"), format=req.get("format"), guard=req.get("guard"),
+            )
+        except llm_policy.DeadlineExceeded as e:
+            return {"error": str(e), "kind": "deadline"}
+        except llm_policy.RunawayGeneration as e:
+            return {"error": str(e), "kind": "runaway"}
+        except llm_policy.GuardAbort as e:
+            return {"error": str(e), "kind": "guard"}
+        except Exception as e:
+            return {"error": repr(e)}
+        return {"data": data}
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        cache = {}
+        params = dict(DEFAULT_STREAM_PARAMS)
+
+        try:
+            while True:
+                kind, length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                payload = await reader.readexactly(length)
+
+                if kind == MSG_STREAM:
+                    params = json.loads(payload)
+                    cache = {}
+                    continue
+
+                if kind in (MSG_AUDIO, MSG_FINAL):
+                    audio = pcm16_to_float(payload)
+                    try:
+                        text = await loop.run_in_executor(
+                            self.asr_executor, self.run_asr, audio, cache, kind == MSG_FINAL, params
+                        )
+                        reply = (MSG_TEXT, text.encode())
+                    except Exception as e:
+                        reply = (MSG_ERROR, repr(e).encode())
+                elif kind == MSG_LLM:
+                    result = await loop.run_in_executor(self.llm_executor, self.run_llm, json.loads(payload))
+                    reply = (MSG_LLM_RESULT, json.dumps(result, ensure_ascii=False).encode())
+                else:
+                    reply = (MSG_ERROR, f"unknown message type {kind:#x}".encode())
+
+                writer.write(_HEADER.pack(reply[0], len(reply[1])) + reply[1])
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)   # 上次异常退出留下的 socket 文件
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        print(f"🟢 talkie daemon listening on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻 ASR/LLM daemon（前端通过 Unix socket 连接）")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--device", default="mps", help='Intel Mac / Linux 改成 "cpu"')
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT + 1,
+                        help="Prometheus 端点（0 = 不开）")
+    args = parser.parse_args()
+
+    daemon = TalkieDaemon(args.device, args.socket)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        print("\n🛑 daemon stopped")
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# =========================
+# TalkieMore 的文本部分：路由 / prompt 模板 / 渲染器
+# =========================
+# 从 TalkieMore.py 拆出来，import 不加载模型、不开麦克风（批处理也用它）。
+
+
+# =========================
+# Router（规则优先，Demo 稳定）
+# =========================
+def route(text: str) -> str:
+    if any(k in text for k in ["公式", "平方", "分之", "根号", "求和", "积分", "上标", "下标", "latex"]):
+        return "latex"
+    if any(k in text for k in ["流程图", "画个流程", "流程是", "如果", "否则", "mermaid"]):
+        return "mermaid"
+    if any(k in text for k in ["总结", "列一下", "要点", "几点", "步骤", "清单"]):
+        return "markdown"
+    return "plain"
+
+# =========================
+# Prompt 模板
+# =========================
+# 固定指令放 system（模块常量，逐字节稳定），口述内容单独放 prompt，
+# 这样 Ollama 每次只需要 eval 口述内容，前缀直接命中 KV 缓存
+SYSTEM_MARKDOWN = """
+你是一个文本编辑器，而不是聊天助手。
+
+请将下面的口述内容：
+- 删除口语废话（如“我觉得”“然后”“其实”）
+- 修正语法
+- 如果是清单、步骤或要点，请结构化成 Markdown
+
+【只输出 JSON，不要解释】
+格式：
+{
+  "type": "markdown",
+  "title": "...",
+  "blocks": [
+    { "type": "paragraph", "text": "..." },
+    { "type": "bullets", "items": ["...", "..."] },
+    { "type": "steps", "items": ["...", "..."] }
+  ]
+}
+"""
+
+SYSTEM_LATEX = """
+你是一个公式转写器。
+
+请将下面的口述数学表达转写为 LaTeX 公式。
+
+【要求】
+- 不做数学推导
+- 只做表达映射
+- 只输出 JSON
+
+格式：
+{
+  "type": "latex",
+  "latex": "..."
+}
+"""
+
+SYSTEM_MERMAID = """
+你是一个流程图生成器。
+
+请根据下面的口述内容生成 Mermaid flowchart TD。
+
+【要求】
+- 只输出 JSON
+- diagram 中必须是合法 Mermaid
+
+格式：
+{
+  "type": "mermaid",
+  "diagram": "flowchart TD\\nA[开始] --> B[处理]"
+}
+"""
+
+SYSTEM_PLAIN = """
+请将下面口述内容整理成简洁、通顺的书面语。
+
+【只输出 JSON】
+格式：
+{
+  "type": "plain",
+  "text": "..."
+}
+"""
+
+SYSTEM_PROMPTS = {
+    "markdown": SYSTEM_MARKDOWN,
+    "latex": SYSTEM_LATEX,
+    "mermaid": SYSTEM_MERMAID,
+    "plain": SYSTEM_PLAIN,
+}
+
+def build_prompt(text: str, mode: str):
+    """返回 (system, prompt)"""
+    system = SYSTEM_PROMPTS.get(mode, SYSTEM_PLAIN)
+    return system, f"""
+【口述内容】
+{text}
+"""
+
+# =========================
+# 渲染器
+# =========================
+def render(result: dict) -> str:
+    t = result.get("type")
+    if t == "plain":
+        return result["text"]
+
+    if t == "markdown":
+        lines = []
+        if result.get("title"):
+            lines.append(f"## {result['title']}\n")
+        for b in result["blocks"]:
+            if b["type"] == "paragraph":
+                lines.append(b["text"] + "\n")
+            elif b["type"] == "bullets":
+                for i in b["items"]:
+                    lines.append(f"- {i}")
+                lines.append("")
+            elif b["type"] == "steps":
+                for idx, i in enumerate(b["items"], 1):
+                    lines.append(f"{idx}. {i}")
+                lines.append("")
+        return "\n".join(lines)
+
+    if t == "latex":
+        return f"```latex\n{result['latex']}\n```"
+
+    if t == "mermaid":
+        return f"```mermaid\n{result['diagram']}\n```"
+
+    return str(result)
@@ -0,0 +1,405 @@
+import json
+import re
+
+# =========================
+# 纯文本处理：预清洗 / 结构重排 prompt / guard 比对 / JSON 大纲解析 / Markdown 规整
+# =========================
+# 从 typeinLLMNew.py / typeinLLM.py 拆出来：import 这个模块不加载模型、不开麦克风、不碰键盘，
+# 批处理（batch_transcribe.py）和基准测试可以直接用。
+# typeinLLM 的老行为保留成单独的入口：preprocess_basic（只拆“第X个：”，不加软换行），
+# extract_first_json(clean=False) / parse_outline(repair=False)（不修 JSON，坏 JSON 直接抛）。
+# LLM 调用本身不在这里，由调用方把 call_ollama 传进来。
+
+
+# =========================
+# Step1：工程预清洗（结构化前掰开粘连）
+# =========================
+_ORD_PATTERN = r'(第[一二三四五六七八九十]+个\s*[:：])'
+
+def split_ordered_items(text: str) -> str:
+    """把 '第一个：xx第二个：yy' 拆成多行（仅拆结构，不新增内容）"""
+    if not text:
+        return text
+    if text.count("第") < 2:
+        return text
+    if not (("第二个" in text) or ("第三个" in text) or ("第四个" in text)):
+        return text
+    if not re.search(_ORD_PATTERN, text):
+        return text
+
+    parts = re.split(_ORD_PATTERN, text)
+    if len(parts) <= 1:
+        return text
+
+    lines = []
+    current = ""
+    for part in parts:
+        if re.match(_ORD_PATTERN, part):
+            if current.strip():
+                lines.append(current.strip())
+            current = part
+        else:
+            current += part
+
+    if current.strip():
+        lines.append(current.strip())
+
+    return "\n".join(lines)
+
+def add_soft_breaks(text: str) -> str:
+    """只做"更利于结构化"的轻度换行，不新增信息"""
+    if not text:
+        return ""
+    t = text
+    
+    # 优先处理"第X点"模式（包括"第一点"、"第二点"、"第三点"等）
+    # 匹配"第[一二三四五六七八九十]+点"或"第[0-9]+点"
+    t = re.sub(r"([，。！？,\.\!\?\s]*)(第[一二三四五六七八九十0-9]+点)", r"\1\n\2", t)
+    
+    # 常见结构连接词/序号词前换行，帮助 LLM 感知"分点"
+    keywords = [
+        "首先", "其次", "然后", "另外", "最后",
+        "第一", "第二", "第三", "第四", "第五",
+    ]
+    for w in keywords:
+        # 情况1：句号/分号之后
+        t = re.sub(rf"(。|；|;)\s*({w})", r"\1\n\2", t)
+        # 情况2：行首或空格之后（但避免重复换行）
+        t = re.sub(rf"(^|\s+)({w})", r"\1\n\2", t)
+    
+    # 清理多余的连续换行
+    t = re.sub(r"\n{3,}", "\n\n", t)
+    return t
+
+def preprocess_before_llm(raw_text: str) -> str:
+    t = (raw_text or "").strip()
+    if not t:
+        return ""
+
+    # 只做基本的空白规范化，保持原始格式（换行、列表等）
+    t = re.sub(r"[ \t]+", " ", t)
+    # 语气词处理已改为通过LLM提示词完成
+    t = split_ordered_items(t)
+    t = add_soft_breaks(t)
+
+    # 你之前的处理保留
+    t = t.replace("。-", "。\n-")
+
+    # 统一换行
+    t = t.replace("\r\n", "\n").replace("\r", "\n")
+    t = re.sub(r"\n{3,}", "\n\n", t)
+    return t.strip()
+
+
+def preprocess_basic(raw_text: str) -> str:
+    """typeinLLM 的预清洗：空白规范化 + 拆“第X个：”，不加软换行、不动 \r 和连续空行"""
+    t = (raw_text or "").strip()
+    if not t:
+        return ""
+    t = re.sub(r"[ \t]+", " ", t)
+    t = split_ordered_items(t)
+    t = t.replace("。-", "。\n-")
+    return t.strip()
+
+
+# =========================
+# Step2：结构化理解（LLM 输出 JSON）
+# =========================
+
+SYSTEM_REORDER = (
+    "你是一个【文本结构重排器】，不是总结器、不是解释器。\n"
+    "目标：把口语化、零散的表达，重排为逻辑清晰的结构化文本。\n\n"
+
+    "只允许做的事情：\n"
+    "- 删除口语填充词（如：嗯、呃、啊、那个、然后、其实、就是）\n"
+    "- 合并重复意思\n"
+    "- 拆分长句\n"
+    "- 调整顺序，让表达更清晰\n\n"
+
+    "禁止：\n"
+    "- 新增事实\n"
+    "- 推测原文未提及的内容\n"
+    "- 总结、升华、评价\n\n"
+
+    "输出格式要求（必须遵守）：\n"
+    "- 使用 Markdown\n"
+    "- 一级结构使用无序列表 `-`\n"
+    "- 子结构使用缩进两格的 `-`\n"
+    "- 不要使用标题符号 `#`\n"
+    "- 不要输出任何解释性文字\n\n"
+
+    "示例格式：\n"
+    "- 要点一\n"
+    "  - 子要点\n"
+    "- 要点二\n\n"
+)
+
+# 答案之后的解释性段落（“说明：”“注：”、分隔线、连续空行）：遇到就停止生成
+STOP_AFTER_ANSWER = ["\n\n\n", "\n\n说明：", "\n\n注：", "\n\n---"]
+
+def build_prompt_reorder(raw_text: str):
+    return SYSTEM_REORDER, "原始文本：\n" + (raw_text or "").strip()
+
+SYSTEM_STRUCT = (
+    "你是一个【结构重排器】，不是解释器、不是总结器。\n"
+    "只做：删除口语填充词、拆分、换行、分组。禁止：推测、解释、补全。\n\n"
+    "硬性约束：\n"
+    "1) 只输出一个 JSON 对象，除此之外不要输出任何字符。\n"
+    "2) 不新增事实，不推测，不补充未提及信息。\n"
+    "3) 删除口语填充词/语气词/口头禅（如：嗯、呃、啊、那个、这个、然后、其实、就是、你知道、就是说）。\n"
+    "4) 每条要点尽量短，一句话一个要点。\n"
+    "5) 必须保持结构化输出：如果原文有列表结构，必须在JSON中正确分组为bullets和sub。\n"
+    "6) 最多两层：bullets + sub。\n"
+    "7) 禁止输出：#、/think、<think>、解释性句子。\n\n"
+    "JSON 结构必须严格为：\n"
+    "{\"title\":\"\",\"bullets\":[{\"text\":\"\",\"sub\":[{\"text\":\"\"}]}]}\n\n"
+)
+
+def build_prompt_struct(raw_text: str):
+    return SYSTEM_STRUCT, "原始文本：\n" + (raw_text or "").strip()
+
+def strip_formatting(text: str) -> str:
+    """
+    仅用于 guard 比对：去掉排版符号、把换行当空格
+    """
+    if not text:
+        return ""
+    t = text
+    t = re.sub(r"^\s*-\s*", "", t, flags=re.MULTILINE)
+    t = re.sub(r"[#*`>]", "", t)
+    t = re.sub(r"\n+", " ", t)
+    t = re.sub(r"\s+", " ", t)
+    return t.strip()
+
+# =========================
+# 输出安全闸门的比对工具（字符归一化 + ngram 覆盖率）
+# =========================
+def normalize_for_guard(t: str) -> str:
+    t = (t or "").replace("\r", "\n")
+    # 轻度去 markdown
+    t = re.sub(r"[#*`>\-]", "", t)
+    # 去空白
+    t = re.sub(r"\s+", "", t)
+    return t
+
+def build_ngrams(text: str, n: int = 3) -> set:
+    text = normalize_for_guard(text)
+    if len(text) < n:
+        return set()
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+def ngram_coverage(source: str, target: str, n: int = 3) -> float:
+    """target 的 n-gram 有多少比例出现在 source 里（都先 normalize_for_guard）"""
+    src = build_ngrams(source, n)
+    if not src:
+        return 0.0
+    tgt = normalize_for_guard(target)
+    if len(tgt) < n:
+        return 0.0
+
+    hit = 0
+    total = 0
+    for i in range(len(tgt) - n + 1):
+        total += 1
+        if tgt[i:i+n] in src:
+            hit += 1
+    return hit / total if total else 0.0
+
+def clean_json_string(json_str: str) -> str:
+    """清理和修复常见的 JSON 格式问题"""
+    if not json_str:
+        return ""
+    
+    # 移除 markdown 代码块标记
+    json_str = re.sub(r"^```(?:json)?\s*", "", json_str, flags=re.MULTILINE)
+    json_str = re.sub(r"```\s*$", "", json_str, flags=re.MULTILINE)
+    
+    # 移除前后的非 JSON 字符（保留可能的空白）
+    json_str = json_str.strip()
+    
+    # 尝试修复常见的 JSON 错误
+    # 1. 修复键名中的单引号为双引号（使用更精确的正则）
+    # 匹配 'key': 或 'key' : 这种模式
+    json_str = re.sub(r"'([^']+)'\s*:", r'"\1":', json_str)
+    
+    # 2. 移除尾随逗号（在 } 或 ] 前，但要小心字符串中的逗号）
+    # 使用负向前瞻确保不在字符串内
+    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+    
+    # 3. 移除可能的注释（虽然 JSON 标准不支持）
+    json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
+    json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
+    
+    return json_str.strip()
+
+def extract_first_json(text: str, clean: bool = True) -> str:
+    """括号匹配抽取第一个完整 JSON 对象；clean=True 时顺手跑 clean_json_string"""
+    if not text:
+        return ""
+    start = text.find("{")
+    if start < 0:
+        return ""
+    depth = 0
+    for i in range(start, len(text)):
+        ch = text[i]
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                extracted = text[start:i+1].strip()
+                # 清理提取的 JSON
+                return clean_json_string(extracted) if clean else extracted
+    return ""
+
+def parse_outline(json_text: str, repair: bool = True):
+    """
+    解析并校验 outline 结构（最多 8 条、每条最多 8 个 sub）
+
+    repair=True：解析失败先 clean_json_string 再试，还不行返回 None；
+    repair=False：不修，坏 JSON 直接抛 json.JSONDecodeError（typeinLLM 的行为，由调用方兜底）。
+    """
+    if not repair:
+        obj = json.loads(json_text)
+    elif not json_text:
+        return None
+    else:
+        obj = _loads_repaired(json_text)
+    return _validate_outline(obj)
+
+
+def _loads_repaired(json_text: str):
+    # 先尝试直接解析
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError as e:
+        # 如果失败，尝试清理后再解析
+        cleaned = clean_json_string(json_text)
+        try:
+            obj = json.loads(cleaned)
+        except json.JSONDecodeError:
+            # 如果还是失败，打印调试信息
+            print(f"[debug] JSON parse failed at position {e.pos}: {e.msg}")
+            print(f"[debug] JSON preview: {repr(json_text[:200])}")
+            print(f"[debug] Error context: {repr(json_text[max(0, e.pos-20):e.pos+20])}")
+            return None
+    return obj
+
+
+def _validate_outline(obj):
+    if not isinstance(obj, dict):
+        return None
+
+    title = obj.get("title", "")
+    bullets = obj.get("bullets", [])
+
+    if not isinstance(title, str):
+        title = ""
+    if not isinstance(bullets, list):
+        return None
+
+    cleaned = []
+    for b in bullets:
+        if not isinstance(b, dict):
+            continue
+        text = b.get("text", "")
+        if not isinstance(text, str):
+            continue
+
+        # 保持LLM输出的原始格式，不再进行工程级清洗
+        text = text.strip()
+        if not text:
+            continue
+
+        sub_list = b.get("sub", [])
+        sub_clean = []
+        if isinstance(sub_list, list):
+            for s in sub_list:
+                st = s.get("text", "") if isinstance(s, dict) else s
+                if isinstance(st, str):
+                    st = st.strip()
+                    if st:
+                        sub_clean.append({"text": st})
+
+        cleaned.append({"text": text, "sub": sub_clean})
+
+    if not cleaned:
+        return None
+
+    cleaned = cleaned[:8]
+    for b in cleaned:
+        b["sub"] = b["sub"][:8]
+
+    # 保持LLM输出的原始格式，不再进行工程级清洗
+    return {"title": title.strip(), "bullets": cleaned}
+
+def outline_to_markdown(outline: dict) -> str:
+    lines = []
+    title = (outline.get("title") or "").strip()
+    if title:
+        lines.append(f"**{title}**")
+
+    for b in outline.get("bullets", []):
+        lines.append(f"- {b['text']}")
+        for s in b.get("sub", []):
+            lines.append(f"  - {s['text']}")
+
+    return "\n".join(lines).strip()
+
+def normalize_markdown(text: str) -> str:
+    lines = []
+    for line in text.splitlines():
+        line = line.rstrip()
+
+        # 丢掉明显的废话
+        if not line:
+            continue
+        if line.startswith(("解释", "说明", "注意")):
+            continue
+
+        # 只保留 markdown 列表行
+        if line.lstrip().startswith("-"):
+            lines.append(line)
+
+    return "\n".join(lines)
+
+def smart_struct_then_render(raw_text: str, call_ollama, deadline=None, guard: dict = None) -> str:
+    """
+    口述 -> 重排后的 Markdown 列表；失败返回 ""
+
+    call_ollama(system, prompt, timeout=, mode=, deadline=, stop=, guard=) 由调用方提供
+    （实时脚本走 daemon/分级模型，批处理走自己的 policy）；guard 是 stream_guard 规格，
+    过不了时 call_ollama 抛异常，这里按失败返回 ""。
+    """
+    raw_text = (raw_text or "").strip()
+    if not raw_text:
+        return ""
+
+    pre = preprocess_before_llm(raw_text)
+
+    try:
+        system, prompt = build_prompt_reorder(pre)  # 注意：不再是 build_prompt_struct
+        resp = call_ollama(system, prompt, timeout=50, mode="reorder", deadline=deadline,
+                           stop=STOP_AFTER_ANSWER, guard=guard)
+
+        md = normalize_markdown(resp)
+
+        if not md.strip():
+            print("[debug] struct_reorder: empty markdown output")
+            return ""
+
+        result = md.strip()
+        if result:
+            print("[debug] smart_struct: success, output preview:", repr(result[:200]))
+        else:
+            print("[debug] smart_struct: markdown conversion returned empty")
+        return result
+    except json.JSONDecodeError as e:
+        # JSON 解析错误已经在 parse_outline 中处理了，这里只是兜底
+        print(f"⚠️ smart_struct: JSON decode error at position {e.pos}: {e.msg}")
+        return ""
+    except Exception as e:
+        print("⚠️ smart_struct_then_render failed:", repr(e))
+        import traceback
+        traceback.print_exc()
+        return ""
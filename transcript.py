@@ -0,0 +1,135 @@
+import re
+
+# =========================
+# 分段转写存储 + 增量 diff
+# =========================
+# 长时间口述时，preview 和上一次识别结果（last_text）都会越长越大：
+#   - 字符串 += 每次都整体拷贝
+#   - diff_new_part 每个 partial 都从第 0 个字开始用 Python 循环逐字比较
+#   - 找句子切点每次都把整段 preview 扫一遍
+# 这里改成：
+#   - SegmentBuffer：片段列表 + 累计偏移，append 摊还 O(1)；长度、非空白字数、
+#     最后一个句末位置、最后一个序号标记都在 append 时只扫新片段增量维护，
+#     只有真正切出 region / 整体替换时才 join
+#   - StreamDiff：记住上次已确认相同的前缀，下次先用 startswith（C 层 memcmp）
+#     确认这段没变，Python 循环只从这个稳定偏移往后比
+
+SENTENCE_END = "。！？!?；;"
+ORD_MARK = re.compile(r"第[一二三四五六七八九十0-9]+[点个]")
+_MARK_OVERLAP = 8              # 序号标记可能跨两个片段：新片段前面带上这么多字一起扫
+_COMPACT_AFTER = 64            # 切走的片段攒到这么多个再真正从列表里删
+
+
+def diff_new_part(prev: str, curr: str, stable: int = 0) -> str:
+    """curr 相对 prev 新增的部分；调用方保证 prev[:stable] == curr[:stable]"""
+    i = stable
+    n = min(len(prev), len(curr))
+    while i < n and prev[i] == curr[i]:
+        i += 1
+    return curr[i:]
+
+
+class StreamDiff:
+    """流式识别结果的增量：update(curr) 返回新增文本"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.prev = ""
+        self.stable = ""         # prev 和上一轮 curr 的公共前缀
+
+    def update(self, curr: str) -> str:
+        stable = len(self.stable) if curr.startswith(self.stable) else 0   # 前文被改写才从头比
+        new_part = diff_new_part(self.prev, curr, stable)
+        self.stable = curr[:len(curr) - len(new_part)]
+        self.prev = curr
+        return new_part
+
+
+class SegmentBuffer:
+    def __init__(self):
+        self.parts = []
+        self.ends = []           # 第 i 段结束处的绝对偏移
+        self.head = 0            # parts[:head] 已被切走（惰性删除）
+        self.base = 0            # 已切走的字数（绝对偏移 -> 相对偏移）
+        self.length = 0
+        self.visible = 0         # 非空白字数
+        self.sentence_end = 0    # 最后一个句末标点之后的绝对偏移
+        self.last_mark = -1      # 最后一个序号标记（第二点 / 第三个 …）的绝对起点
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def text(self) -> str:
+        return "".join(self.parts[self.head:])
+
+    def tail(self, k: int) -> str:
+        """最后 k 个字（只拼需要的几段）"""
+        out, got = [], 0
+        for i in range(len(self.parts) - 1, self.head - 1, -1):
+            if got >= k:
+                break
+            out.append(self.parts[i])
+            got += len(self.parts[i])
+        return "".join(reversed(out))[-k:] if k else ""
+
+    def append(self, text: str):
+        if not text:
+            return
+        start = self.base + self.length
+        overlap = self.tail(_MARK_OVERLAP)
+
+        self.parts.append(text)
+        self.length += len(text)
+        self.ends.append(start + len(text))
+        self.visible += len(text) - sum(ch.isspace() for ch in text)
+
+        for i in range(len(text) - 1, -1, -1):
+            if text[i] in SENTENCE_END:
+                self.sentence_end = start + i + 1
+                break
+        for m in ORD_MARK.finditer(overlap + text):
+            pos = start - len(overlap) + m.start()
+            if pos > self.last_mark:
+                self.last_mark = pos
+
+    def sentence_cut(self, min_chars: int = 0) -> int:
+        """
+        可以切出去的完整句子前缀长度（0 = 还没有）
+
+        切在最后一个句末标点之后；更靠后的新序号开头（第二点…）说明前一条已经说完，切在序号前。
+        """
+        cut = max(0, self.sentence_end - self.base)
+        mark = self.last_mark - self.base
+        if mark > cut:
+            cut = mark
+        return cut if cut >= min_chars else 0
+
+    def take(self, n: int = None) -> str:
+        """切走前 n 个字（默认全部）并返回"""
+        n = self.length if n is None else max(0, min(n, self.length))
+        end = self.base + n
+        out = []
+        while self.head < len(self.parts) and self.ends[self.head] <= end:
+            out.append(self.parts[self.head])
+            self.parts[self.head] = ""
+            self.head += 1
+        if self.head < len(self.parts) and end > self.ends[self.head] - len(self.parts[self.head]):
+            part = self.parts[self.head]
+            k = end - (self.ends[self.head] - len(part))
+            out.append(part[:k])
+            self.parts[self.head] = part[k:]
+
+        taken = "".join(out)
+        self.base = end
+        self.length -= n
+        self.visible -= len(taken) - sum(ch.isspace() for ch in taken)
+        if self.head >= _COMPACT_AFTER and self.head * 2 >= len(self.parts):
+            del self.parts[:self.head]
+            del self.ends[:self.head]
+            self.head = 0
+        return taken
@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# =========================
+# 两遍识别：流式出 preview，离线 paraformer 在后台重识别整段再拿去 commit
+# =========================
+# 流式模型可以用更小的 chunk_size（比如 [0, 5, 5]）换更快的 preview，
+# 准确率由第二遍兜底。所有解码都在自己的线程池里跑，
+# 主循环只做 list.append 和 submit，永远不会被第二遍卡住。
+#
+# 对齐规则：只有在停顿/静音处切出的 region，音频边界才可信；
+# 说话中途按标点/序号切的 region 音频边界不确定，它和紧跟着的下一段都不做第二遍。
+
+OFFLINE_MODEL = "paraformer-zh"
+RESCORE_WAIT = 2.0            # commit worker 最多等第二遍多久（秒），超时就用流式结果
+LEN_RATIO_MIN = 0.5           # 第二遍结果和流式结果长度差太多就不信
+LEN_RATIO_MAX = 2.0
+IDLE_KEEP_SAMPLES = 16000     # 没人说话时只保留最近 1s 音频（给下一句留个开头）
+
+
+class TwoPassRescorer:
+    def __init__(self, device: str = "cpu", model: str = OFFLINE_MODEL, max_workers: int = 1):
+        self.device = device
+        self.model_name = model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rescore")
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self._blocks = []
+        self._samples = 0
+        self._aligned = True
+
+        # 后台预加载，不拖慢前端启动
+        self.executor.submit(self._get_model)
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from funasr import AutoModel
+                self._model = AutoModel(model=self.model_name, device=self.device)
+        return self._model
+
+    def _decode(self, audio) -> str:
+        res = self._get_model().generate(input=audio)
+        if not res:
+            return ""
+        return res[0].get("text") or ""
+
+    # ---------- 以下都在事件循环线程里调用 ----------
+    def feed(self, block, idle: bool = False):
+        """每个音频块调用一次；idle=当前没有待 commit 的内容且没人说话"""
+        self._blocks.append(block)
+        self._samples += len(block)
+
+        if idle and self._samples > IDLE_KEEP_SAMPLES * 2:
+            audio = np.concatenate(self._blocks)[-IDLE_KEEP_SAMPLES:]
+            self._blocks = [audio]
+            self._samples = len(audio)
+
+    def drop_segment(self):
+        """说话中途切句：这一段和下一段的音频边界都不可信，不做第二遍"""
+        self._blocks = []
+        self._samples = 0
+        self._aligned = False
+
+    def submit_segment(self):
+        """在停顿/静音处切 region 时调用，返回 Future（或 None = 不做第二遍）"""
+        blocks = self._blocks
+        self._blocks = []
+        self._samples = 0
+
+        if not self._aligned:
+            self._aligned = True
+            return None
+        if not blocks:
+            return None
+        return self.executor.submit(self._decode, np.concatenate(blocks))
+
+
+def pick_text(future, streaming_text: str, wait: float = RESCORE_WAIT) -> str:
+    """commit worker 线程里调用：第二遍结果可用且靠谱就用它，否则用流式结果"""
+    if future is None:
+        return streaming_text
+    try:
+        text = (future.result(timeout=wait) or "").strip()
+    except Exception as e:
+        print("⚠️ 2pass skipped:", repr(e))
+        return streaming_text
+
+    if not text:
+        return streaming_text
+    ratio = len(text) / max(1, len(streaming_text.strip()))
+    if not (LEN_RATIO_MIN <= ratio <= LEN_RATIO_MAX):
+        print(f"[2pass] rejected (len ratio {ratio:.2f}): {text!r}")
+        return streaming_text
+
+    print(f"[2pass] {streaming_text!r} -> {text!r}")
+    return text
@@ -1,20 +1,14 @@
-import sounddevice as sd
 import numpy as np
 import pyautogui
 import pyperclip
-from funasr import AutoModel
-from queue import Queue
-import time
-
-# =========================
-# 工具：diff 新增文本
-# =========================
-def diff_new_part(prev: str, curr: str):
-    i = 0
-    while i < len(prev) and i < len(curr) and prev[i] == curr[i]:
-        i += 1
-    return curr[i:]
+import asyncio
 
+import async_runtime
+import audio_capture
+import chunk_tuner
+import live_config
+import talkie_daemon
+import transcript
 
 # =========================
 # 0. paste 工具（核心）
@@ -27,9 +21,11 @@ def paste_text(text: str):
 # =========================
 # 1. 初始化模型
 # =========================
-model = AutoModel(
+# talkie_daemon 在跑就直接连上去（毫秒级），否则本地加载
+ASR_DEVICE = "mps"
+model = talkie_daemon.load_asr_model(
     model="paraformer-zh-streaming",
-    device="mps"
+    device=ASR_DEVICE
 )
 
 # =========================
@@ -39,71 +35,103 @@ sample_rate = 16000
 chunk_size = [0, 10, 5]
 encoder_chunk_look_back = 4
 decoder_chunk_look_back = 1
+# 本机标定过（python -m chunk_tuner）就用标定结果；talkie.toml 里写了的仍然优先
+# （启动时 watcher 读到文件就覆盖上去，运行中改文件会热更新，见下面的 apply_config）
+live_config.apply_to(globals(), chunk_tuner.load_profile(ASR_DEVICE))
 chunk_stride = chunk_size[1] * 960
 
 cache = {}
 audio_buffer = np.zeros((0,), dtype=np.float32)
-last_text = ""
+# 流式结果的增量（记住稳定前缀，不再每次从头逐字比较，见 transcript.py）
+stream_diff = transcript.StreamDiff()
 
-text_queue = Queue()
+runtime = async_runtime.Runtime()
+# 按麦克风原生采样率/声道采集，回调只投递原始 block（见 audio_capture.py）
+capture = audio_capture.AudioCapture(runtime.feed_audio)
 
 # =========================
-# 3. 音频回调（只负责 ASR）
+# 3. ASR 任务（推理在 ASR executor 里）
 # =========================
-def record_callback(indata, frames, time_info, status):
-    global audio_buffer, last_text
+def asr_step(chunk):
+    return model.generate(
+        input=chunk,
+        cache=cache,
+        is_final=False,
+        chunk_size=chunk_size,
+        encoder_chunk_look_back=encoder_chunk_look_back,
+        decoder_chunk_look_back=decoder_chunk_look_back,
+    )
+
+
+async def asr_loop():
+    global audio_buffer
+
+    while True:
+        audio = capture.convert(await runtime.audio_queue.get())
+        audio_buffer = np.concatenate([audio_buffer, audio])
+
+        while len(audio_buffer) >= chunk_stride:
+            chunk = audio_buffer[:chunk_stride]
+            audio_buffer = audio_buffer[chunk_stride:]
+
+            res = await runtime.run_asr(asr_step, chunk)
+
+            if not res or not res[0].get("text"):
+                continue
 
-    audio = indata[:, 0].astype(np.float32)
-    audio_buffer = np.concatenate([audio_buffer, audio])
+            text = res[0]["text"]
+            new_part = stream_diff.update(text)
 
-    while len(audio_buffer) >= chunk_stride:
-        chunk = audio_buffer[:chunk_stride]
-        audio_buffer = audio_buffer[chunk_stride:]
+            if new_part.strip():
+                print("🆕 new_part:", repr(new_part))
+                runtime.run_io(paste_text, new_part)   # ⭐⭐⭐ 核心在这里
 
-        res = model.generate(
-            input=chunk,
-            cache=cache,
-            is_final=False,
-            chunk_size=chunk_size,
-            encoder_chunk_look_back=encoder_chunk_look_back,
-            decoder_chunk_look_back=decoder_chunk_look_back,
-        )
 
-        if not res or not res[0].get("text"):
-            return
+# =========================
+# 4. 配置热更新：流式参数变了只清 ASR cache
+# =========================
+def reset_asr_cache():
+    cache.clear()
+
 
-        text = res[0]["text"]
-        new_part = diff_new_part(last_text, text)
+def apply_config(changes: dict):
+    """在事件循环里执行（watcher 线程通过 runtime.post 投递过来）"""
+    global chunk_stride
 
-        if new_part.strip():
-            print("🆕 new_part:", repr(new_part))
-            text_queue.put(new_part)
+    live_config.apply_to(globals(), changes)
 
-        last_text = text
+    if live_config.STREAMING_KEYS & changes.keys():
+        chunk_stride = chunk_size[1] * 960
+        stream_diff.reset()
+        # 放进 ASR executor 排队，保证不会和正在跑的 generate 抢 cache
+        runtime.run_asr(reset_asr_cache)
+
+    print(f"🔧 config applied: {changes}")
 
 
 # =========================
-# 4. 启动麦克风 & 主线程粘贴
+# 5. 启动麦克风 & 事件循环
 # =========================
 print("🎙 请把光标放在任意输入框（微信 / 记事本 / 浏览器都行）")
 print("👉 连续说话 3~5 秒")
 
-with sd.InputStream(
-    samplerate=sample_rate,
-    channels=1,
-    dtype="float32",
-    blocksize=1024,
-    callback=record_callback,
-):
-    try:
-        while True:
-            while not text_queue.empty():
-                text = text_queue.get()
-                paste_text(text)   # ⭐⭐⭐ 核心在这里
-
-            sd.sleep(20)
-
-    except KeyboardInterrupt:
-        print("\n🛑 stopped")
+
+async def main():
+    runtime.start()
+
+    watcher = live_config.ConfigWatcher(
+        live_config.snapshot(globals()),
+        on_change=lambda changes: runtime.post(apply_config, changes),
+    )
+    watcher.start()
+
+    with capture.open():
+        await asr_loop()
+
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print("\n🛑 stopped")
 
 # 这是一个我本地部署的ai语音输入法然后呢第一点是可以做换行第二点是可以做处理第三点是可以做这个这个
\ No newline at end of file
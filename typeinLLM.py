@@ -1,45 +1,70 @@
-import sounddevice as sd
 import numpy as np
 import pyautogui
 import pyperclip
-import requests
-from funasr import AutoModel
-from queue import Queue
-import time
-import threading
-import re
-import json
+import asyncio
 from difflib import SequenceMatcher
 
+import async_runtime
+import audio_capture
+import chunk_tuner
+import commit_journal
+import commit_worker
+import cpu_budget
+import kv_prefill
+import live_config
+import metrics
+import session_recorder
+import stream_guard
+import llm_policy
+import talkie_daemon
+import transcript
+import textproc
+import two_pass
+
 # =========================
 # 参数区（你后面调参就调这里）
 # =========================
+# 也可以写在 talkie.toml 里（见 talkie.example.toml），运行中改文件会热更新
 SILENCE_TIMEOUT = 0.6          # 静音超过多少秒 -> commit
 ENERGY_THRESHOLD = 0.008       # 静音能量阈值（不同麦克风要调，偏小更敏感）
 MIN_COMMIT_GAP = 0.8           # 两次 commit 最小间隔（防抖）
 
+# 多个 Ollama 实例时写成列表，按在途请求数负载均衡（见 ollama_client.BackendPool）
 OLLAMA_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "qwen3:1.7b"
+# 模型分级（便宜 → 贵），每次 commit 由 llm_policy 按输入长度/模式/实测速度选档
+OLLAMA_MODEL_TIERS = ["qwen3:0.6b", "qwen3:1.7b"]
 
 LLM_MODE = "smart_markdown"    # "clean" / "markdown" / "smart_markdown"
 
+# 两遍识别：离线 paraformer 在后台重识别整段音频，结果替换流式文本再送 LLM
+# （打开后可以把 chunk_size 调小，比如 [0, 5, 5]，preview 更快）
+TWO_PASS_ENABLED = False
+TWO_PASS_DEVICE = "cpu"
+
+# 会话录音：16k 音频写进 mmap 环形文件（默认 1 小时），每次 commit 打一个标记，
+# 出问题时用 python -m session_recorder list / export 把那段话导出来复现
+RECORD_SESSION = False
+
+# commit 日志：每次 commit 的原文 / 预清洗 / 模型 / 输出 / guard 分数追加写进 journal/（二进制，
+# 批量 fsync），崩溃或 LLM 改坏时用 python -m commit_journal list / show / export 找回原文
+JOURNAL_COMMITS = True
+
+# Prometheus 指标端点（http://127.0.0.1:9464/metrics，端口可用 TALKIE_METRICS_PORT 改）
+METRICS_ENABLED = True
+
 # 输出安全闸门阈值（建议先用这组，后面再微调）
 SAFE_SIM_HIGH = 0.70
 SAFE_SIM_LOW  = 0.55
 SAFE_NGRAM_COV = 0.55
 
-# 粘贴节奏
-pyautogui.PAUSE = 0.005
+# 流式 guard：clean / markdown 生成过程中按上面的相似度下限换算出长度上限，超过（注定过不了）就提前断开
+STREAM_GUARD = True
 
+# 说话过程中就把 commit 要发的 prompt 送去 prompt eval（见 kv_prefill.py），静音后只剩最后几个字和生成
+PREFILL_DURING_SPEECH = True
 
-# =========================
-# 工具：diff 新增文本
-# =========================
-def diff_new_part(prev: str, curr: str) -> str:
-    i = 0
-    while i < len(prev) and i < len(curr) and prev[i] == curr[i]:
-        i += 1
-    return curr[i:]
+# 粘贴节奏
+pyautogui.PAUSE = 0.005
 
 
 # =========================
@@ -61,93 +86,18 @@ def delete_chars(n: int):
     pyautogui.press("backspace", presses=n, interval=0)
 
 
-# =========================
-# Step1：工程预清洗（结构化前掰开粘连）
-# =========================
-_ORD_PATTERN = r'(第[一二三四五六七八九十]+个\s*[:：])'
-
-def split_ordered_items(text: str) -> str:
-    """把 '第一个：xx第二个：yy' 拆成多行（仅拆结构，不新增内容）"""
-    if not text:
-        return text
-    if text.count("第") < 2:
-        return text
-    if not (("第二个" in text) or ("第三个" in text) or ("第四个" in text)):
-        return text
-    if not re.search(_ORD_PATTERN, text):
-        return text
-
-    parts = re.split(_ORD_PATTERN, text)
-    if len(parts) <= 1:
-        return text
-
-    lines = []
-    current = ""
-    for part in parts:
-        if re.match(_ORD_PATTERN, part):
-            if current.strip():
-                lines.append(current.strip())
-            current = part
-        else:
-            current += part
-
-    if current.strip():
-        lines.append(current.strip())
-
-    return "\n".join(lines)
-
-
-def preprocess_before_llm(raw_text: str) -> str:
-    t = (raw_text or "").strip()
-    if not t:
-        return ""
-    t = re.sub(r"[ \t]+", " ", t)
-    t = split_ordered_items(t)
-    t = t.replace("。-", "。\n-")
-    return t.strip()
-
-
 # =========================
 # 输出安全闸门：字符相似度 + ngram 覆盖率（实时友好）
 # =========================
-def normalize_for_guard(t: str) -> str:
-    # 去掉 markdown 符号、空白、常见噪声
-    t = (t or "")
-    t = t.replace("\r", "\n")
-    t = re.sub(r"[#*`>\-]", "", t)     # 轻度去 markdown
-    t = re.sub(r"\s+", "", t)
-    return t
-
-def build_ngrams(text: str, n: int = 3) -> set:
-    text = normalize_for_guard(text)
-    if len(text) < n:
-        return set()
-    return {text[i:i+n] for i in range(len(text) - n + 1)}
-
-def ngram_coverage(source: str, target: str, n: int = 3) -> float:
-    src = build_ngrams(source, n)
-    if not src:
-        return 0.0
-    tgt = normalize_for_guard(target)
-    if len(tgt) < n:
-        return 0.0
-
-    hit = 0
-    total = 0
-    for i in range(len(tgt) - n + 1):
-        total += 1
-        if tgt[i:i+n] in src:
-            hit += 1
-    return hit / total if total else 0.0
-
 def is_llm_output_safe(raw_text: str, processed_text: str) -> bool:
-    raw_n = normalize_for_guard(raw_text)
-    out_n = normalize_for_guard(processed_text)
+    raw_n = textproc.normalize_for_guard(raw_text)
+    out_n = textproc.normalize_for_guard(processed_text)
     if not raw_n or not out_n:
         return False
 
     sim = SequenceMatcher(None, raw_n, out_n).ratio()
-    cov = ngram_coverage(raw_n, out_n, n=3)
+    cov = textproc.ngram_coverage(raw_n, out_n, n=3)
+    commit_journal.note_guard(sim=sim, cov=cov)
 
     # 你可以把这两行 print 打开，调参用
     # print(f"[guard] sim={sim:.3f} cov={cov:.3f}")
@@ -159,67 +109,103 @@ def is_llm_output_safe(raw_text: str, processed_text: str) -> bool:
     return False
 
 
+def stream_guard_for(raw_text: str):
+    """
+    和 is_llm_output_safe 对应的流式 guard 规格（STREAM_GUARD 关掉时返回 None）
+
+    相似度 sim = 2M/(a+b) <= 2a/(a+b)：输出归一化后超过 a × (2/SAFE_SIM_LOW - 1) 字，
+    sim 一定低于 SAFE_SIM_LOW，终检一定不过。覆盖率不在流式里判：sim >= SAFE_SIM_HIGH 时终检不看覆盖率。
+    """
+    if not STREAM_GUARD or len(raw_text) < stream_guard.MIN_SOURCE_CHARS:
+        return None
+    a = len(textproc.normalize_for_guard(raw_text))
+    return {"max_chars": a * (2 / SAFE_SIM_LOW - 1)}
+
+
 # =========================
 # LLM：通用调用（加 stop，减少 # /think 污染）
 # =========================
-def call_ollama(prompt: str, timeout: int = 40) -> str:
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.0,
-            "top_p": 0.75,
-            "repeat_penalty": 1.15,
-            # 关键：一旦开始吐这些，就截断
-            "stop": ["\n#", "\n/think", "/think", "<think>", "</think>"],
-        },
-    }
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    data = resp.json()
+# options 固定为模块常量：每次请求完全一致，runner 不会因参数变化而重载
+OLLAMA_OPTIONS = {
+    "temperature": 0.0,
+    "top_p": 0.75,
+    "repeat_penalty": 1.15,
+    # 关键：一旦开始吐这些，就截断
+    "stop": ["\n#", "\n/think", "/think", "<think>", "</think>"],
+}
+
+MODEL_POLICY = llm_policy.ModelPolicy(OLLAMA_MODEL_TIERS)
+
+def call_ollama(system: str, prompt: str, timeout: int = 40, mode: str = "clean", deadline=None,
+                stop=None, format: str = None, guard: dict = None) -> str:
+    # daemon 在就由 daemon 代发（多个前端共享模型速度统计）
+    # num_predict 由 llm_policy 按输入长度/模式给；stop / format 由调用方按输出形态给
+    # guard（stream_guard 规格）给了就边生成边检查，注定过不了终检的输出提前断开
+    try:
+        data = talkie_daemon.generate_tiered(
+            MODEL_POLICY, system, prompt, mode, deadline=deadline,
+            timeout=timeout, options=OLLAMA_OPTIONS, url=OLLAMA_URL, stop=stop, format=format, guard=guard,
+        )
+    except llm_policy.DeadlineExceeded:
+        metrics.LLM_ERRORS.labels(mode, "deadline").inc()
+        raise
+    except llm_policy.RunawayGeneration:
+        metrics.LLM_ERRORS.labels(mode, "runaway").inc()
+        raise
+    except llm_policy.GuardAbort as e:
+        metrics.LLM_ERRORS.labels(mode, "guard").inc()
+        print(f"🧯 stream guard: {e}")
+        raise
+    except Exception:
+        metrics.LLM_ERRORS.labels(mode, "error").inc()
+        raise
+    commit_journal.note(mode=mode, model=data.get("model", ""))
     return (data.get("response") or "").strip()
 
 
 # =========================
 # 传统后处理（clean/markdown）
 # =========================
-def build_prompt_edit(raw_text: str, mode: str) -> str:
-    base_rules = (
-        "你是一个【文本后处理器】，只做编辑，不做解释。\n"
-        "只允许修改原文表达，不允许补充、推测、解释。\n\n"
-        "编辑规则：\n"
-        "1. 删除口语填充词、重复词（如：呃、啊、然后、其实、就是）。\n"
-        "2. 修正明显错别字和病句，使表达更通顺。\n"
-        "3. 不新增任何信息，不推测、不补充、不评论。\n"
-        "4. 只输出最终结果，不要输出编辑说明。\n"
-        "5. 禁止输出：#、/think、<think>、解释性段落。\n"
-    )
+# 固定指令（system 前缀）：必须是常量，逐字节稳定才能命中 KV 缓存
+_EDIT_BASE_RULES = (
+    "你是一个【文本后处理器】，只做编辑，不做解释。\n"
+    "只允许修改原文表达，不允许补充、推测、解释。\n\n"
+    "编辑规则：\n"
+    "1. 删除口语填充词、重复词（如：呃、啊、然后、其实、就是）。\n"
+    "2. 修正明显错别字和病句，使表达更通顺。\n"
+    "3. 不新增任何信息，不推测、不补充、不评论。\n"
+    "4. 只输出最终结果，不要输出编辑说明。\n"
+    "5. 禁止输出：#、/think、<think>、解释性段落。\n"
+)
 
-    if mode == "clean":
-        fmt = (
-            "输出要求：\n"
-            "- 只输出一段连续中文文本。\n"
-            "- 不要标题，不要列表，不要空行。\n"
-        )
-    else:
-        fmt = (
-            "输出要求：\n"
-            "- 仅在原文本本身明显是列点时，才使用列表符号（- 或 1.）。\n"
-            "- 不要输出说明性词语，不要解释。\n"
-            "- 不要使用 # 作为标题。\n"
-        )
+SYSTEM_EDIT_CLEAN = _EDIT_BASE_RULES + (
+    "输出要求：\n"
+    "- 只输出一段连续中文文本。\n"
+    "- 不要标题，不要列表，不要空行。\n"
+)
+
+SYSTEM_EDIT_MARKDOWN = _EDIT_BASE_RULES + (
+    "输出要求：\n"
+    "- 仅在原文本本身明显是列点时，才使用列表符号（- 或 1.）。\n"
+    "- 不要输出说明性词语，不要解释。\n"
+    "- 不要使用 # 作为标题。\n"
+)
 
-    return base_rules + fmt + "\n原始文本如下：\n" + raw_text.strip()
 
+def build_prompt_edit(raw_text: str, mode: str):
+    """返回 (system, prompt)：system 固定，prompt 只含本次原文"""
+    system = SYSTEM_EDIT_CLEAN if mode == "clean" else SYSTEM_EDIT_MARKDOWN
+    return system, "原始文本如下：\n" + raw_text.strip()
 
-def call_ollama_postprocess(raw_text: str, mode: str) -> str:
+
+def call_ollama_postprocess(raw_text: str, mode: str, deadline=None, guard: dict = None) -> str:
     raw_text = (raw_text or "").strip()
     if not raw_text:
         return ""
-    prompt = build_prompt_edit(raw_text, mode)
+    system, prompt = build_prompt_edit(raw_text, mode)
     try:
-        text = call_ollama(prompt, timeout=40)
+        text = call_ollama(system, prompt, timeout=40, mode=mode, deadline=deadline,
+                           stop=textproc.STOP_AFTER_ANSWER, guard=guard)
         return text if text else raw_text
     except Exception as e:
         print("⚠️ Ollama call failed:", repr(e))
@@ -229,144 +215,58 @@ def call_ollama_postprocess(raw_text: str, mode: str) -> str:
 # =========================
 # Step2：结构化理解（LLM 输出 JSON）
 # =========================
-def build_prompt_struct(raw_text: str) -> str:
-    return (
-        "你是一个【结构重排器】，不是解释器、不是总结器。\n"
-        "只做：拆分、换行、分组。禁止：推测、解释、补全。\n\n"
-        "硬性约束：\n"
-        "1) 只输出一个 JSON 对象，除此之外不要输出任何字符。\n"
-        "2) 不新增事实，不推测，不补充未提及信息。\n"
-        "3) 每条要点尽量短，一句话一个要点。\n"
-        "4) 最多两层：bullets + sub。\n"
-        "5) 禁止输出：#、/think、<think>、解释性句子（如“询问/是否/可能/用于/表示”）。\n\n"
-        "JSON 结构必须严格为：\n"
-        "{\"title\":\"\",\"bullets\":[{\"text\":\"\",\"sub\":[{\"text\":\"\"}]}]}\n\n"
-        "原始文本：\n"
-        + raw_text.strip()
-    )
-
-def strip_formatting(text: str) -> str:
-    """
-    去掉所有排版信息，只保留“纯内容”
-    """
-    if not text:
-        return ""
-
-    t = text
-    # 去 markdown 符号
-    t = re.sub(r"^\s*-\s*", "", t, flags=re.MULTILINE)
-    t = re.sub(r"^\s*\*\*|\*\*\s*$", "", t, flags=re.MULTILINE)
-    t = re.sub(r"[#*`>]", "", t)
-
-    # 把换行当成空格
-    t = re.sub(r"\n+", " ", t)
-
-    # 压缩空白
-    t = re.sub(r"\s+", " ", t)
-
-    return t.strip()
-
-def extract_first_json(text: str) -> str:
-    """括号匹配抽取第一个完整 JSON 对象"""
-    if not text:
-        return ""
-    start = text.find("{")
-    if start < 0:
-        return ""
-    depth = 0
-    for i in range(start, len(text)):
-        ch = text[i]
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return text[start:i+1].strip()
-    return ""
-
-
-def parse_outline(json_text: str):
-    """解析并校验 outline 结构"""
-    obj = json.loads(json_text)
-    if not isinstance(obj, dict):
-        return None
-
-    title = obj.get("title", "")
-    bullets = obj.get("bullets", [])
-
-    if not isinstance(title, str):
-        title = ""
-    if not isinstance(bullets, list):
-        return None
-
-    cleaned = []
-    for b in bullets:
-        if not isinstance(b, dict):
-            continue
-        text = b.get("text", "")
-        if not isinstance(text, str):
-            continue
-        text = text.strip()
-        if not text:
-            continue
-
-        sub_list = b.get("sub", [])
-        sub_clean = []
-        if isinstance(sub_list, list):
-            for s in sub_list:
-                st = s.get("text", "") if isinstance(s, dict) else s
-                if isinstance(st, str):
-                    st = st.strip()
-                    if st:
-                        sub_clean.append({"text": st})
-
-        cleaned.append({"text": text, "sub": sub_clean})
-
-    if not cleaned:
-        return None
-
-    cleaned = cleaned[:8]
-    for b in cleaned:
-        b["sub"] = b["sub"][:8]
-
-    return {"title": title.strip(), "bullets": cleaned}
-
+SYSTEM_STRUCT = (
+    "你是一个【结构重排器】，不是解释器、不是总结器。\n"
+    "只做：拆分、换行、分组。禁止：推测、解释、补全。\n\n"
+    "硬性约束：\n"
+    "1) 只输出一个 JSON 对象，除此之外不要输出任何字符。\n"
+    "2) 不新增事实，不推测，不补充未提及信息。\n"
+    "3) 每条要点尽量短，一句话一个要点。\n"
+    "4) 最多两层：bullets + sub。\n"
+    "5) 禁止输出：#、/think、<think>、解释性句子（如“询问/是否/可能/用于/表示”）。\n\n"
+    "JSON 结构必须严格为：\n"
+    "{\"title\":\"\",\"bullets\":[{\"text\":\"\",\"sub\":[{\"text\":\"\"}]}]}\n"
+)
 
-def outline_to_markdown(outline: dict) -> str:
-    """工程渲染 Markdown（稳定）"""
-    lines = []
-    title = (outline.get("title") or "").strip()
-    if title:
-        lines.append(f"**{title}**")
+def build_prompt_struct(raw_text: str):
+    return SYSTEM_STRUCT, "原始文本：\n" + raw_text.strip()
 
-    for b in outline.get("bullets", []):
-        lines.append(f"- {b['text']}")
-        for s in b.get("sub", []):
-            lines.append(f"  - {s['text']}")
 
-    return "\n".join(lines).strip()
+# 预清洗 / JSON 抽取 / 大纲解析都在 textproc.py（import 无副作用，bench_textprops 覆盖）。
+# 这个脚本用的是老口径：preprocess_basic 只拆“第X个：”不加软换行；JSON 不修，坏了直接抛、整段回退。
+def prefill_commit_prompt(raw: str):
+    """按 postprocess 第一次 LLM 调用的方式拼 prompt，只做 prompt eval（kv_prefill 线程里调）"""
+    raw_clean = textproc.preprocess_basic(raw)
+    if LLM_MODE == "smart_markdown":
+        system, prompt = build_prompt_struct(textproc.preprocess_basic(raw_clean))
+        mode = "struct"
+    else:
+        system, prompt = build_prompt_edit(raw_clean, LLM_MODE)
+        mode = LLM_MODE
+    return talkie_daemon.prefill(MODEL_POLICY, system, prompt, mode, deadline=llm_policy.deadline_for(raw_clean),
+                                 options=OLLAMA_OPTIONS, url=OLLAMA_URL)
 
 
-def smart_struct_then_render(raw_text: str) -> str:
+def smart_struct_then_render(raw_text: str, deadline=None) -> str:
     """两阶段：结构化(JSON) -> 工程渲染 Markdown；失败返回空串"""
     raw_text = (raw_text or "").strip()
     if not raw_text:
         return ""
 
-    pre = preprocess_before_llm(raw_text)
+    pre = textproc.preprocess_basic(raw_text)
 
     try:
-        prompt = build_prompt_struct(pre)
-        resp = call_ollama(prompt, timeout=50)
-        js = extract_first_json(resp)
+        system, prompt = build_prompt_struct(pre)
+        resp = call_ollama(system, prompt, timeout=50, mode="struct", deadline=deadline, format="json")
+        js = textproc.extract_first_json(resp, clean=False)
         if not js:
             return ""
 
-        outline = parse_outline(js)
+        outline = textproc.parse_outline(js, repair=False)
         if not outline:
             return ""
 
-        md = outline_to_markdown(outline)
+        md = textproc.outline_to_markdown(outline)
         return md.strip() if md.strip() else ""
     except Exception as e:
         print("⚠️ smart_struct_then_render failed:", repr(e))
@@ -376,9 +276,14 @@ def smart_struct_then_render(raw_text: str) -> str:
 # =========================
 # 1. 初始化 ASR 模型
 # =========================
-model = AutoModel(
+# talkie_daemon 在跑就直接连上去（毫秒级），否则本地加载
+ASR_DEVICE = "mps"
+# 纯 CPU 时给流式 ASR 留专用核、其余给 LLM（按主机配置见 cpu_budget.py），要在加载模型之前
+budget = cpu_budget.load(ASR_DEVICE)
+cpu_budget.apply(budget)
+model = talkie_daemon.load_asr_model(
     model="paraformer-zh-streaming",
-    device="mps"
+    device=ASR_DEVICE
 )
 
 # =========================
@@ -388,156 +293,317 @@ sample_rate = 16000
 chunk_size = [0, 10, 5]
 encoder_chunk_look_back = 4
 decoder_chunk_look_back = 1
+# 本机标定过（python -m chunk_tuner）就用标定结果；talkie.toml 里写了的仍然优先
+live_config.apply_to(globals(), chunk_tuner.load_profile(ASR_DEVICE))
 chunk_stride = chunk_size[1] * 960
 
 cache = {}
 audio_buffer = np.zeros((0,), dtype=np.float32)
-last_text = ""
+# 流式结果的增量（记住稳定前缀，不再每次从头逐字比较，见 transcript.py）
+stream_diff = transcript.StreamDiff()
 
-text_queue = Queue()
+# 每个 chunk 的解码耗时 -> RTF；跟不上实时就降档，等下一个端点（cache 本来就要清）再切
+rtf_monitor = chunk_tuner.RTFMonitor(live_config.snapshot(globals()))
+pending_profile = None
 
 # =========================
 # 3. 运行时状态（核心：preview + commit）
 # =========================
-state_lock = threading.Lock()
+# preview / 待替换 region 都由 commit_worker.DocumentRegions 管理（见第 5 节）
+# 时间一律用单调时钟（async_runtime.clock）
+runtime = async_runtime.Runtime(
+    asr_initializer=None if budget is None else lambda: cpu_budget.init_asr_thread(budget)
+)
+# 按麦克风原生采样率/声道采集，回调只投递原始 block（见 audio_capture.py）
+capture = audio_capture.AudioCapture(runtime.feed_audio)
+rescorer = two_pass.TwoPassRescorer(device=TWO_PASS_DEVICE) if TWO_PASS_ENABLED else None
+recorder = session_recorder.SessionRecorder() if RECORD_SESSION else None
 
-preview_raw_text = ""
-preview_len = 0
-last_voice_time = time.time()
 last_commit_time = 0.0
-committing = False
 
 
 # =========================
-# 4. 音频回调（只负责 ASR + 能量检测 + 推送增量）
+# 4. ASR 任务（音频回调只投递，推理在 ASR executor 里）
 # =========================
-def record_callback(indata, frames, time_info, status):
-    global audio_buffer, last_text, last_voice_time
-
-    audio_mono = indata[:, 0].astype(np.float32)
-    rms = float(np.sqrt(np.mean(audio_mono * audio_mono)) + 1e-12)
-    if rms > ENERGY_THRESHOLD:
-        last_voice_time = time.time()
-
-    audio_buffer = np.concatenate([audio_buffer, audio_mono])
+def asr_step(chunk):
+    return model.generate(
+        input=chunk,
+        cache=cache,
+        is_final=False,
+        chunk_size=chunk_size,
+        encoder_chunk_look_back=encoder_chunk_look_back,
+        decoder_chunk_look_back=decoder_chunk_look_back,
+    )
 
-    while len(audio_buffer) >= chunk_stride:
-        chunk = audio_buffer[:chunk_stride]
-        audio_buffer = audio_buffer[chunk_stride:]
 
-        res = model.generate(
-            input=chunk,
+def asr_final_step(tail_audio):
+    """端点：is_final=True 把 lookahead 里卡住的尾字吐出来，然后清 cache 开始新流"""
+    try:
+        return model.generate(
+            input=tail_audio,
             cache=cache,
-            is_final=False,
+            is_final=True,
             chunk_size=chunk_size,
             encoder_chunk_look_back=encoder_chunk_look_back,
             decoder_chunk_look_back=decoder_chunk_look_back,
         )
+    finally:
+        # cache 只活一句话：长时间会话内存和每 chunk 开销都不会涨
+        cache.clear()
 
-        if not res or not res[0].get("text"):
-            return
 
-        text = res[0]["text"]
-        new_part = diff_new_part(last_text, text)
+async def finalize_stream():
+    """静音端点：先 flush 尾字，再把整段 preview（含尾字）作为一个 region commit"""
+    global audio_buffer, pending_profile
 
-        if new_part.strip():
-            text_queue.put(new_part)
+    tail_audio = audio_buffer
+    audio_buffer = np.zeros((0,), dtype=np.float32)
 
-        last_text = text
+    # ASR executor 是单线程，排在所有已提交的 chunk 之后执行
+    res = await runtime.run_asr(asr_final_step, tail_audio)
 
+    if res and res[0].get("text"):
+        tail = stream_diff.update(res[0]["text"])
+        if tail.strip():
+            print("🔚 endpoint tail:", repr(tail))
+            on_partial(tail)
+    stream_diff.reset()
 
-# =========================
-# 5. Commit：静音后触发 LLM → 安全闸门 → 替换 preview
-# =========================
-def try_commit_if_needed():
-    global preview_raw_text, preview_len, last_commit_time, committing
+    if pending_profile is not None:
+        apply_config(pending_profile)
+        pending_profile = None
 
-    now = time.time()
+    commit_endpoint()
 
-    with state_lock:
-        if committing:
-            return
-        if preview_len <= 0:
-            return
-        if now - last_voice_time < SILENCE_TIMEOUT:
-            return
-        if now - last_commit_time < MIN_COMMIT_GAP:
-            return
 
-        committing = True
-        raw_to_process = preview_raw_text
-        chars_to_delete = preview_len
+def on_silence():
+    asyncio.ensure_future(finalize_stream())
 
-    print("\n🧠 commit trigger -> post-process...")
 
-    raw_clean = preprocess_before_llm(raw_to_process)
+def on_voice():
+    """有声音：重置静音定时器"""
+    runtime.set_timer("silence", SILENCE_TIMEOUT, on_silence)
+
+
+def on_partial(new_part: str):
+    runtime.run_io(paste_text, new_part)
+    doc.append_preview(new_part)
+    if prefiller is not None:
+        prefiller.offer(doc.preview_len, lambda: doc.preview)
+
+
+async def asr_loop():
+    global audio_buffer, pending_profile
+
+    while True:
+        # 降混 + 重采样到 16k：在事件循环里做，不占音频回调线程
+        audio_mono = capture.convert(await runtime.audio_queue.get())
+        if recorder is not None:
+            recorder.write(audio_mono)
+
+        rms = float(np.sqrt(np.mean(audio_mono * audio_mono)) + 1e-12)
+        if rms > ENERGY_THRESHOLD:
+            on_voice()
+
+        if rescorer is not None:
+            rescorer.feed(audio_mono, idle=not doc.preview_len and rms <= ENERGY_THRESHOLD)
+
+        audio_buffer = np.concatenate([audio_buffer, audio_mono])
+
+        while len(audio_buffer) >= chunk_stride:
+            chunk = audio_buffer[:chunk_stride]
+            audio_buffer = audio_buffer[chunk_stride:]
+
+            t0 = async_runtime.clock()
+            res = await runtime.run_asr(asr_step, chunk)
+            step_down = rtf_monitor.observe(async_runtime.clock() - t0)
+            if step_down is not None:
+                pending_profile = step_down
+
+            if not res or not res[0].get("text"):
+                continue
+
+            text = res[0]["text"]
+            new_part = stream_diff.update(text)
+
+            if new_part.strip():
+                on_partial(new_part)
+
+
+# =========================
+# 5. Commit：静音后触发 LLM → 安全闸门 → 替换 preview
+# =========================
+def postprocess(raw_to_process: str) -> str:
+    """预清洗 → LLM → 安全闸门 → 兜底（在后台 worker 线程里跑）"""
+    raw_clean = textproc.preprocess_basic(raw_to_process)
+    commit_journal.note(preprocessed=raw_clean, mode=LLM_MODE)
+
+    # 本次 commit 的延迟 deadline：过了就不再等 LLM，直接用 raw_clean
+    deadline = llm_policy.deadline_for(raw_clean)
 
     processed = ""
     if LLM_MODE == "smart_markdown":
-        processed = smart_struct_then_render(raw_clean)
+        processed = smart_struct_then_render(raw_clean, deadline=deadline)
 
         # 安全闸门：挡掉推测性输出
         if processed:
-            raw_for_guard = strip_formatting(raw_to_process)
-            out_for_guard = strip_formatting(processed)
+            raw_for_guard = textproc.strip_formatting(raw_to_process)
+            out_for_guard = textproc.strip_formatting(processed)
 
             if not is_llm_output_safe(raw_for_guard, out_for_guard):
+                metrics.GUARD_REJECTIONS.labels(LLM_MODE).inc()
                 print("🧯 guard rejected output -> fallback clean")
                 processed = ""
 
+        if not processed and llm_policy.expired(deadline):
+            metrics.FALLBACKS.labels(LLM_MODE, "deadline").inc()
+            print("⏱ commit deadline passed -> raw_clean")
+            processed = raw_clean
+
         if not processed:
-            processed = call_ollama_postprocess(raw_clean, mode="clean").strip()
+            metrics.FALLBACKS.labels(LLM_MODE, "clean").inc()
+            processed = call_ollama_postprocess(raw_clean, mode="clean", deadline=deadline).strip()
 
     else:
-        processed = call_ollama_postprocess(raw_clean, LLM_MODE).strip()
+        processed = call_ollama_postprocess(raw_clean, LLM_MODE, deadline=deadline,
+                                            guard=stream_guard_for(raw_to_process)).strip()
 
         if processed and not is_llm_output_safe(raw_to_process, processed):
+            metrics.GUARD_REJECTIONS.labels(LLM_MODE).inc()
+            metrics.FALLBACKS.labels(LLM_MODE, "guard").inc()
             print("🧯 guard rejected output -> keep raw")
             processed = raw_to_process
 
     if not processed:
         processed = raw_to_process
 
+    return processed
+
+
+# =========================
+# 5b. 后台 commit：worker 只算结果，主线程原子替换
+# =========================
+# 事件循环只负责切 region / 贴字 / 替换，等 LLM 的时间里 preview 照常上屏
+doc = commit_worker.DocumentRegions()
+journal = commit_journal.CommitJournal() if JOURNAL_COMMITS else None
+# commit 完成是一个事件：worker 线程把替换动作投递回事件循环
+worker = commit_worker.CommitWorker(
+    doc, postprocess, on_done=lambda: runtime.post(apply_finished_regions),
+    prepare=lambda region: two_pass.pick_text(region.second_pass, region.raw),
+    journal=journal,
+)
+# 有 commit 在跑时不 prefill：别跟它抢 runner
+prefiller = kv_prefill.Prefiller(prefill_commit_prompt, busy=lambda: doc.pending) if PREFILL_DURING_SPEECH else None
+
+
+def replace_text(chars_to_delete: int, text: str):
     delete_chars(chars_to_delete)
-    paste_text(processed)
+    paste_text(text)
+
+
+def apply_finished_regions():
+    """队首已完成的 region 一次性替换上屏（后面的原文原样重贴）"""
+    taken = doc.take_finished()
+    if not taken:
+        return
+    chars_to_delete, replacement, n_done = taken
 
-    with state_lock:
-        preview_raw_text = ""
-        preview_len = 0
-        last_commit_time = time.time()
-        committing = False
+    # 和 preview 粘贴走同一个 IO executor，上屏顺序不会乱
+    runtime.run_io(replace_text, chars_to_delete, replacement)
 
-    print("✅ commit done\n")
+    print(f"✅ commit done ({n_done} region, pending={doc.pending})\n")
+
+
+def commit_endpoint():
+    """
+    静音端点的 commit：只由 finalize_stream 在尾字 flush 之后调，
+    partial 不会在尾字回来之前抢先把 preview 切走
+    """
+    global last_commit_time
+
+    if not doc.preview_len:
+        return
+
+    now = async_runtime.clock()
+    gap_left = MIN_COMMIT_GAP - (now - last_commit_time)
+    if gap_left > 0:
+        # 尾字已经在 preview 里了，到点直接切；又开始说话时这个定时器会被 on_voice 换掉
+        runtime.set_timer("silence", gap_left, commit_endpoint)
+        return
+
+    region = doc.cut()
+    if prefiller is not None:
+        prefiller.reset()
+    if rescorer is not None:
+        region.second_pass = rescorer.submit_segment()
+    if recorder is not None:
+        recorder.mark(region.raw)
+    metrics.COMMITS.labels("silence").inc()
+    print("\n🧠 commit trigger -> post-process...")
+    worker.submit(region)
+    last_commit_time = now
 
 
 # =========================
-# 6. 启动麦克风 & 主线程输出
+# 5c. 配置热更新：阈值/模式/模型立即生效，流式参数只清 ASR cache
+# =========================
+def reset_asr_cache():
+    cache.clear()
+
+
+def apply_config(changes: dict):
+    """在事件循环里执行（watcher 线程通过 runtime.post 投递过来）"""
+    global chunk_stride
+
+    live_config.apply_to(globals(), changes)
+
+    if "ollama_model_tiers" in changes:
+        MODEL_POLICY.set_tiers(OLLAMA_MODEL_TIERS)
+
+    if live_config.STREAMING_KEYS & changes.keys():
+        chunk_stride = chunk_size[1] * 960
+        rtf_monitor.reset(live_config.snapshot(globals()))
+        stream_diff.reset()
+        # 放进 ASR executor 排队，保证不会和正在跑的 generate 抢 cache
+        runtime.run_asr(reset_asr_cache)
+
+    print(f"🔧 config applied: {changes}")
+
+
+# =========================
+# 6. 启动麦克风 & 事件循环
 # =========================
 print("🎙 请把光标放在任意输入框（微信 / 记事本 / 浏览器都行）")
 print("👉 preview 实时出字，停顿后 commit 会用结构化+美化替换（带安全闸门）")
-print(f"👉 模式：{LLM_MODE} | 静音阈值：{SILENCE_TIMEOUT}s | 模型：{OLLAMA_MODEL}")
+print(f"👉 模式：{LLM_MODE} | 静音阈值：{SILENCE_TIMEOUT}s | 模型：{'/'.join(OLLAMA_MODEL_TIERS)}")
 
 
-with sd.InputStream(
-    samplerate=sample_rate,
-    channels=1,
-    dtype="float32",
-    blocksize=1024,
-    callback=record_callback,
-):
-    try:
-        while True:
-            while not text_queue.empty():
-                new_text = text_queue.get()
+async def main():
+    runtime.start()
+    worker.start()
+
+    if METRICS_ENABLED:
+        metrics.QUEUE_DEPTH.labels("audio").set_function(runtime.audio_queue.qsize)
+        metrics.QUEUE_DEPTH.labels("commit").set_function(worker.queue.qsize)
+        metrics.QUEUE_DEPTH.labels("regions").set_function(lambda: doc.pending)
+        metrics.serve()
 
-                paste_text(new_text)
+    watcher = live_config.ConfigWatcher(
+        live_config.snapshot(globals()),
+        on_change=lambda changes: runtime.post(apply_config, changes),
+    )
+    watcher.start()
 
-                with state_lock:
-                    preview_raw_text += new_text
-                    preview_len += len(new_text)
+    with capture.open():
+        await asr_loop()
 
-            try_commit_if_needed()
-            sd.sleep(20)
 
-    except KeyboardInterrupt:
-        print("\n🛑 stopped")
\ No newline at end of file
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print("\n🛑 stopped")
+finally:
+    if recorder is not None:
+        recorder.close()
+    if journal is not None:
+        journal.close()
@@ -1,47 +1,87 @@
-import sounddevice as sd
 import numpy as np
 import pyautogui
 import pyperclip
-import requests
-from funasr import AutoModel
-from queue import Queue, Empty
+import asyncio
 import time
-import threading
 import re
-import json
 from difflib import SequenceMatcher
 
+import async_runtime
+import audio_capture
+import chunk_tuner
+import commit_journal
+import commit_worker
+import cpu_budget
+import kv_prefill
+import live_config
+import metrics
+import session_recorder
+import stream_guard
+import llm_policy
+import talkie_daemon
+import transcript
+import textproc
+import two_pass
+
 # =========================
 # 参数区（你后面调参就调这里）
 # =========================
+# 也可以写在 talkie.toml 里（见 talkie.example.toml），运行中改文件会热更新
 SILENCE_TIMEOUT = 0.6          # 静音超过多少秒 -> commit
 ENERGY_THRESHOLD = 0.008       # 静音能量阈值（不同麦克风要调，偏小更敏感）
 MIN_COMMIT_GAP = 0.8           # 两次 commit 最小间隔（防抖）
 
+# 句子流水线：边说边把已完成的句子交给后台 worker（False = 只在静音后整体 commit）
+PIPELINE_COMMITS = True
+SENTENCE_PAUSE = 0.3           # 句间短停顿（秒），小于 SILENCE_TIMEOUT
+SENTENCE_MIN_CHARS = 8         # 太短的片段不单独切句
+
+# 规则快速通道：简单列表/短句直接用规则排版，不走 LLM
+FAST_PATH_ENABLED = True
+FAST_PATH_MIN_CONFIDENCE = 0.75
+FAST_PATH_SHORT_CHARS = 20     # 不超过这个长度、无结构的短句直接清理上屏
+FAST_PATH_MAX_ITEM_CHARS = 60  # 单条要点太长说明需要 LLM 重排
+
+# 多个 Ollama 实例时写成列表，按在途请求数负载均衡（见 ollama_client.BackendPool）
 OLLAMA_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "qwen3:1.7b"
+# 模型分级（便宜 → 贵），每次 commit 由 llm_policy 按输入长度/模式/实测速度选档
+OLLAMA_MODEL_TIERS = ["qwen3:0.6b", "qwen3:1.7b"]
 
 LLM_MODE = "smart_markdown"    # "clean" / "markdown" / "smart_markdown"
 
+# 两遍识别：离线 paraformer 在后台重识别整段音频，结果替换流式文本再送 LLM
+# （打开后可以把 chunk_size 调小，比如 [0, 5, 5]，preview 更快）
+TWO_PASS_ENABLED = False
+TWO_PASS_DEVICE = "cpu"
+
+# 会话录音：16k 音频写进 mmap 环形文件（默认 1 小时），每次 commit 打一个标记，
+# 出问题时用 python -m session_recorder list / export 把那段话导出来复现
+RECORD_SESSION = False
+
+# commit 日志：每次 commit 的原文 / 预清洗 / 模型 / 输出 / guard 分数追加写进 journal/（二进制，
+# 批量 fsync），崩溃或 LLM 改坏时用 python -m commit_journal list / show / export 找回原文
+JOURNAL_COMMITS = True
+
+# Prometheus 指标端点（http://127.0.0.1:9464/metrics，端口可用 TALKIE_METRICS_PORT 改）
+METRICS_ENABLED = True
+
 # 输出安全闸门阈值（更适配“结构重排”）
 SAFE_SIM_HIGH = 0.70
 SAFE_SIM_LOW  = 0.52
 SAFE_NGRAM_COV = 0.48
 SAFE_LEN_RATIO_MIN = 0.55
 SAFE_LEN_RATIO_MAX = 1.60
+SAFE_REORDER_RATIO_MAX = 3.0   # 结构重排：输出最多是原文的几倍长
 
-# 粘贴节奏
-pyautogui.PAUSE = 0.005
+# 流式 guard：生成过程中就按上面的阈值检查，注定过不了的输出提前断开、直接走 fallback
+STREAM_GUARD = True
 
+# 说话过程中就把 commit 要发的 prompt 送去 prompt eval（见 kv_prefill.py），
+# 静音后只剩最后几个字和生成；Ollama 在别的机器上、按 token 计费之类的场景可以关掉
+PREFILL_DURING_SPEECH = True
 
-# =========================
-# 工具：diff 新增文本
-# =========================
-def diff_new_part(prev: str, curr: str) -> str:
-    i = 0
-    while i < len(prev) and i < len(curr) and prev[i] == curr[i]:
-        i += 1
-    return curr[i:]
+# 粘贴节奏
+pyautogui.PAUSE = 0.005
 
 
 # =========================
@@ -70,118 +110,102 @@ def delete_chars(n: int):
 
 
 # =========================
-# Step1：工程预清洗（结构化前掰开粘连）
+# Step1：工程预清洗（结构化前掰开粘连）-> textproc.preprocess_before_llm
 # =========================
-_ORD_PATTERN = r'(第[一二三四五六七八九十]+个\s*[:：])'
 
-def split_ordered_items(text: str) -> str:
-    """把 '第一个：xx第二个：yy' 拆成多行（仅拆结构，不新增内容）"""
-    if not text:
-        return text
-    if text.count("第") < 2:
-        return text
-    if not (("第二个" in text) or ("第三个" in text) or ("第四个" in text)):
-        return text
-    if not re.search(_ORD_PATTERN, text):
-        return text
-
-    parts = re.split(_ORD_PATTERN, text)
-    if len(parts) <= 1:
-        return text
 
-    lines = []
-    current = ""
-    for part in parts:
-        if re.match(_ORD_PATTERN, part):
-            if current.strip():
-                lines.append(current.strip())
-            current = part
-        else:
-            current += part
+# =========================
+# Step1.5：规则快速通道（列表 + 去口语 + 标点清理，不调 LLM）
+# =========================
+# 只删“纯口头禅”，不碰可能有实义的词（比如“那个文件”里的“那个”）
+_FILLER_PATTERN = re.compile(r"[嗯呃额]+|你知道吧|你知道吗|就是说|然后呢")
+_REPEAT_FILLER_PATTERN = re.compile(r"(这个|那个|就是|然后)(?:\s*\1)+")
+_ORD_ITEM_PATTERN = re.compile(r"^第([一二三四五六七八九十0-9]+)[点个][：:，,、]?\s*")
+_LIST_HINT_PATTERN = re.compile(r"第[一二三四五六七八九十0-9]+[点个]|首先|其次|最后")
+_CN_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
 
-    if current.strip():
-        lines.append(current.strip())
 
-    return "\n".join(lines)
+def _ordinal_value(s: str) -> int:
+    """'三' -> 3，'十二' -> 12，'7' -> 7；无法识别返回 0"""
+    if s.isdigit():
+        return int(s)
+    if s == "十":
+        return 10
+    if s.startswith("十"):
+        return 10 + _CN_DIGITS.get(s[1:], 0)
+    if s.endswith("十"):
+        return _CN_DIGITS.get(s[:-1], 0) * 10
+    if "十" in s:
+        tens, ones = s.split("十", 1)
+        return _CN_DIGITS.get(tens, 0) * 10 + _CN_DIGITS.get(ones, 0)
+    return _CN_DIGITS.get(s, 0)
 
-def add_soft_breaks(text: str) -> str:
-    """只做"更利于结构化"的轻度换行，不新增信息"""
-    if not text:
-        return ""
-    t = text
-    
-    # 优先处理"第X点"模式（包括"第一点"、"第二点"、"第三点"等）
-    # 匹配"第[一二三四五六七八九十]+点"或"第[0-9]+点"
-    t = re.sub(r"([，。！？,\.\!\?\s]*)(第[一二三四五六七八九十0-9]+点)", r"\1\n\2", t)
-    
-    # 常见结构连接词/序号词前换行，帮助 LLM 感知"分点"
-    keywords = [
-        "首先", "其次", "然后", "另外", "最后",
-        "第一", "第二", "第三", "第四", "第五",
-    ]
-    for w in keywords:
-        # 情况1：句号/分号之后
-        t = re.sub(rf"(。|；|;)\s*({w})", r"\1\n\2", t)
-        # 情况2：行首或空格之后（但避免重复换行）
-        t = re.sub(rf"(^|\s+)({w})", r"\1\n\2", t)
-    
-    # 清理多余的连续换行
-    t = re.sub(r"\n{3,}", "\n\n", t)
+
+def clean_punctuation(text: str) -> str:
+    t = re.sub(r"([，。！？；、,\.!\?;])\1+", r"\1", text)
+    t = re.sub(r"^[，。；、,\.;\s]+", "", t)
+    t = re.sub(r"[，、,;；\s]+$", "", t)
     return t
 
-def preprocess_before_llm(raw_text: str) -> str:
+
+def fast_format(raw_text: str):
+    """
+    规则排版：返回 (text, confidence)
+
+    复用 split_ordered_items / add_soft_breaks 找结构，只做确定性的事：
+    序号列表 -> '- ' 列表、删口头禅、清理标点。confidence 低就交给 LLM。
+    """
     t = (raw_text or "").strip()
     if not t:
-        return ""
+        return "", 0.0
+
+    t = _REPEAT_FILLER_PATTERN.sub(r"\1", t)
+    t = _FILLER_PATTERN.sub("", t)
+    t = textproc.preprocess_before_llm(t)
+
+    intro = ""
+    items = []
+    for line in t.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        m = _ORD_ITEM_PATTERN.match(line)
+        if m:
+            items.append([_ordinal_value(m.group(1)), line])
+        elif items:
+            items[-1][1] += line
+        else:
+            intro += line
 
-    # 只做基本的空白规范化，保持原始格式（换行、列表等）
-    t = re.sub(r"[ \t]+", " ", t)
-    # 语气词处理已改为通过LLM提示词完成
-    t = split_ordered_items(t)
-    t = add_soft_breaks(t)
+    # 无结构：只有短句才敢直接上屏
+    if not items:
+        out = clean_punctuation(intro)
+        if len(out) <= FAST_PATH_SHORT_CHARS and not _LIST_HINT_PATTERN.search(out):
+            return out, 0.8
+        return out, 0.3
 
-    # 你之前的处理保留
-    t = t.replace("。-", "。\n-")
+    lines = []
+    if intro:
+        lines.append(clean_punctuation(intro))
+    lines.extend("- " + clean_punctuation(text) for _, text in items)
+    out = "\n".join(lines)
 
-    # 统一换行
-    t = t.replace("\r\n", "\n").replace("\r", "\n")
-    t = re.sub(r"\n{3,}", "\n\n", t)
-    return t.strip()
+    conf = 0.9
+    numbers = [n for n, _ in items]
+    if len(items) < 2:
+        conf -= 0.3
+    if numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        conf -= 0.3   # 序号跳号/乱序，可能是识别错，交给 LLM
+    if any(len(text) > FAST_PATH_MAX_ITEM_CHARS for _, text in items):
+        conf -= 0.3
+    if len(intro) > FAST_PATH_MAX_ITEM_CHARS:
+        conf -= 0.2
+    return out, max(conf, 0.0)
 
 
 # =========================
 # 输出安全闸门：更适配结构重排
 # =========================
-def normalize_for_guard(t: str) -> str:
-    t = (t or "").replace("\r", "\n")
-    # 轻度去 markdown
-    t = re.sub(r"[#*`>\-]", "", t)
-    # 去空白
-    t = re.sub(r"\s+", "", t)
-    return t
-
-def build_ngrams(text: str, n: int = 3) -> set:
-    text = normalize_for_guard(text)
-    if len(text) < n:
-        return set()
-    return {text[i:i+n] for i in range(len(text) - n + 1)}
-
-def ngram_coverage(source: str, target: str, n: int = 3) -> float:
-    src = build_ngrams(source, n)
-    if not src:
-        return 0.0
-    tgt = normalize_for_guard(target)
-    if len(tgt) < n:
-        return 0.0
-
-    hit = 0
-    total = 0
-    for i in range(len(tgt) - n + 1):
-        total += 1
-        if tgt[i:i+n] in src:
-            hit += 1
-    return hit / total if total else 0.0
-
 def is_llm_output_safe(raw_text, out_text, mode="format"):
     """
     LLM 输出安全检查
@@ -201,8 +225,9 @@ def is_llm_output_safe(raw_text, out_text, mode="format"):
     # 结构重排模式（新）
     # =========================
     if mode == "reorder":
+        commit_journal.note_guard(len_ratio=len(out_text) / max(1, len(raw_text)))
         # 1️⃣ 输出不能极端膨胀（防胡编）
-        if len(out_text) > len(raw_text) * 3:
+        if len(out_text) > len(raw_text) * SAFE_REORDER_RATIO_MAX:
             return False
 
         # 2️⃣ 不能完全脱离原文（词汇完全不重合）
@@ -221,6 +246,7 @@ def is_llm_output_safe(raw_text, out_text, mode="format"):
             return True  # 原文太短，直接放行
 
         overlap_ratio = len(raw_tokens & out_tokens) / max(1, len(out_tokens))
+        commit_journal.note_guard(overlap=overlap_ratio)
 
         # 经验阈值：30% 已经很宽松
         return overlap_ratio >= 0.3
@@ -231,15 +257,21 @@ def is_llm_output_safe(raw_text, out_text, mode="format"):
     # 👉 保留你原来的逻辑即可
     # 下面是一个“保守示例”，你可以替换成你原来的实现
     else:
-        raw_simple = strip_formatting(raw_text)
-        out_simple = strip_formatting(out_text)
+        raw_simple = textproc.strip_formatting(raw_text)
+        out_simple = textproc.strip_formatting(out_text)
 
         if not out_simple:
             return False
+        commit_journal.note_guard(len_ratio=len(out_simple) / max(1, len(raw_simple)))
 
         # 简单相似度兜底（示意）
         if len(out_simple) < len(raw_simple) * 0.3:
             return False
+        # 膨胀上限：和流式 guard 同一口径（normalize_for_guard 后的字数 = 去掉空格和 - 的字数）
+        out_n = len(out_simple) - out_simple.count(" ") - out_simple.count("-")
+        raw_n = len(raw_simple) - raw_simple.count(" ") - raw_simple.count("-")
+        if out_n > raw_n * SAFE_LEN_RATIO_MAX:
+            return False
 
         return True
 
@@ -249,74 +281,96 @@ def is_llm_output_safe(raw_text, out_text, mode="format"):
 # =========================
 # LLM：通用调用（加 stop，减少 # /think 污染）
 # =========================
-def call_ollama(prompt: str, timeout: int = 40) -> str:
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.0,
-            "top_p": 0.75,
-            "repeat_penalty": 1.15
-        },
-    }
-    resp = requests.post(OLLAMA_URL, json=payload, timeout=timeout)
-    resp.raise_for_status()
-    data = resp.json()
+# options 固定为模块常量：每次请求完全一致，runner 不会因参数变化而重载
+OLLAMA_OPTIONS = {
+    "temperature": 0.0,
+    "top_p": 0.75,
+    "repeat_penalty": 1.15
+}
+
+MODEL_POLICY = llm_policy.ModelPolicy(OLLAMA_MODEL_TIERS)
+
+def call_ollama(system: str, prompt: str, timeout: int = 40, mode: str = "clean", deadline=None,
+                stop=None, format: str = None, guard: dict = None) -> str:
+    # daemon 在就由 daemon 代发（多个前端共享模型速度统计）
+    # num_predict 由 llm_policy 按输入长度/模式给；stop / format 由调用方按输出形态给
+    # guard（stream_guard 规格）给了就边生成边检查，注定过不了终检的输出提前断开
+    try:
+        data = talkie_daemon.generate_tiered(
+            MODEL_POLICY, system, prompt, mode, deadline=deadline,
+            timeout=timeout, options=OLLAMA_OPTIONS, url=OLLAMA_URL, stop=stop, format=format, guard=guard,
+        )
+    except llm_policy.DeadlineExceeded:
+        metrics.LLM_ERRORS.labels(mode, "deadline").inc()
+        raise
+    except llm_policy.RunawayGeneration:
+        metrics.LLM_ERRORS.labels(mode, "runaway").inc()
+        raise
+    except llm_policy.GuardAbort as e:
+        metrics.LLM_ERRORS.labels(mode, "guard").inc()
+        print(f"🧯 stream guard: {e}")
+        raise
+    except Exception:
+        metrics.LLM_ERRORS.labels(mode, "error").inc()
+        raise
+    commit_journal.note(mode=mode, model=data.get("model", ""))
     return (data.get("response") or "").strip()
 
 
 # =========================
 # 传统后处理（clean/markdown）
 # =========================
-def build_prompt_edit(raw_text: str, mode: str) -> str:
-    base_rules = (
-        "你是一个【文本后处理器】，只做编辑，不做解释。\n"
-        "只允许修改原文表达，不允许补充、推测、解释。\n\n"
-        "编辑规则：\n"
-        "1. 删除口语填充词、语气词、重复词（如：嗯、呃、啊、那个、这个、然后、其实、就是、你知道、就是说）。\n"
-        "2. 修正明显错别字和病句，使表达更通顺。\n"
-        "3. 不新增任何信息，不推测、不补充、不评论。\n"
-        "4. 必须保持原文的格式结构：保留所有换行、列表符号（-、1.等）、段落分隔。\n"
-        "5. 如果原文有列表结构（有序或无序），必须保持列表格式，不要合并成一段。\n"
-        "6. 只输出最终结果，不要输出编辑说明。\n"
-        "7. 禁止输出：#、/think、<think>、解释性段落。\n"
-    )
+# 固定指令（system 前缀）：必须是常量，逐字节稳定才能命中 KV 缓存
+_EDIT_BASE_RULES = (
+    "你是一个【文本后处理器】，只做编辑，不做解释。\n"
+    "只允许修改原文表达，不允许补充、推测、解释。\n\n"
+    "编辑规则：\n"
+    "1. 删除口语填充词、语气词、重复词（如：嗯、呃、啊、那个、这个、然后、其实、就是、你知道、就是说）。\n"
+    "2. 修正明显错别字和病句，使表达更通顺。\n"
+    "3. 不新增任何信息，不推测、不补充、不评论。\n"
+    "4. 必须保持原文的格式结构：保留所有换行、列表符号（-、1.等）、段落分隔。\n"
+    "5. 如果原文有列表结构（有序或无序），必须保持列表格式，不要合并成一段。\n"
+    "6. 只输出最终结果，不要输出编辑说明。\n"
+    "7. 禁止输出：#、/think、<think>、解释性段落。\n"
+)
 
-    if mode == "clean":
-        # 关键修复：必须保持格式化，不要合并成一段，强制识别列表结构
-        fmt = (
-            "输出要求：\n"
-            "- 输出为通顺中文。\n"
-            "- 如果原文包含'第一点'、'第二点'、'第三点'、'首先'、'其次'、'最后'等列表标识词，必须格式化为列表，每项单独一行。\n"
-            "- 列表格式：使用 '- ' 或 '1. ' 开头，每一点独立一行。\n"
-            "- 必须保留原文的所有换行和段落分隔。\n"
-            "- 如果原文有列表结构（有序或无序），必须保持列表格式，不要合并成一段。\n"
-            "- 绝对不要将所有内容合并成一段连续文本。\n"
-            "- 不要写标题，不要写解释。\n"
-        )
-    else:
-        fmt = (
-            "输出要求：\n"
-            "- 如果原文包含'第一点'、'第二点'、'第三点'、'首先'、'其次'、'最后'等列表标识词，必须格式化为列表，每项单独一行。\n"
-            "- 列表格式：使用 '- ' 或 '1. ' 开头，每一点独立一行。\n"
-            "- 即使原文只有'第X点'（如'第三点是可以做这个'），也要格式化为列表项（如 '- 第三点是可以做这个'）。\n"
-            "- 如果原文本本身是列点结构，必须使用列表符号（- 或 1.），每项单独一行。\n"
-            "- 必须保留或恢复所有合理的换行和段落分隔。\n"
-            "- 绝对不要将所有内容合并成一段连续文本。\n"
-            "- 不要输出说明性词语，不要解释。\n"
-            "- 不要使用 # 作为标题。\n"
-        )
+# 关键修复：必须保持格式化，不要合并成一段，强制识别列表结构
+SYSTEM_EDIT_CLEAN = _EDIT_BASE_RULES + (
+    "输出要求：\n"
+    "- 输出为通顺中文。\n"
+    "- 如果原文包含'第一点'、'第二点'、'第三点'、'首先'、'其次'、'最后'等列表标识词，必须格式化为列表，每项单独一行。\n"
+    "- 列表格式：使用 '- ' 或 '1. ' 开头，每一点独立一行。\n"
+    "- 必须保留原文的所有换行和段落分隔。\n"
+    "- 如果原文有列表结构（有序或无序），必须保持列表格式，不要合并成一段。\n"
+    "- 绝对不要将所有内容合并成一段连续文本。\n"
+    "- 不要写标题，不要写解释。\n"
+)
 
-    return base_rules + fmt + "\n原始文本如下：\n" + (raw_text or "").strip()
+SYSTEM_EDIT_MARKDOWN = _EDIT_BASE_RULES + (
+    "输出要求：\n"
+    "- 如果原文包含'第一点'、'第二点'、'第三点'、'首先'、'其次'、'最后'等列表标识词，必须格式化为列表，每项单独一行。\n"
+    "- 列表格式：使用 '- ' 或 '1. ' 开头，每一点独立一行。\n"
+    "- 即使原文只有'第X点'（如'第三点是可以做这个'），也要格式化为列表项（如 '- 第三点是可以做这个'）。\n"
+    "- 如果原文本本身是列点结构，必须使用列表符号（- 或 1.），每项单独一行。\n"
+    "- 必须保留或恢复所有合理的换行和段落分隔。\n"
+    "- 绝对不要将所有内容合并成一段连续文本。\n"
+    "- 不要输出说明性词语，不要解释。\n"
+    "- 不要使用 # 作为标题。\n"
+)
+
+def build_prompt_edit(raw_text: str, mode: str):
+    """返回 (system, prompt)：system 固定，prompt 只含本次原文"""
+    system = SYSTEM_EDIT_CLEAN if mode == "clean" else SYSTEM_EDIT_MARKDOWN
+    return system, "原始文本如下：\n" + (raw_text or "").strip()
 
-def call_ollama_postprocess(raw_text: str, mode: str) -> str:
+def call_ollama_postprocess(raw_text: str, mode: str, deadline=None, guard: dict = None) -> str:
     raw_text = (raw_text or "").strip()
     if not raw_text:
         return ""
-    prompt = build_prompt_edit(raw_text, mode)
+    system, prompt = build_prompt_edit(raw_text, mode)
     try:
-        text = call_ollama(prompt, timeout=40)
+        text = call_ollama(system, prompt, timeout=40, mode=mode, deadline=deadline,
+                           stop=textproc.STOP_AFTER_ANSWER, guard=guard)
         return text if text else raw_text
     except Exception as e:
         print("⚠️ Ollama call failed:", repr(e))
@@ -324,252 +378,59 @@ def call_ollama_postprocess(raw_text: str, mode: str) -> str:
 
 
 # =========================
-# Step2：结构化理解（LLM 输出 JSON）
+# Step2：结构重排（prompt / 解析都在 textproc.py）
 # =========================
+def smart_struct_then_render(raw_text: str, deadline=None, guard: dict = None) -> str:
+    return textproc.smart_struct_then_render(raw_text, call_ollama, deadline=deadline, guard=guard)
 
-def build_prompt_reorder(raw_text: str) -> str:
-    return (
-        "你是一个【文本结构重排器】，不是总结器、不是解释器。\n"
-        "目标：把口语化、零散的表达，重排为逻辑清晰的结构化文本。\n\n"
-
-        "只允许做的事情：\n"
-        "- 删除口语填充词（如：嗯、呃、啊、那个、然后、其实、就是）\n"
-        "- 合并重复意思\n"
-        "- 拆分长句\n"
-        "- 调整顺序，让表达更清晰\n\n"
-
-        "禁止：\n"
-        "- 新增事实\n"
-        "- 推测原文未提及的内容\n"
-        "- 总结、升华、评价\n\n"
-
-        "输出格式要求（必须遵守）：\n"
-        "- 使用 Markdown\n"
-        "- 一级结构使用无序列表 `-`\n"
-        "- 子结构使用缩进两格的 `-`\n"
-        "- 不要使用标题符号 `#`\n"
-        "- 不要输出任何解释性文字\n\n"
-
-        "示例格式：\n"
-        "- 要点一\n"
-        "  - 子要点\n"
-        "- 要点二\n\n"
 
-        "原始文本：\n"
-        + (raw_text or "").strip()
-    )
-def build_prompt_struct(raw_text: str) -> str:
-    return (
-        "你是一个【结构重排器】，不是解释器、不是总结器。\n"
-        "只做：删除口语填充词、拆分、换行、分组。禁止：推测、解释、补全。\n\n"
-        "硬性约束：\n"
-        "1) 只输出一个 JSON 对象，除此之外不要输出任何字符。\n"
-        "2) 不新增事实，不推测，不补充未提及信息。\n"
-        "3) 删除口语填充词/语气词/口头禅（如：嗯、呃、啊、那个、这个、然后、其实、就是、你知道、就是说）。\n"
-        "4) 每条要点尽量短，一句话一个要点。\n"
-        "5) 必须保持结构化输出：如果原文有列表结构，必须在JSON中正确分组为bullets和sub。\n"
-        "6) 最多两层：bullets + sub。\n"
-        "7) 禁止输出：#、/think、<think>、解释性句子。\n\n"
-        "JSON 结构必须严格为：\n"
-        "{\"title\":\"\",\"bullets\":[{\"text\":\"\",\"sub\":[{\"text\":\"\"}]}]}\n\n"
-        "原始文本：\n"
-        + (raw_text or "").strip()
-    )
-
-def strip_formatting(text: str) -> str:
+def stream_guard_for(raw_clean: str, mode: str):
     """
-    仅用于 guard 比对：去掉排版符号、把换行当空格
-    """
-    if not text:
-        return ""
-    t = text
-    t = re.sub(r"^\s*-\s*", "", t, flags=re.MULTILINE)
-    t = re.sub(r"[#*`>]", "", t)
-    t = re.sub(r"\n+", " ", t)
-    t = re.sub(r"\s+", " ", t)
-    return t.strip()
-
-def clean_json_string(json_str: str) -> str:
-    """清理和修复常见的 JSON 格式问题"""
-    if not json_str:
-        return ""
-    
-    # 移除 markdown 代码块标记
-    json_str = re.sub(r"^```(?:json)?\s*", "", json_str, flags=re.MULTILINE)
-    json_str = re.sub(r"```\s*$", "", json_str, flags=re.MULTILINE)
-    
-    # 移除前后的非 JSON 字符（保留可能的空白）
-    json_str = json_str.strip()
-    
-    # 尝试修复常见的 JSON 错误
-    # 1. 修复键名中的单引号为双引号（使用更精确的正则）
-    # 匹配 'key': 或 'key' : 这种模式
-    json_str = re.sub(r"'([^']+)'\s*:", r'"\1":', json_str)
-    
-    # 2. 移除尾随逗号（在 } 或 ] 前，但要小心字符串中的逗号）
-    # 使用负向前瞻确保不在字符串内
-    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-    
-    # 3. 移除可能的注释（虽然 JSON 标准不支持）
-    json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
-    json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
-    
-    return json_str.strip()
-
-def extract_first_json(text: str) -> str:
-    if not text:
-        return ""
-    start = text.find("{")
-    if start < 0:
-        return ""
-    depth = 0
-    for i in range(start, len(text)):
-        ch = text[i]
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                extracted = text[start:i+1].strip()
-                # 清理提取的 JSON
-                return clean_json_string(extracted)
-    return ""
-
-def parse_outline(json_text: str):
-    if not json_text:
-        return None
-    
-    # 先尝试直接解析
-    try:
-        obj = json.loads(json_text)
-    except json.JSONDecodeError as e:
-        # 如果失败，尝试清理后再解析
-        cleaned = clean_json_string(json_text)
-        try:
-            obj = json.loads(cleaned)
-        except json.JSONDecodeError:
-            # 如果还是失败，打印调试信息
-            print(f"[debug] JSON parse failed at position {e.pos}: {e.msg}")
-            print(f"[debug] JSON preview: {repr(json_text[:200])}")
-            print(f"[debug] Error context: {repr(json_text[max(0, e.pos-20):e.pos+20])}")
-            return None
-    
-    if not isinstance(obj, dict):
-        return None
-
-    title = obj.get("title", "")
-    bullets = obj.get("bullets", [])
-
-    if not isinstance(title, str):
-        title = ""
-    if not isinstance(bullets, list):
-        return None
+    和 is_llm_output_safe 终检对应的流式 guard 规格（STREAM_GUARD 关掉时返回 None）
 
-    cleaned = []
-    for b in bullets:
-        if not isinstance(b, dict):
-            continue
-        text = b.get("text", "")
-        if not isinstance(text, str):
-            continue
-
-        # 保持LLM输出的原始格式，不再进行工程级清洗
-        text = text.strip()
-        if not text:
-            continue
-
-        sub_list = b.get("sub", [])
-        sub_clean = []
-        if isinstance(sub_list, list):
-            for s in sub_list:
-                st = s.get("text", "") if isinstance(s, dict) else s
-                if isinstance(st, str):
-                    st = st.strip()
-                    if st:
-                        sub_clean.append({"text": st})
-
-        cleaned.append({"text": text, "sub": sub_clean})
-
-    if not cleaned:
+    只有长度上限，按终检换算，超过就一定过不了（终检两种模式都不看覆盖率，流式里也不判）。
+    """
+    if not STREAM_GUARD or len(raw_clean) < stream_guard.MIN_SOURCE_CHARS:
         return None
+    if mode == "reorder":
+        # 终检看渲染后的 markdown（只留列表行）长度 <= 原文 × SAFE_REORDER_RATIO_MAX
+        return {"max_chars": len(raw_clean) * SAFE_REORDER_RATIO_MAX, "list_only": True}
+    return {"max_chars": len(textproc.normalize_for_guard(raw_clean)) * SAFE_LEN_RATIO_MAX}
 
-    cleaned = cleaned[:8]
-    for b in cleaned:
-        b["sub"] = b["sub"][:8]
-
-    # 保持LLM输出的原始格式，不再进行工程级清洗
-    return {"title": title.strip(), "bullets": cleaned}
-
-def outline_to_markdown(outline: dict) -> str:
-    lines = []
-    title = (outline.get("title") or "").strip()
-    if title:
-        lines.append(f"**{title}**")
-
-    for b in outline.get("bullets", []):
-        lines.append(f"- {b['text']}")
-        for s in b.get("sub", []):
-            lines.append(f"  - {s['text']}")
-
-    return "\n".join(lines).strip()
-
-def normalize_markdown(text: str) -> str:
-    lines = []
-    for line in text.splitlines():
-        line = line.rstrip()
-
-        # 丢掉明显的废话
-        if not line:
-            continue
-        if line.startswith(("解释", "说明", "注意")):
-            continue
-
-        # 只保留 markdown 列表行
-        if line.lstrip().startswith("-"):
-            lines.append(line)
-
-    return "\n".join(lines)
-
-def smart_struct_then_render(raw_text: str) -> str:
-    raw_text = (raw_text or "").strip()
-    if not raw_text:
-        return ""
-
-    pre = preprocess_before_llm(raw_text)
-
-    try:
-        prompt = build_prompt_reorder(pre)  # 注意：不再是 build_prompt_struct
-        resp = call_ollama(prompt, timeout=50)
-
-        md = normalize_markdown(resp)
 
-        if not md.strip():
-            print("[debug] struct_reorder: empty markdown output")
-            return ""
+def prefill_commit_prompt(raw: str):
+    """
+    按 postprocess 第一次 LLM 调用的方式拼 prompt，只做 prompt eval（kv_prefill 线程里调）
 
-        result = md.strip()
-        if result:
-            print("[debug] smart_struct: success, output preview:", repr(result[:200]))
-        else:
-            print("[debug] smart_struct: markdown conversion returned empty")
-        return result
-    except json.JSONDecodeError as e:
-        # JSON 解析错误已经在 parse_outline 中处理了，这里只是兜底
-        print(f"⚠️ smart_struct: JSON decode error at position {e.pos}: {e.msg}")
-        return ""
-    except Exception as e:
-        print("⚠️ smart_struct_then_render failed:", repr(e))
-        import traceback
-        traceback.print_exc()
-        return ""
+    system / prompt / 选档位都要和 commit 时一致，前缀才能命中；会走快速通道的就不发。
+    """
+    if FAST_PATH_ENABLED:
+        fast, conf = fast_format(raw)
+        if fast and conf >= FAST_PATH_MIN_CONFIDENCE:
+            return None
+    raw_clean = textproc.preprocess_before_llm(raw)
+    if LLM_MODE == "smart_markdown":
+        # smart_struct_then_render 里还会再 preprocess 一遍
+        system, prompt = textproc.build_prompt_reorder(textproc.preprocess_before_llm(raw_clean))
+        mode = "reorder"
+    else:
+        system, prompt = build_prompt_edit(raw_clean, LLM_MODE)
+        mode = LLM_MODE
+    return talkie_daemon.prefill(MODEL_POLICY, system, prompt, mode, deadline=llm_policy.deadline_for(raw_clean),
+                                 options=OLLAMA_OPTIONS, url=OLLAMA_URL)
 
 
 # =========================
 # 1. 初始化 ASR 模型
 # =========================
-model = AutoModel(
+# talkie_daemon 在跑就直接连上去（毫秒级），否则本地加载
+ASR_DEVICE = "mps"
+# 纯 CPU 时给流式 ASR 留专用核、其余给 LLM（按主机配置见 cpu_budget.py），要在加载模型之前
+budget = cpu_budget.load(ASR_DEVICE)
+cpu_budget.apply(budget)
+model = talkie_daemon.load_asr_model(
     model="paraformer-zh-streaming",
-    device="mps"
+    device=ASR_DEVICE
 )
 
 # =========================
@@ -579,91 +440,189 @@ sample_rate = 16000
 chunk_size = [0, 10, 5]
 encoder_chunk_look_back = 4
 decoder_chunk_look_back = 1
+# 本机标定过（python -m chunk_tuner）就用标定结果；talkie.toml 里写了的仍然优先
+live_config.apply_to(globals(), chunk_tuner.load_profile(ASR_DEVICE))
 chunk_stride = chunk_size[1] * 960
 
 cache = {}
 audio_buffer = np.zeros((0,), dtype=np.float32)
-last_text = ""
+# 流式结果的增量（记住稳定前缀，不再每次从头逐字比较，见 transcript.py）
+stream_diff = transcript.StreamDiff()
 
-text_queue = Queue()
+# 每个 chunk 的解码耗时 -> RTF；跟不上实时就降档，等下一个端点（cache 本来就要清）再切
+rtf_monitor = chunk_tuner.RTFMonitor(live_config.snapshot(globals()))
+pending_profile = None
 
 # =========================
 # 3. 运行时状态（preview + commit）
 # =========================
-state_lock = threading.Lock()
+# preview / 待替换 region 都由 commit_worker.DocumentRegions 管理（见第 5 节）
+# 时间一律用单调时钟（async_runtime.clock）
+runtime = async_runtime.Runtime(
+    asr_initializer=None if budget is None else lambda: cpu_budget.init_asr_thread(budget)
+)
+# 按麦克风原生采样率/声道采集，回调只投递原始 block（见 audio_capture.py）
+capture = audio_capture.AudioCapture(runtime.feed_audio)
+rescorer = two_pass.TwoPassRescorer(device=TWO_PASS_DEVICE) if TWO_PASS_ENABLED else None
+recorder = session_recorder.SessionRecorder() if RECORD_SESSION else None
 
-preview_raw_text = ""
-preview_len = 0
-last_voice_time = time.time()
 last_commit_time = 0.0
-committing = False
+endpoint_pending = False       # 端点（停顿/静音）的尾字 flush 还没回来：这期间不切 region
 
 
 # =========================
-# 4. 音频回调（只负责 ASR + 能量检测 + 推送增量）
+# 4. ASR 任务（音频回调只投递，推理在 ASR executor 里）
 # =========================
-def record_callback(indata, frames, time_info, status):
-    global audio_buffer, last_text, last_voice_time
-
-    audio_mono = indata[:, 0].astype(np.float32)
-    rms = float(np.sqrt(np.mean(audio_mono * audio_mono)) + 1e-12)
-    if rms > ENERGY_THRESHOLD:
-        last_voice_time = time.time()
-
-    audio_buffer = np.concatenate([audio_buffer, audio_mono])
+def asr_step(chunk):
+    return model.generate(
+        input=chunk,
+        cache=cache,
+        is_final=False,
+        chunk_size=chunk_size,
+        encoder_chunk_look_back=encoder_chunk_look_back,
+        decoder_chunk_look_back=decoder_chunk_look_back,
+    )
 
-    while len(audio_buffer) >= chunk_stride:
-        chunk = audio_buffer[:chunk_stride]
-        audio_buffer = audio_buffer[chunk_stride:]
 
-        res = model.generate(
-            input=chunk,
+def asr_final_step(tail_audio):
+    """端点：is_final=True 把 lookahead 里卡住的尾字吐出来，然后清 cache 开始新流"""
+    try:
+        return model.generate(
+            input=tail_audio,
             cache=cache,
-            is_final=False,
+            is_final=True,
             chunk_size=chunk_size,
             encoder_chunk_look_back=encoder_chunk_look_back,
             decoder_chunk_look_back=decoder_chunk_look_back,
         )
+    finally:
+        # cache 只活一句话：长时间会话内存和每 chunk 开销都不会涨
+        cache.clear()
 
-        # 修复点：这里不要 return（会中断本轮后续 chunk 处理），改 continue
-        if not res or not res[0].get("text"):
-            continue
 
-        text = res[0]["text"]
-        new_part = diff_new_part(last_text, text)
+async def finalize_stream(reason: str = "silence"):
+    """端点：先 flush 尾字，再把整段 preview（含尾字）作为一个 region commit"""
+    global audio_buffer, pending_profile, endpoint_pending
 
-        if new_part and new_part.strip():
-            text_queue.put(new_part)
+    tail_audio = audio_buffer
+    audio_buffer = np.zeros((0,), dtype=np.float32)
 
-        last_text = text
+    # ASR executor 是单线程，排在所有已提交的 chunk 之后执行
+    res = await runtime.run_asr(asr_final_step, tail_audio)
 
+    if res and res[0].get("text"):
+        tail = stream_diff.update(res[0]["text"])
+        if tail.strip():
+            print("🔚 endpoint tail:", repr(tail))
+            on_partial(tail)
+    stream_diff.reset()
 
-# =========================
-# 5. Commit：静音后触发 LLM → 安全闸门 → 替换 preview
-# =========================
-def try_commit_if_needed():
-    global preview_raw_text, preview_len, last_commit_time, committing
+    if pending_profile is not None:
+        apply_config(pending_profile)
+        pending_profile = None
 
-    now = time.time()
+    endpoint_pending = False
+    commit_endpoint(reason)
 
-    with state_lock:
-        if committing:
-            return
-        if preview_len <= 0:
-            return
-        if now - last_voice_time < SILENCE_TIMEOUT:
-            return
-        if now - last_commit_time < MIN_COMMIT_GAP:
-            return
 
-        committing = True
-        raw_to_process = preview_raw_text
-        chars_to_delete = preview_len
+def start_endpoint(reason: str):
+    """停顿/静音端点只走 finalize_stream：region 一定在尾字 flush 之后才切"""
+    global endpoint_pending
+    if endpoint_pending:
+        return
+    endpoint_pending = True
+    asyncio.ensure_future(finalize_stream(reason))
+
+
+def on_silence():
+    start_endpoint("silence")
+
+
+def on_pause():
+    """句间短停顿：已经够一句话就提前当端点处理，不够就等静音"""
+    if doc.preview_visible >= SENTENCE_MIN_CHARS:
+        start_endpoint("pause")
+
+
+def on_voice():
+    """有声音：重置“停顿/静音”定时器"""
+    runtime.set_timer("silence", SILENCE_TIMEOUT, on_silence)
+    if PIPELINE_COMMITS:
+        runtime.set_timer("pause", SENTENCE_PAUSE, on_pause)
+
+
+def on_partial(new_part: str):
+    runtime.run_io(paste_text, new_part)
+    doc.append_preview(new_part)
+    try_commit_if_needed()
+    if prefiller is not None:
+        prefiller.offer(doc.preview_len, lambda: doc.preview)
+
+
+async def asr_loop():
+    global audio_buffer, pending_profile
+
+    while True:
+        # 降混 + 重采样到 16k：在事件循环里做，不占音频回调线程
+        audio_mono = capture.convert(await runtime.audio_queue.get())
+        if recorder is not None:
+            recorder.write(audio_mono)
+
+        rms = float(np.sqrt(np.mean(audio_mono * audio_mono)) + 1e-12)
+        if rms > ENERGY_THRESHOLD:
+            on_voice()
+
+        if rescorer is not None:
+            rescorer.feed(audio_mono, idle=not doc.preview_len and rms <= ENERGY_THRESHOLD)
+
+        audio_buffer = np.concatenate([audio_buffer, audio_mono])
+
+        while len(audio_buffer) >= chunk_stride:
+            chunk = audio_buffer[:chunk_stride]
+            audio_buffer = audio_buffer[chunk_stride:]
+
+            t0 = async_runtime.clock()
+            res = await runtime.run_asr(asr_step, chunk)
+            step_down = rtf_monitor.observe(async_runtime.clock() - t0)
+            if step_down is not None:
+                pending_profile = step_down
 
-    print("\n🧠 commit trigger -> post-process...")
+            # 修复点：这里不要 return（会中断本轮后续 chunk 处理），改 continue
+            if not res or not res[0].get("text"):
+                continue
+
+            text = res[0]["text"]
+            new_part = stream_diff.update(text)
+
+            if new_part and new_part.strip():
+                on_partial(new_part)
+
+
+# =========================
+# 5. Commit：静音后触发 LLM → 安全闸门 → 替换 preview
+# =========================
+def postprocess(raw_to_process: str) -> str:
+    """预清洗 → LLM → 安全闸门 → 兜底，返回最终要上屏的文本"""
+    # 0️⃣ 规则快速通道：置信度够就直接返回，不等 Ollama
+    if FAST_PATH_ENABLED:
+        t0 = time.perf_counter()
+        fast, conf = fast_format(raw_to_process)
+        cost_ms = (time.perf_counter() - t0) * 1000
+        if fast and conf >= FAST_PATH_MIN_CONFIDENCE:
+            metrics.FAST_PATH.labels("hit").inc()
+            commit_journal.note(mode="fast")
+            commit_journal.note_guard(confidence=conf)
+            print(f"[path] fast conf={conf:.2f} cost={cost_ms:.2f}ms")
+            return fast
+        metrics.FAST_PATH.labels("miss").inc()
+        print(f"[path] llm conf={conf:.2f}")
 
     # 1️⃣ 工程预清洗（只做安全、确定性的事）
-    raw_clean = preprocess_before_llm(raw_to_process)
+    raw_clean = textproc.preprocess_before_llm(raw_to_process)
+    commit_journal.note(preprocessed=raw_clean, mode=LLM_MODE)
+
+    # 本次 commit 的延迟 deadline：过了就不再等 LLM，直接用 raw_clean
+    deadline = llm_policy.deadline_for(raw_clean)
 
     processed = ""
 
@@ -671,7 +630,8 @@ def try_commit_if_needed():
     # 2️⃣ 结构重排主路径（smart_markdown）
     # ===============================
     if LLM_MODE == "smart_markdown":
-        processed = smart_struct_then_render(raw_clean)
+        processed = smart_struct_then_render(raw_clean, deadline=deadline,
+                                             guard=stream_guard_for(raw_clean, "reorder"))
 
         if processed:
             # ⚠️ 注意：结构重排模式下，只做“底线 guard”
@@ -680,29 +640,43 @@ def try_commit_if_needed():
                 processed,
                 mode="reorder"   # 👈 关键：告诉 guard 这是重排
             ):
+                metrics.GUARD_REJECTIONS.labels("reorder").inc()
                 print("🧯 guard rejected reordered output -> fallback")
                 processed = ""
 
         # ===============================
         # 3️⃣ fallback：markdown → clean
         # ===============================
+        if not processed and llm_policy.expired(deadline):
+            metrics.FALLBACKS.labels(LLM_MODE, "deadline").inc()
+            print("⏱ commit deadline passed -> raw_clean")
+            processed = raw_clean
+
         if not processed:
+            metrics.FALLBACKS.labels(LLM_MODE, "markdown").inc()
             print("[debug] smart_struct empty/rejected, trying markdown mode...")
-            processed = call_ollama_postprocess(raw_clean, mode="markdown").strip()
+            processed = call_ollama_postprocess(raw_clean, mode="markdown", deadline=deadline).strip()
 
             # markdown 也失败（没结构）
             if not processed or not any(c in processed for c in ['\n', '-', '*', '1.', '2.', '3.']):
-                print("[debug] markdown mode weak, trying clean mode...")
-                processed = call_ollama_postprocess(raw_clean, mode="clean").strip()
+                if llm_policy.expired(deadline):
+                    print("⏱ commit deadline passed -> keep markdown result")
+                else:
+                    metrics.FALLBACKS.labels(LLM_MODE, "clean").inc()
+                    print("[debug] markdown mode weak, trying clean mode...")
+                    processed = call_ollama_postprocess(raw_clean, mode="clean", deadline=deadline).strip()
 
     # ===============================
     # 4️⃣ 非 smart_markdown 模式（旧模式）
     # ===============================
     else:
-        processed = call_ollama_postprocess(raw_clean, LLM_MODE).strip()
+        processed = call_ollama_postprocess(raw_clean, LLM_MODE, deadline=deadline,
+                                            guard=stream_guard_for(raw_clean, "format")).strip()
 
         if processed:
             if not is_llm_output_safe(raw_clean, processed, mode="format"):
+                metrics.GUARD_REJECTIONS.labels(LLM_MODE).inc()
+                metrics.FALLBACKS.labels(LLM_MODE, "guard").inc()
                 print("🧯 guard rejected output -> keep raw_clean")
                 processed = raw_clean
 
@@ -721,55 +695,151 @@ def try_commit_if_needed():
     except Exception:
         pass
 
-    # ===============================
-    # 7️⃣ 提交到“文档”
-    # ===============================
+    return processed
+
+
+# =========================
+# 5b. 后台 commit：worker 只算结果，主线程原子替换
+# =========================
+# 事件循环只做“切 region / 贴字 / 替换”，LLM 再慢也不会卡住 preview。
+# PIPELINE_COMMITS=True 时说话过程中遇到句子边界就先切出去，
+# 否则只在静音 SILENCE_TIMEOUT 后整体切出。
+doc = commit_worker.DocumentRegions()
+journal = commit_journal.CommitJournal() if JOURNAL_COMMITS else None
+# commit 完成是一个事件：worker 线程把替换动作投递回事件循环
+worker = commit_worker.CommitWorker(
+    doc, postprocess, on_done=lambda: runtime.post(apply_finished_regions),
+    prepare=lambda region: two_pass.pick_text(region.second_pass, region.raw),
+    journal=journal,
+)
+# 有 commit 在跑时不 prefill：别跟它抢 runner
+prefiller = kv_prefill.Prefiller(prefill_commit_prompt, busy=lambda: doc.pending) if PREFILL_DURING_SPEECH else None
+
+def submit_region(n: int = None, reason: str = "commit"):
+    """把 preview 前 n 个字符（默认全部）移交给后台 worker"""
+    region = doc.cut(n)
+    if prefiller is not None:
+        prefiller.reset()
+
+    if rescorer is not None:
+        # 只有停顿/静音处的切点音频边界可信，句中切句不做第二遍
+        if reason == "sentence":
+            rescorer.drop_segment()
+        else:
+            region.second_pass = rescorer.submit_segment()
+    if recorder is not None:
+        recorder.mark(region.raw, reason=reason)
+
+    metrics.COMMITS.labels(reason).inc()
+    print(f"\n🧠 {reason} trigger -> post-process: {region.raw!r}")
+    worker.submit(region)
+
+
+def replace_text(chars_to_delete: int, text: str):
     delete_chars(chars_to_delete)
-    paste_text(processed)
+    paste_text(text)
+
+
+def apply_finished_regions():
+    """队首已完成的 region 一次性替换上屏（后面的原文原样重贴）"""
+    taken = doc.take_finished()
+    if not taken:
+        return
+    chars_to_delete, replacement, n_done = taken
 
-    with state_lock:
-        preview_raw_text = ""
-        preview_len = 0
-        last_commit_time = time.time()
-        committing = False
+    # 和 preview 粘贴走同一个 IO executor，上屏顺序不会乱
+    runtime.run_io(replace_text, chars_to_delete, replacement)
 
-    print("✅ commit done\n")
+    print(f"✅ commit done ({n_done} region, pending={doc.pending})\n")
+
+
+def try_commit_if_needed():
+    """新 partial 触发：说话过程中遇到句子边界就先切出去（端点的 commit 见 commit_endpoint）"""
+    if not PIPELINE_COMMITS or endpoint_pending or not doc.preview_len:
+        return
+    # 句末标点 / 新序号开头的位置在 append 时增量维护，这里不再扫整段 preview
+    cut = doc.sentence_cut(SENTENCE_MIN_CHARS)
+    if cut:
+        submit_region(cut, "sentence")
+
+
+def commit_endpoint(reason: str = "silence"):
+    """端点的尾字已经 flush 进 preview：整段切成一个 region（由 finalize_stream 调）"""
+    global last_commit_time
+
+    if not doc.preview_len:
+        return
+    now = async_runtime.clock()
+    if reason == "silence":
+        gap_left = MIN_COMMIT_GAP - (now - last_commit_time)
+        if gap_left > 0:
+            # 尾字已经在 preview 里了，到点直接切，不用再 flush；又开始说话时这个定时器会被 on_voice 换掉
+            runtime.set_timer("silence", gap_left, commit_endpoint)
+            return
+        last_commit_time = now
+    submit_region(None, reason)
 
-# 这是一个本地部署的ai语音
 
 # =========================
-# 6. 启动麦克风 & 主线程输出
+# 5c. 配置热更新：阈值/模式/模型立即生效，流式参数只清 ASR cache
+# =========================
+def reset_asr_cache():
+    cache.clear()
+
+
+def apply_config(changes: dict):
+    """在事件循环里执行（watcher 线程通过 runtime.post 投递过来）"""
+    global chunk_stride
+
+    live_config.apply_to(globals(), changes)
+
+    if "ollama_model_tiers" in changes:
+        MODEL_POLICY.set_tiers(OLLAMA_MODEL_TIERS)
+
+    if live_config.STREAMING_KEYS & changes.keys():
+        chunk_stride = chunk_size[1] * 960
+        rtf_monitor.reset(live_config.snapshot(globals()))
+        stream_diff.reset()
+        # 放进 ASR executor 排队，保证不会和正在跑的 generate 抢 cache
+        runtime.run_asr(reset_asr_cache)
+
+    print(f"🔧 config applied: {changes}")
+
+
+# =========================
+# 6. 启动麦克风 & 事件循环
 # =========================
 print("🎙 请把光标放在任意输入框（微信 / 记事本 / 浏览器都行）")
 print("👉 preview 实时出字，停顿后 commit 会用结构化+美化替换（带安全闸门）")
-print(f"👉 模式：{LLM_MODE} | 静音阈值：{SILENCE_TIMEOUT}s | 模型：{OLLAMA_MODEL}")
-
-with sd.InputStream(
-    samplerate=sample_rate,
-    channels=1,
-    dtype="float32",
-    blocksize=1024,
-    callback=record_callback,
-):
-    try:
-        while True:
-            # 更稳的 queue 读取方式
-            while True:
-                try:
-                    new_text = text_queue.get_nowait()
-                except Empty:
-                    break
+print(f"👉 模式：{LLM_MODE} | 静音阈值：{SILENCE_TIMEOUT}s | 模型：{'/'.join(OLLAMA_MODEL_TIERS)}")
+
 
-                paste_text(new_text)
+async def main():
+    runtime.start()
+    worker.start()
 
-                with state_lock:
-                    preview_raw_text += new_text
-                    preview_len += len(new_text)
+    if METRICS_ENABLED:
+        metrics.QUEUE_DEPTH.labels("audio").set_function(runtime.audio_queue.qsize)
+        metrics.QUEUE_DEPTH.labels("commit").set_function(worker.queue.qsize)
+        metrics.QUEUE_DEPTH.labels("regions").set_function(lambda: doc.pending)
+        metrics.serve()
+
+    watcher = live_config.ConfigWatcher(
+        live_config.snapshot(globals()),
+        on_change=lambda changes: runtime.post(apply_config, changes),
+    )
+    watcher.start()
 
-            try_commit_if_needed()
-            sd.sleep(20)
+    with capture.open():
+        await asr_loop()
 
-    except KeyboardInterrupt:
-        print("\n🛑 stopped")
 
-# 
\ No newline at end of file
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print("\n🛑 stopped")
+finally:
+    if recorder is not None:
+        recorder.close()
+    if journal is not None:
+        journal.close()